@@ -5,6 +5,19 @@ from hdx.utilities.loader import load_and_merge_yaml
 from hdx.utilities.path import script_dir_plus_file
 from hdx.utilities.typehint import ListTuple
 
+PROJECT_CONFIGS = (
+    "conflict_event.yaml",
+    "core.yaml",
+    "food_security.yaml",
+    "funding.yaml",
+    "national_risk.yaml",
+    "operational_presence.yaml",
+    "population.yaml",
+    "poverty_rate.yaml",
+    "refugees.yaml",
+    "wfp.yaml",
+)
+
 
 def load_yamls(config_files: ListTuple[str]) -> Dict:
     input_files = [
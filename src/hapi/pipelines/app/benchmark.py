@@ -0,0 +1,389 @@
+"""Benchmark the uploaders by replaying the test fixtures.
+
+For each theme, the scrapers are run against the saved fixtures and the
+reference data is loaded into a new SQLite database, then the theme is output
+and each uploader's populate timed in isolation. The reference uploaders
+(Locations, Admins, Org etc.) are benchmarked in the same way under the
+reference benchmark. Each benchmark is repeated and the fastest repetition
+kept. One more repetition is made with tracemalloc tracing to record the peak
+memory of each uploader (tracing slows Python down so it is not timed).
+
+With a scale, the fixtures and the Runner results are scaled up by a
+multiplier using synthetic data (see utilities/synthetic.py) to find how the
+uploaders behave as the data grows.
+
+The results can be saved as a baseline and later results compared against
+it, failing if rows per second drop or peak memory grows by more than a
+tolerance. Timings depend on the machine so baselines should be recorded on
+the machine that will be compared against them:
+
+    python -m hapi.pipelines.app.benchmark -s -b benchmark_baseline.json
+    python -m hapi.pipelines.app.benchmark -b benchmark_baseline.json
+"""
+
+import argparse
+import json
+import logging
+import sys
+import tracemalloc
+from datetime import datetime
+from os.path import join
+from typing import Callable, Dict, List, Optional
+
+from hapi_schema.views import prepare_hapi_views
+from hdx.api.configuration import Configuration
+from hdx.database import Database
+from hdx.scraper.runner import Runner
+from hdx.scraper.utilities.reader import Read
+from hdx.utilities.dateparse import parse_date
+from hdx.utilities.easy_logging import setup_logging
+from hdx.utilities.path import temp_dir
+from hdx.utilities.useragent import UserAgent
+
+from hapi.pipelines.app.compiled_config import load_config
+from hapi.pipelines.app.pipelines import Pipelines
+from hapi.pipelines.utilities.instrumentation import Stage, instrumentation
+from hapi.pipelines.utilities.synthetic import scale_fixtures, scale_results
+
+logger = logging.getLogger(__name__)
+
+# Themes and countries covered by the test fixtures
+BENCHMARK_THEMES = {
+    "population": ("AFG", "BFA", "MLI", "NGA", "TCD"),
+    "operational_presence": ("AFG", "MLI", "NGA"),
+    "food_security": None,
+    "humanitarian_needs": None,
+    "national_risk": None,
+    "refugees": None,
+    "funding": ("AFG", "BFA", "UKR"),
+    "food_prices": None,
+    "conflict_event": ("BFA", "GTM"),
+    "poverty_rate": ("AFG", "BFA"),
+}
+# Date on which the test fixtures were saved
+FIXTURES_TODAY = "2023-10-11"
+
+
+def _time_uploaders(name: str, output_fn: Callable) -> List[Stage]:
+    stage_name = f"benchmark.{name}"
+    start = len(instrumentation.stages)
+    with instrumentation.stage(stage_name):
+        output_fn()
+    return [
+        stage
+        for stage in instrumentation.stages[start:]
+        if stage.parent == stage_name
+    ]
+
+
+def _scale_runner_results(runner: Runner, multiplier: int) -> None:
+    get_hapi_results = runner.get_hapi_results
+
+    def get_scaled_hapi_results(*args, **kwargs):
+        return scale_results(get_hapi_results(*args, **kwargs), multiplier)
+
+    runner.get_hapi_results = get_scaled_hapi_results
+
+
+def _run_once(
+    configuration: Configuration,
+    name: str,
+    themes_to_run: Dict,
+    fixtures_folder: str,
+    folder: str,
+    today: datetime,
+    trace_memory: bool,
+    multiplier: int,
+) -> List[Stage]:
+    with temp_dir(f"benchmark_{name}") as temp_folder:
+        with Database(
+            dialect="sqlite",
+            database=join(temp_folder, "benchmark.db"),
+            recreate_schema=True,
+            prepare_fn=prepare_hapi_views,
+        ) as database:
+            Read.create_readers(
+                temp_folder,
+                fixtures_folder,
+                temp_folder,
+                False,
+                True,
+                today=today,
+            )
+            pipelines = Pipelines(
+                configuration,
+                database.get_session(),
+                today,
+                themes_to_run=themes_to_run,
+                use_live=False,
+                reference_folder=join(folder, "reference"),
+            )
+            if name == "reference":
+                output_fn = pipelines.output_reference
+            else:
+                pipelines.run()
+                pipelines.output_reference()
+                if multiplier > 1:
+                    _scale_runner_results(pipelines.runner, multiplier)
+                output_fn = getattr(pipelines, f"output_{name}")
+            if trace_memory:
+                tracemalloc.start()
+            try:
+                return _time_uploaders(name, output_fn)
+            finally:
+                if trace_memory:
+                    tracemalloc.stop()
+
+
+def benchmark(
+    configuration: Configuration,
+    name: str,
+    fixtures_folder: str,
+    folder: str,
+    themes: Optional[Dict] = None,
+    repeat: int = 3,
+    trace_memory: bool = True,
+    today: Optional[datetime] = None,
+    multiplier: int = 1,
+) -> Dict[str, Dict]:
+    """Benchmark the uploaders of a theme or of the reference data.
+
+    Args:
+        configuration (Configuration): HDX configuration
+        name (str): Theme or reference
+        fixtures_folder (str): Folder of saved data to replay
+        folder (str): Folder in which to keep reference data between repetitions
+        themes (Optional[Dict]): Themes and countries to run. Defaults to None (BENCHMARK_THEMES).
+        repeat (int): Number of timed repetitions. Defaults to 3.
+        trace_memory (bool): Whether to record peak memory. Defaults to True.
+        today (Optional[datetime]): Value to use for today. Defaults to None (FIXTURES_TODAY).
+        multiplier (int): Multiplier by which to scale up Runner results. Defaults to 1.
+
+    Returns:
+        Dict[str, Dict]: Uploader -> rows, seconds, rows per second, peak memory
+    """
+    if themes is None:
+        themes = BENCHMARK_THEMES
+    if today is None:
+        today = parse_date(FIXTURES_TODAY)
+    if name == "reference":
+        themes_to_run = themes
+    else:
+        themes_to_run = {name: themes[name]}
+    results = {}
+    for repetition in range(repeat + trace_memory):
+        traced = repetition == repeat
+        stages = _run_once(
+            configuration,
+            name,
+            themes_to_run,
+            fixtures_folder,
+            folder,
+            today,
+            traced,
+            multiplier,
+        )
+        for stage in stages:
+            result = results.get(stage.name)
+            if result is None:
+                result = {
+                    "rows_read": 0,
+                    "rows_written": 0,
+                    "seconds": None,
+                    "peak_memory": 0,
+                }
+                results[stage.name] = result
+            if traced:
+                result["peak_memory"] = stage.peak_traced
+                continue
+            seconds = result["seconds"]
+            if seconds is None or stage.wall_time < seconds:
+                result["seconds"] = stage.wall_time
+                result["rows_read"] = stage.counts["rows_read"]
+                result["rows_written"] = stage.counts["rows_written"]
+    for uploader, result in results.items():
+        seconds = result["seconds"] or 0.0
+        result["seconds"] = round(seconds, 6)
+        if seconds:
+            rows_per_second = result["rows_written"] / seconds
+        else:
+            rows_per_second = 0.0
+        result["rows_per_second"] = round(rows_per_second, 1)
+        logger.info(
+            f"{name} {uploader}: {result['rows_written']} rows in "
+            f"{seconds:.3f}s ({rows_per_second:.0f} rows/s), peak memory "
+            f"{result['peak_memory'] / 1024**2:.1f} MB"
+        )
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, Dict]],
+    baseline: Dict[str, Dict[str, Dict]],
+    tolerance: float = 0.25,
+    min_seconds: float = 0.05,
+) -> List[str]:
+    """Compare benchmark results with a baseline. Rows per second (or
+    seconds for uploaders that write no rows) must not be worse than the
+    baseline by more than the tolerance, ignoring uploaders taking less than
+    min_seconds in both which are too noisy to compare. Peak memory must not
+    exceed the baseline by more than the tolerance.
+
+    Args:
+        results (Dict[str, Dict[str, Dict]]): Benchmark -> uploader -> result
+        baseline (Dict[str, Dict[str, Dict]]): Benchmark -> uploader -> result
+        tolerance (float): Fraction by which results may be worse. Defaults to 0.25.
+        min_seconds (float): Minimum seconds to compare timings. Defaults to 0.05.
+
+    Returns:
+        List[str]: Regressions
+    """
+    regressions = []
+    for name, uploaders in results.items():
+        for uploader, result in uploaders.items():
+            expected = baseline.get(name, {}).get(uploader)
+            if not expected:
+                continue
+            prefix = f"{name} {uploader}"
+            if max(result["seconds"], expected["seconds"]) >= min_seconds:
+                if expected["rows_per_second"]:
+                    minimum = expected["rows_per_second"] * (1 - tolerance)
+                    if result["rows_per_second"] < minimum:
+                        regressions.append(
+                            f"{prefix}: {result['rows_per_second']:.0f} "
+                            f"rows/s vs {expected['rows_per_second']:.0f} "
+                            f"in baseline"
+                        )
+                elif result["seconds"] > expected["seconds"] * (1 + tolerance):
+                    regressions.append(
+                        f"{prefix}: {result['seconds']:.3f}s vs "
+                        f"{expected['seconds']:.3f}s in baseline"
+                    )
+            maximum = expected["peak_memory"] * (1 + tolerance)
+            if expected["peak_memory"] and result["peak_memory"] > maximum:
+                regressions.append(
+                    f"{prefix}: peak memory {result['peak_memory']} bytes vs "
+                    f"{expected['peak_memory']} in baseline"
+                )
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark HAPI pipelines uploaders"
+    )
+    parser.add_argument(
+        "-bm",
+        "--benchmarks",
+        default=None,
+        help="Comma separated themes and/or reference to benchmark",
+    )
+    parser.add_argument(
+        "-fx",
+        "--fixtures",
+        default=join("tests", "fixtures", "input"),
+        help="Folder of saved data to replay",
+    )
+    parser.add_argument(
+        "-sc",
+        "--scale",
+        type=int,
+        default=1,
+        help="Multiplier by which to scale up the fixtures",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of timed repetitions of each benchmark",
+    )
+    parser.add_argument(
+        "-nm",
+        "--no-memory",
+        default=False,
+        action="store_true",
+        help="Don't record peak memory",
+    )
+    parser.add_argument(
+        "-b", "--baseline", default=None, help="Path of baseline JSON"
+    )
+    parser.add_argument(
+        "-s",
+        "--save-baseline",
+        default=False,
+        action="store_true",
+        help="Save results as baseline instead of comparing with it",
+    )
+    parser.add_argument(
+        "-tl",
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Fraction by which results may be worse than baseline",
+    )
+    parser.add_argument(
+        "-o", "--output", default=None, help="Path of results JSON"
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    setup_logging(console_log_level="INFO")
+    UserAgent.set_global("hapi-pipelines-benchmark")
+    Configuration._create(
+        hdx_read_only=True,
+        hdx_site="prod",
+        project_config_dict=load_config(),
+    )
+    configuration = Configuration.read()
+    if args.benchmarks:
+        names = args.benchmarks.split(",")
+    else:
+        names = ["reference"] + list(BENCHMARK_THEMES)
+    results = {}
+    failed = []
+    with temp_dir("benchmark") as folder:
+        fixtures_folder = args.fixtures
+        if args.scale > 1:
+            fixtures_folder = join(folder, "fixtures")
+            scale_fixtures(args.fixtures, fixtures_folder, args.scale)
+        for name in names:
+            try:
+                results[name] = benchmark(
+                    configuration,
+                    name,
+                    fixtures_folder,
+                    folder,
+                    repeat=args.repeat,
+                    trace_memory=not args.no_memory,
+                    multiplier=args.scale,
+                )
+            except Exception:
+                logger.exception(f"Benchmark {name} failed!")
+                failed.append(name)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if failed:
+        sys.exit(1)
+    if not args.baseline:
+        return
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        logger.info(f"Saved baseline to {args.baseline}")
+        return
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        logger.error(f"Regression in {regression}")
+    if regressions:
+        sys.exit(1)
+    logger.info("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Compiled configuration.
+
+Loading and merging the project YAML files and applying scraper defaults to
+them takes a noticeable part of start up. The resulting configuration is
+therefore compiled into a pickle file named after a hash of the contents of
+the YAML files (and of the code and package versions that load them and
+apply the defaults). It is loaded from there when the hash matches and
+rebuilt automatically when any of them change. It is kept in a user cache
+folder rather than in the package which may be read only. The compiled
+configuration can be built ahead of time eg. in the Docker image with:
+
+    python -m hapi.pipelines.app.compiled_config
+"""
+
+import argparse
+import logging
+import pickle
+from glob import glob
+from hashlib import sha256
+from importlib.metadata import version
+from os import getenv, makedirs, remove, replace
+from os.path import basename, dirname, exists, expanduser, join
+from tempfile import NamedTemporaryFile
+from typing import Dict, Optional
+
+from hdx.utilities.path import script_dir_plus_file
+from hdx.utilities.typehint import ListTuple
+
+from hapi.pipelines.app import PROJECT_CONFIGS, load_yamls
+from hapi.pipelines.utilities import process_config_defaults
+from hapi.pipelines.utilities.process_config_defaults import add_defaults
+
+logger = logging.getLogger(__name__)
+
+# Increment when the structure of the compiled configuration changes
+COMPILED_CONFIG_VERSION = 1
+# Packages that load the YAML files
+CONFIG_PACKAGES = ("hdx-python-utilities", "ruamel.yaml")
+
+
+def get_default_folder() -> str:
+    """Get folder for compiled configuration from the environment variable
+    CONFIG_CACHE_DIR, defaulting to hapi-pipelines/compiled_config in the
+    user cache folder (XDG_CACHE_HOME or ~/.cache).
+
+    Returns:
+        str: Folder for compiled configuration
+    """
+    folder = getenv("CONFIG_CACHE_DIR")
+    if folder:
+        return folder
+    cache_folder = getenv("XDG_CACHE_HOME") or expanduser(join("~", ".cache"))
+    return join(cache_folder, "hapi-pipelines", "compiled_config")
+
+
+def get_config_hash(config_files: ListTuple[str]) -> str:
+    """Get hash of the contents of the YAML files, of the code that
+    applies the defaults and of the versions of the packages that load the
+    YAML files.
+
+    Args:
+        config_files (ListTuple[str]): YAML files in configs folder
+
+    Returns:
+        str: Hash of configuration inputs
+    """
+    config_hash = sha256(str(COMPILED_CONFIG_VERSION).encode("utf-8"))
+    for package in CONFIG_PACKAGES:
+        config_hash.update(f"{package}=={version(package)}".encode("utf-8"))
+    paths = [
+        script_dir_plus_file(join("..", "configs", file), load_yamls)
+        for file in config_files
+    ]
+    paths.append(process_config_defaults.__file__)
+    for path in paths:
+        config_hash.update(basename(path).encode("utf-8"))
+        with open(path, "rb") as file:
+            config_hash.update(file.read())
+    return config_hash.hexdigest()[:16]
+
+
+def _get_path(config_files: ListTuple[str], folder: str) -> str:
+    return join(folder, f"config-{get_config_hash(config_files)}.pickle")
+
+
+def _save(config: Dict, path: str) -> None:
+    folder = dirname(path)
+    makedirs(folder, exist_ok=True)
+    with NamedTemporaryFile(dir=folder, suffix=".part", delete=False) as file:
+        pickle.dump(config, file, protocol=pickle.HIGHEST_PROTOCOL)
+    replace(file.name, path)
+    for other_path in glob(join(folder, "config-*.pickle")):
+        if other_path != path:
+            remove(other_path)
+
+
+def compile_config(
+    config_files: ListTuple[str] = PROJECT_CONFIGS,
+    folder: Optional[str] = None,
+) -> str:
+    """Load the YAML files, apply defaults and save the result as compiled
+    configuration, deleting compiled configuration for other inputs.
+
+    Args:
+        config_files (ListTuple[str]): YAML files in configs folder. Defaults to PROJECT_CONFIGS.
+        folder (Optional[str]): Folder for compiled configuration. Defaults to None (get_default_folder()).
+
+    Returns:
+        str: Path of compiled configuration
+    """
+    path = _get_path(config_files, folder or get_default_folder())
+    _save(add_defaults(load_yamls(config_files)), path)
+    return path
+
+
+def load_config(
+    config_files: ListTuple[str] = PROJECT_CONFIGS,
+    folder: Optional[str] = None,
+) -> Dict:
+    """Get the project configuration with defaults applied, from compiled
+    configuration if it matches the YAML files, otherwise from the YAML
+    files, compiling them for next time. If compiled configuration can't be
+    saved (eg. folder is read only), the configuration is still returned.
+
+    Args:
+        config_files (ListTuple[str]): YAML files in configs folder. Defaults to PROJECT_CONFIGS.
+        folder (Optional[str]): Folder for compiled configuration. Defaults to None (get_default_folder()).
+
+    Returns:
+        Dict: Project configuration
+    """
+    path = _get_path(config_files, folder or get_default_folder())
+    if exists(path):
+        try:
+            with open(path, "rb") as file:
+                return pickle.load(file)
+        except Exception:
+            logger.exception(f"Reading {path} failed!")
+    config = add_defaults(load_yamls(config_files))
+    try:
+        _save(config, path)
+        logger.info(f"Compiled configuration to {path}")
+    except OSError:
+        logger.warning(f"Could not save compiled configuration to {path}")
+    return config
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compile HAPI pipelines configuration"
+    )
+    parser.add_argument(
+        "-f",
+        "--folder",
+        default=None,
+        help="Folder for compiled configuration",
+    )
+    args = parser.parse_args()
+    path = compile_config(folder=args.folder)
+    print(f"Compiled configuration to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,32 @@
 import logging
-from datetime import datetime
-from typing import Dict, Optional
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Dict, List, Optional, Set
 
+from hapi_schema.db_conflict_event import DBConflictEvent
+from hapi_schema.db_food_price import DBFoodPrice
+from hapi_schema.db_food_security import DBFoodSecurity
+from hapi_schema.db_funding import DBFunding
+from hapi_schema.db_humanitarian_needs import DBHumanitarianNeeds
+from hapi_schema.db_national_risk import DBNationalRisk
+from hapi_schema.db_operational_presence import DBOperationalPresence
+from hapi_schema.db_population import DBPopulation
+from hapi_schema.db_poverty_rate import DBPovertyRate
+from hapi_schema.db_refugees import DBRefugees
 from hdx.api.configuration import Configuration
-from hdx.location.adminlevel import AdminLevel
 from hdx.scraper.runner import Runner
 from hdx.scraper.utilities.sources import Sources
 from hdx.utilities.errors_onexit import ErrorsOnExit
 from hdx.utilities.typehint import ListTuple
 from sqlalchemy.orm import Session
 
+from hapi.pipelines.app.scheduler import Scheduler
+from hapi.pipelines.app.sharding import (
+    can_fork,
+    get_shards,
+    map_sharded,
+    run_sharded,
+)
 from hapi.pipelines.database.admins import Admins
 from hapi.pipelines.database.conflict_event import ConflictEvent
 from hapi.pipelines.database.currency import Currency
@@ -29,9 +46,60 @@ from hapi.pipelines.database.refugees import Refugees
 from hapi.pipelines.database.sector import Sector
 from hapi.pipelines.database.wfp_commodity import WFPCommodity
 from hapi.pipelines.database.wfp_market import WFPMarket
+from hapi.pipelines.utilities.batch_populate import (
+    batch_populate,
+    delete_stale_resources,
+    is_incremental,
+    set_sink,
+)
+from hapi.pipelines.utilities.instrumentation import instrumented
+from hapi.pipelines.utilities.reference_snapshot import get_reference_data
+from hapi.pipelines.utilities.resource_updates import ResourceUpdates
+from hapi.pipelines.utilities.sinks import CollectingSink
 
 logger = logging.getLogger(__name__)
 
+# Reference data needed by each theme in addition to locations and metadata.
+# Only the reference data needed by the themes to run is set up and loaded.
+THEME_REFERENCES = {
+    "population": ("admins",),
+    "operational_presence": ("admins", "org", "org_type", "sector"),
+    "food_security": ("admins",),
+    "humanitarian_needs": ("admins", "sector"),
+    "national_risk": (),
+    "refugees": (),
+    "funding": (),
+    "poverty_rate": ("admins",),
+    "conflict_event": ("admins",),
+    "food_prices": ("admins", "currency"),
+}
+
+# Table of each theme whose rows belong to resources
+THEME_TABLES = {
+    "population": DBPopulation,
+    "operational_presence": DBOperationalPresence,
+    "food_security": DBFoodSecurity,
+    "humanitarian_needs": DBHumanitarianNeeds,
+    "national_risk": DBNationalRisk,
+    "refugees": DBRefugees,
+    "funding": DBFunding,
+    "poverty_rate": DBPovertyRate,
+    "conflict_event": DBConflictEvent,
+    "food_prices": DBFoodPrice,
+}
+
+# Themes whose rows are made from the results of each scraper independently
+# of other scrapers, so can be transformed in worker processes
+SHARDED_THEMES = (
+    "population",
+    "food_security",
+    "national_risk",
+    "refugees",
+    "funding",
+    "poverty_rate",
+    "conflict_event",
+)
+
 
 class Pipelines:
     def __init__(
@@ -43,51 +111,85 @@ class Pipelines:
         scrapers_to_run: Optional[ListTuple[str]] = None,
         errors_on_exit: Optional[ErrorsOnExit] = None,
         use_live: bool = True,
+        theme_workers: int = 1,
+        shard_workers: int = 1,
+        reference_folder: Optional[str] = None,
     ):
         self.configuration = configuration
         self.session = session
+        self.today = today
+        self.theme_workers = theme_workers
+        if shard_workers > 1 and not can_fork():
+            logger.warning(
+                "Worker processes cannot be forked on this platform, "
+                "sharding is disabled"
+            )
+            shard_workers = 1
+        self.shard_workers = shard_workers
+        # Theme -> table name -> rows transformed by workers
+        self.transformed_rows: Dict[str, Dict[str, List[Dict]]] = {}
         self.themes_to_run = themes_to_run
+        self.resource_updates = ResourceUpdates(session)
+        self.references = self.get_references()
+        reference_data = get_reference_data(
+            configuration,
+            use_live=use_live,
+            folder=reference_folder,
+            max_age=timedelta(
+                days=configuration["reference_snapshot_max_age"]
+            ),
+            admin_levels="admins" in self.references,
+        )
         self.locations = Locations(
             configuration=configuration,
             session=session,
             use_live=use_live,
         )
         countries = configuration["HAPI_countries"]
-        libhxl_dataset = AdminLevel.get_libhxl_dataset().cache()
-        self.admins = Admins(
-            configuration, session, self.locations, libhxl_dataset
-        )
-        admin1_config = configuration["admin1"]
-        self.adminone = AdminLevel(admin_config=admin1_config, admin_level=1)
-        admin2_config = configuration["admin2"]
-        self.admintwo = AdminLevel(admin_config=admin2_config, admin_level=2)
-        self.adminone.setup_from_libhxl_dataset(libhxl_dataset, countries)
-        self.adminone.load_pcode_formats()
-        self.admintwo.setup_from_libhxl_dataset(libhxl_dataset, countries)
-        self.admintwo.load_pcode_formats()
-        self.admintwo.set_parent_admins_from_adminlevels([self.adminone])
-        logger.info("Admin one name mappings:")
-        self.adminone.output_admin_name_mappings()
-        logger.info("Admin two name mappings:")
-        self.admintwo.output_admin_name_mappings()
-        logger.info("Admin two name replacements:")
-        self.admintwo.output_admin_name_replacements()
-
-        self.org = Org(
-            session=session,
-            datasetinfo=configuration["org"],
-        )
-        self.org_type = OrgType(
-            session=session,
-            datasetinfo=configuration["org_type"],
-            org_type_map=configuration["org_type_map"],
-        )
-        self.sector = Sector(
-            session=session,
-            datasetinfo=configuration["sector"],
-            sector_map=configuration["sector_map"],
-        )
-        self.currency = Currency(configuration=configuration, session=session)
+        self.admins = None
+        self.adminone = None
+        self.admintwo = None
+        if "admins" in self.references:
+            self.admins = Admins(
+                configuration,
+                session,
+                self.locations,
+                reference_data["libhxl_dataset"],
+            )
+            self.adminone = reference_data["adminone"]
+            self.admintwo = reference_data["admintwo"]
+            logger.info("Admin one name mappings:")
+            self.adminone.output_admin_name_mappings()
+            logger.info("Admin two name mappings:")
+            self.admintwo.output_admin_name_mappings()
+            logger.info("Admin two name replacements:")
+            self.admintwo.output_admin_name_replacements()
+
+        self.org = None
+        if "org" in self.references:
+            self.org = Org(
+                session=session,
+                datasetinfo=configuration["org"],
+            )
+        self.org_type = None
+        if "org_type" in self.references:
+            self.org_type = OrgType(
+                session=session,
+                datasetinfo=configuration["org_type"],
+                org_type_map=configuration["org_type_map"],
+            )
+        self.sector = None
+        if "sector" in self.references:
+            self.sector = Sector(
+                session=session,
+                datasetinfo=configuration["sector"],
+                sector_map=configuration["sector_map"],
+            )
+        self.currency = None
+        if "currency" in self.references:
+            self.currency = Currency(
+                configuration=configuration, session=session
+            )
 
         Sources.set_default_source_date_format("%Y-%m-%d")
         self.runner = Runner(
@@ -101,27 +203,20 @@ class Pipelines:
         self.metadata = Metadata(
             runner=self.runner, session=session, today=today
         )
-        self.wfp_commodity = WFPCommodity(
-            session=session,
-            datasetinfo=configuration["wfp_commodity"],
-        )
-        self.wfp_market = WFPMarket(
-            session=session,
-            datasetinfo=configuration["wfp_market"],
-            countryiso3s=countries,
-            admins=self.admins,
-            adminone=self.adminone,
-            admintwo=self.admintwo,
-        )
-        self.food_price = FoodPrice(
-            session=session,
-            datasetinfo=configuration["wfp_countries"],
-            countryiso3s=countries,
-            metadata=self.metadata,
-            currency=self.currency,
-            commodity=self.wfp_commodity,
-            market=self.wfp_market,
-        )
+
+    def get_references(self) -> Set[str]:
+        """Get the reference data needed by the themes to run in addition to
+        locations and metadata which are always needed.
+
+        Returns:
+            Set[str]: Names of reference data eg. admins, sector
+        """
+        references = set()
+        for theme, theme_references in THEME_REFERENCES.items():
+            if self.themes_to_run and theme not in self.themes_to_run:
+                continue
+            references.update(theme_references)
+        return references
 
     def create_configurable_scrapers(self):
         def _create_configurable_scrapers(
@@ -197,39 +292,59 @@ class Pipelines:
             "conflict_event", "admintwo", adminlevel=self.admintwo
         )
 
+    @instrumented("run", whole_process=True)
     def run(self):
-        self.runner.run()
-
-    def output(self):
-        self.locations.populate()
-        self.admins.populate()
-        self.metadata.populate()
-        self.org.populate()
-        self.org_type.populate()
-        self.sector.populate()
-        self.currency.populate()
-
-        if not self.themes_to_run or "population" in self.themes_to_run:
-            results = self.runner.get_hapi_results(
-                self.configurable_scrapers["population"]
+        if is_incremental(self.session):
+            scrapers_to_run = self.resource_updates.get_changed_scrapers(
+                self.runner
+            )
+            if not scrapers_to_run:
+                logger.info("No scrapers have changed since the previous run")
+                return
+        else:
+            scrapers_to_run = None
+        if self.shard_workers > 1:
+            run_sharded(
+                self.runner,
+                scrapers_to_run or self.runner.scraper_names,
+                self.configuration["HAPI_countries"],
+                self.shard_workers,
             )
+        else:
+            self.runner.run(what_to_run=scrapers_to_run)
+
+    def get_theme_session(self) -> Session:
+        """Get a new session for a theme so that themes can write to the
+        database concurrently. It has the same bind and options as the main
+        session.
+
+        Returns:
+            Session: New session
+        """
+        return Session(
+            bind=self.session.get_bind(), info=dict(self.session.info)
+        )
+
+    def output_population(self):
+        results = self.runner.get_hapi_results(
+            self.configurable_scrapers["population"]
+        )
+        with self.get_theme_session() as session:
             population = Population(
-                session=self.session,
+                session=session,
                 metadata=self.metadata,
                 admins=self.admins,
                 results=results,
             )
             population.populate()
 
-        if (
-            not self.themes_to_run
-            or "operational_presence" in self.themes_to_run
-        ):
-            results = self.runner.get_hapi_results(
-                self.configurable_scrapers["operational_presence"]
-            )
+    def output_operational_presence(self):
+        results = self.runner.get_hapi_results(
+            self.configurable_scrapers["operational_presence"]
+        )
+        with self.get_theme_session() as session:
             operational_presence = OperationalPresence(
-                session=self.session,
+                session=session,
                 metadata=self.metadata,
                 admins=self.admins,
                 adminone=self.adminone,
@@ -242,72 +357,78 @@ class Pipelines:
             )
             operational_presence.populate()
 
-        if not self.themes_to_run or "food_security" in self.themes_to_run:
-            results = self.runner.get_hapi_results(
-                self.configurable_scrapers["food_security"]
-            )
+    def output_food_security(self):
+        results = self.runner.get_hapi_results(
+            self.configurable_scrapers["food_security"]
+        )
+        with self.get_theme_session() as session:
             food_security = FoodSecurity(
-                session=self.session,
+                session=session,
                 metadata=self.metadata,
                 admins=self.admins,
                 results=results,
             )
             food_security.populate()
 
-        if (
-            not self.themes_to_run
-            or "humanitarian_needs" in self.themes_to_run
-        ):
+    def output_humanitarian_needs(self):
+        with self.get_theme_session() as session:
             humanitarian_needs = HumanitarianNeeds(
-                session=self.session,
-                metadata=self.metadata,
+                session=session,
+                metadata=Metadata(
+                    runner=self.runner, session=session, today=self.today
+                ),
                 admins=self.admins,
                 sector=self.sector,
+                resource_updates=self.resource_updates,
             )
             humanitarian_needs.populate()
 
-        if not self.themes_to_run or "national_risk" in self.themes_to_run:
-            results = self.runner.get_hapi_results(
-                self.configurable_scrapers["national_risk"]
-            )
+    def output_national_risk(self):
+        results = self.runner.get_hapi_results(
+            self.configurable_scrapers["national_risk"]
+        )
+        with self.get_theme_session() as session:
             national_risk = NationalRisk(
-                session=self.session,
+                session=session,
                 metadata=self.metadata,
                 locations=self.locations,
                 results=results,
             )
             national_risk.populate()
 
-        if not self.themes_to_run or "refugees" in self.themes_to_run:
-            results = self.runner.get_hapi_results(
-                self.configurable_scrapers["refugees"]
-            )
+    def output_refugees(self):
+        results = self.runner.get_hapi_results(
+            self.configurable_scrapers["refugees"]
+        )
+        with self.get_theme_session() as session:
             refugees = Refugees(
-                session=self.session,
+                session=session,
                 metadata=self.metadata,
                 locations=self.locations,
                 results=results,
             )
             refugees.populate()
 
-        if not self.themes_to_run or "funding" in self.themes_to_run:
-            results = self.runner.get_hapi_results(
-                self.configurable_scrapers["funding"]
-            )
+    def output_funding(self):
+        results = self.runner.get_hapi_results(
+            self.configurable_scrapers["funding"]
+        )
+        with self.get_theme_session() as session:
             funding = Funding(
-                session=self.session,
+                session=session,
                 metadata=self.metadata,
                 locations=self.locations,
                 results=results,
             )
             funding.populate()
 
-        if not self.themes_to_run or "poverty_rate" in self.themes_to_run:
-            results = self.runner.get_hapi_results(
-                self.configurable_scrapers["poverty_rate"]
-            )
+    def output_poverty_rate(self):
+        results = self.runner.get_hapi_results(
+            self.configurable_scrapers["poverty_rate"]
+        )
+        with self.get_theme_session() as session:
             poverty_rate = PovertyRate(
-                session=self.session,
+                session=session,
                 metadata=self.metadata,
                 admins=self.admins,
                 config=self.configuration["poverty_rate_national"],
@@ -315,12 +436,13 @@ class Pipelines:
             )
             poverty_rate.populate()
 
-        if not self.themes_to_run or "conflict_event" in self.themes_to_run:
-            results = self.runner.get_hapi_results(
-                self.configurable_scrapers["conflict_event"]
-            )
+    def output_conflict_event(self):
+        results = self.runner.get_hapi_results(
+            self.configurable_scrapers["conflict_event"]
+        )
+        with self.get_theme_session() as session:
             conflict_event = ConflictEvent(
-                session=self.session,
+                session=session,
                 metadata=self.metadata,
                 admins=self.admins,
                 results=results,
@@ -328,7 +450,164 @@ class Pipelines:
             )
             conflict_event.populate()
 
-        if not self.themes_to_run or "food_prices" in self.themes_to_run:
+    def output_food_prices(self):
+        with self.get_theme_session() as session:
+            self.wfp_commodity = WFPCommodity(
+                session=session,
+                datasetinfo=self.configuration["wfp_commodity"],
+            )
+            self.wfp_market = WFPMarket(
+                session=session,
+                datasetinfo=self.configuration["wfp_market"],
+                countryiso3s=self.configuration["HAPI_countries"],
+                admins=self.admins,
+                adminone=self.adminone,
+                admintwo=self.admintwo,
+            )
+            self.food_price = FoodPrice(
+                session=session,
+                datasetinfo=self.configuration["wfp_countries"],
+                countryiso3s=self.configuration["HAPI_countries"],
+                metadata=Metadata(
+                    runner=self.runner, session=session, today=self.today
+                ),
+                currency=self.currency,
+                commodity=self.wfp_commodity,
+                market=self.wfp_market,
+                resource_updates=self.resource_updates,
+                download_workers=self.configuration["wfp_download_workers"],
+                host_concurrency=self.configuration["wfp_host_concurrency"],
+                stream=self.configuration["wfp_stream"],
+            )
             self.wfp_commodity.populate()
             self.wfp_market.populate()
             self.food_price.populate()
+
+    def output_reference(self):
+        self.locations.populate()
+        if self.admins is not None:
+            self.admins.populate()
+        self.metadata.populate()
+        for uploader in (self.org, self.org_type, self.sector, self.currency):
+            if uploader is not None:
+                uploader.populate()
+
+    def transform_shard(self, names: List[str]) -> Dict:
+        """Transform the results of the scrapers in a shard into rows
+        without writing them. Runs in a worker process forked from the main
+        one (see transform_sharded).
+
+        Args:
+            names (List[str]): Names of scrapers in shard
+
+        Returns:
+            Dict: Rows by theme and table and errors
+        """
+        # The worker must not use the connections of the main process
+        self.session.get_bind().dispose(close=False)
+        errors_on_exit = self.runner.errors_on_exit
+        no_errors = len(errors_on_exit.errors) if errors_on_exit else 0
+        rows = {}
+        for theme in self.transformed_rows:
+            self.configurable_scrapers[theme] = [
+                name
+                for name in self.configurable_scrapers.get(theme, [])
+                if name in names
+            ]
+            sink = CollectingSink()
+            set_sink(self.session, sink)
+            getattr(self, f"output_{theme}")()
+            rows[theme] = sink.get_rows()
+        errors = errors_on_exit.errors[no_errors:] if errors_on_exit else []
+        return {"rows": rows, "errors": errors}
+
+    def transform_sharded(self) -> None:
+        """Transform the results of the scrapers of the themes that can be
+        sharded into rows in worker processes, sharded by country. The rows
+        are kept to be written by output_theme.
+
+        Returns:
+            None
+        """
+        themes = [
+            theme
+            for theme in SHARDED_THEMES
+            if not self.themes_to_run or theme in self.themes_to_run
+        ]
+        self.transformed_rows = {theme: {} for theme in themes}
+        names = []
+        for theme in themes:
+            names.extend(self.configurable_scrapers.get(theme, []))
+        shards = get_shards(
+            names, self.configuration["HAPI_countries"], self.shard_workers
+        )
+        if not shards:
+            return
+        logger.info(
+            f"Transforming results of {len(names)} scrapers in "
+            f"{len(shards)} worker processes"
+        )
+        for result in map_sharded(self.transform_shard, shards):
+            for theme, tables in result["rows"].items():
+                theme_rows = self.transformed_rows[theme]
+                for table_name, rows in tables.items():
+                    theme_rows.setdefault(table_name, []).extend(rows)
+            if self.runner.errors_on_exit:
+                for error in result["errors"]:
+                    self.runner.errors_on_exit.add(error)
+
+    def output_theme(self, theme: str) -> None:
+        """Output a theme, writing the rows transformed by workers if the
+        theme was sharded. In incremental mode, rows of resources that the
+        theme no longer loads are then deleted.
+
+        Args:
+            theme (str): Theme eg. population
+
+        Returns:
+            None
+        """
+        tables = self.transformed_rows.pop(theme, None)
+        if tables is None:
+            getattr(self, f"output_{theme}")()
+        else:
+            metadata = THEME_TABLES[theme].metadata
+            with self.get_theme_session() as session:
+                for table_name, rows in tables.items():
+                    batch_populate(rows, session, metadata.tables[table_name])
+        if not is_incremental(self.session):
+            return
+        with self.get_theme_session() as session:
+            resource_ids = self.resource_updates.get_current_resources(
+                session, self.today
+            )
+            delete_stale_resources(session, THEME_TABLES[theme], resource_ids)
+
+    @instrumented("output", whole_process=True)
+    def output(self):
+        scheduler = Scheduler(self.theme_workers)
+        if self.shard_workers > 1:
+            # Workers are forked before the scheduler starts any threads
+            instrumented("reference")(self.output_reference)()
+            instrumented("transform")(self.transform_sharded)()
+            dependencies = ()
+        else:
+            scheduler.add(
+                "reference", instrumented("reference")(self.output_reference)
+            )
+            dependencies = ("reference",)
+        for theme in THEME_REFERENCES:
+            if self.themes_to_run and theme not in self.themes_to_run:
+                continue
+            if theme in ("humanitarian_needs", "food_prices"):
+                # These themes download using the shared HDX reader
+                resources = ("hdx_reader",)
+            else:
+                resources = ()
+            scheduler.add(
+                theme,
+                instrumented(theme)(partial(self.output_theme, theme)),
+                dependencies=dependencies,
+                resources=resources,
+            )
+        scheduler.run()
@@ -0,0 +1,171 @@
+"""Run theme uploaders as a dependency graph.
+
+Each node of the graph is a function to run along with the names of the nodes
+it depends on. Nodes run in a thread pool as soon as all their dependencies
+have finished, so independent themes run concurrently. Nodes can also declare
+resources (eg. a shared downloader) that they must not use at the same time
+as other nodes. Nodes are started in the order in which they were added, so
+with one worker they run sequentially in that order.
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from hdx.utilities.typehint import ListTuple
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    def __init__(self, workers: int = 1):
+        if workers < 1:
+            raise ValueError("Number of workers must be at least 1!")
+        self._workers = workers
+        self._functions: Dict[str, Callable[[], None]] = {}
+        self._dependencies: Dict[str, Tuple[str, ...]] = {}
+        self._resources: Dict[str, Tuple[str, ...]] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}
+
+    def add(
+        self,
+        name: str,
+        function: Callable[[], None],
+        dependencies: ListTuple[str] = (),
+        resources: ListTuple[str] = (),
+    ) -> None:
+        """Add a node to the graph. Dependencies must already have been added.
+
+        Args:
+            name (str): Name of node
+            function (Callable[[], None]): Function to run
+            dependencies (ListTuple[str]): Nodes that must finish first. Defaults to ().
+            resources (ListTuple[str]): Resources that can't be shared with concurrently running nodes. Defaults to ().
+
+        Returns:
+            None
+        """
+        if name in self._functions:
+            raise ValueError(f"Node {name} has already been added!")
+        for dependency in dependencies:
+            if dependency not in self._functions:
+                raise ValueError(
+                    f"Node {name} has unknown dependency {dependency}!"
+                )
+        self._functions[name] = function
+        self._dependencies[name] = tuple(dependencies)
+        self._resources[name] = tuple(resources)
+
+    def run(self) -> None:
+        """Run all nodes respecting dependencies and resources. If a node
+        fails, no further nodes are started and the exception is raised once
+        running nodes have finished.
+
+        Returns:
+            None
+        """
+        start = perf_counter()
+        pending = list(self._functions)
+        finished = set()
+        running = {}
+        resources_in_use = set()
+        exception = None
+
+        def run_node(name: str) -> None:
+            node_start = perf_counter()
+            try:
+                self._functions[name]()
+            finally:
+                self.timings[name] = (
+                    node_start - start,
+                    perf_counter() - start,
+                )
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            while pending or running:
+                if exception is None:
+                    for name in list(pending):
+                        if len(running) == self._workers:
+                            break
+                        if not all(
+                            x in finished for x in self._dependencies[name]
+                        ):
+                            continue
+                        resources = set(self._resources[name])
+                        if resources & resources_in_use:
+                            continue
+                        pending.remove(name)
+                        resources_in_use.update(resources)
+                        logger.info(f"Starting {name}")
+                        # Nodes inherit context eg. the current stage
+                        future = executor.submit(
+                            copy_context().run, run_node, name
+                        )
+                        running[future] = name
+                elif not running:
+                    break
+                if not running:
+                    raise ValueError(
+                        f"Cannot run {', '.join(pending)} due to unmet dependencies!"
+                    )
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    resources_in_use.difference_update(self._resources[name])
+                    if future.exception():
+                        logger.error(f"{name} failed!")
+                        if exception is None:
+                            exception = future.exception()
+                        continue
+                    finished.add(name)
+                    node_start, node_end = self.timings[name]
+                    logger.info(
+                        f"Finished {name} in {node_end - node_start:.1f}s"
+                    )
+        if exception is not None:
+            raise exception
+        path, duration = self.get_critical_path()
+        logger.info(
+            f"Critical path: {' -> '.join(path)} took {duration:.1f}s "
+            f"of {perf_counter() - start:.1f}s wall clock time"
+        )
+
+    def get_critical_path(
+        self, names: Optional[ListTuple[str]] = None
+    ) -> Tuple[List[str], float]:
+        """Get the chain of dependent nodes with the longest total run time.
+        This is the minimum wall clock time however many workers are used.
+
+        Args:
+            names (Optional[ListTuple[str]]): Nodes to consider. Defaults to None (all that have run).
+
+        Returns:
+            Tuple[List[str], float]: Names of nodes on critical path and its duration
+        """
+        if names is None:
+            names = [x for x in self._functions if x in self.timings]
+        longest = {}
+        previous = {}
+        for name in names:  # nodes are in topological order
+            node_start, node_end = self.timings[name]
+            best = None
+            for dependency in self._dependencies[name]:
+                if dependency not in longest:
+                    continue
+                if best is None or longest[dependency] > longest[best]:
+                    best = dependency
+            previous[name] = best
+            longest[name] = node_end - node_start
+            if best is not None:
+                longest[name] += longest[best]
+        if not longest:
+            return [], 0.0
+        name = max(longest, key=longest.get)
+        duration = longest[name]
+        path = []
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+        return list(reversed(path)), duration
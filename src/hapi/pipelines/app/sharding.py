@@ -0,0 +1,214 @@
+"""Run scrapers in worker processes, sharded by country.
+
+Most scrapers read the data of one country and have the ISO3 code of that
+country in their name (eg. population_afg_national). The scrapers to run are
+grouped by country and the groups are split across worker processes so that
+the shards have similar numbers of scrapers. Scrapers without a country in
+their name are each put in their own group.
+
+Workers are forked from the main process once the scrapers have been set up
+so that they inherit the configuration, readers and admin levels without
+having to recreate them. Each worker runs the scrapers of its shard and sends
+back their state (values, sources, HAPI metadata etc.) which is set on the
+corresponding scrapers of the main process. The same workers (see
+map_sharded) are used to transform scraper results into rows once the
+reference tables have been loaded (see Pipelines.transform_sharded). The
+main process remains the single loader: it populates the reference tables
+once and writes the rows of all themes to the database.
+
+Where fork is not available or is unsafe (Windows and macOS), scrapers are
+run and transformed in the main process instead.
+"""
+
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from hdx.api.configuration import Configuration
+from hdx.scraper.runner import Runner
+from hdx.scraper.utilities.reader import Read
+from hdx.utilities.typehint import ListTuple
+
+from hapi.pipelines.utilities.instrumentation import instrumentation
+
+logger = logging.getLogger(__name__)
+
+_STATE_ATTRIBUTES = (
+    "has_run",
+    "fallbacks_used",
+    "headers",
+    "values",
+    "sources",
+    "source_urls",
+    "datasetinfo",
+)
+
+# Function inherited by forked workers
+_function: Optional[Callable[[List[str]], Any]] = None
+
+
+def can_fork() -> bool:
+    """Whether worker processes can be forked. Fork is not available on
+    Windows and is unsafe on macOS where system libraries may use threads.
+
+    Returns:
+        bool: True if workers can be forked, False if not
+    """
+    return "fork" in get_all_start_methods() and sys.platform != "darwin"
+
+
+def get_country(name: str, countryiso3s: ListTuple[str]) -> Optional[str]:
+    """Get the country of a scraper from its name eg. AFG for
+    population_afg_national.
+
+    Args:
+        name (str): Name of scraper
+        countryiso3s (ListTuple[str]): Country ISO3 codes
+
+    Returns:
+        Optional[str]: Country ISO3 code or None if there isn't one
+    """
+    for part in name.split("_"):
+        countryiso3 = part.upper()
+        if countryiso3 in countryiso3s:
+            return countryiso3
+    return None
+
+
+def get_shards(
+    names: ListTuple[str], countryiso3s: ListTuple[str], workers: int
+) -> List[List[str]]:
+    """Split scrapers into shards keeping the scrapers of a country together
+    and balancing the number of scrapers in each shard.
+
+    Args:
+        names (ListTuple[str]): Names of scrapers
+        countryiso3s (ListTuple[str]): Country ISO3 codes
+        workers (int): Number of shards
+
+    Returns:
+        List[List[str]]: Names of scrapers in each shard
+    """
+    groups: Dict[str, List[str]] = {}
+    for name in names:
+        key = get_country(name, countryiso3s) or name
+        groups.setdefault(key, []).append(name)
+    shards = [[] for _ in range(workers)]
+    # Largest groups first, each to the currently smallest shard
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(shards, key=len).extend(group)
+    return [shard for shard in shards if shard]
+
+
+def _reset_connections() -> None:
+    # Forked workers must not share the parent's open HTTP connections
+    for retriever in Read.retrievers.values():
+        retriever.downloader.session.close()
+    try:
+        Configuration.read().remoteckan().session.close()
+    except Exception:
+        pass
+
+
+def _call_function(names: List[str]) -> Any:
+    _reset_connections()
+    return _function(names)
+
+
+def map_sharded(
+    function: Callable[[List[str]], Any], shards: List[List[str]]
+) -> Iterator[Any]:
+    """Call function on each shard in a worker process forked from the
+    current one, so that function can be any callable (eg. a bound method)
+    and sees the state of the current process. Should be called before other
+    threads are started.
+
+    Args:
+        function (Callable[[List[str]], Any]): Function taking shard
+        shards (List[List[str]]): Shards eg. from get_shards
+
+    Returns:
+        Iterator[Any]: Result of function for each shard in order
+    """
+    global _function
+
+    if not can_fork():
+        raise ValueError(f"Cannot fork worker processes on {sys.platform}!")
+    _function = function
+    try:
+        with ProcessPoolExecutor(
+            max_workers=len(shards), mp_context=get_context("fork")
+        ) as executor:
+            yield from executor.map(_call_function, shards)
+    finally:
+        _function = None
+
+
+def _run_shard(runner: Runner, names: List[str]) -> Dict:
+    errors_on_exit = runner.errors_on_exit
+    no_errors = len(errors_on_exit.errors) if errors_on_exit else 0
+    with instrumentation.stage("shard") as stage:
+        runner.run(what_to_run=names)
+    states = {}
+    for name in names:
+        scraper = runner.get_scraper(name)
+        if scraper.has_run:
+            # Work out whether resource is HXLated here rather than in the
+            # main process
+            scraper.get_hapi_resource_metadata()
+        states[name] = {
+            attribute: getattr(scraper, attribute, None)
+            for attribute in _STATE_ATTRIBUTES
+        }
+    errors = errors_on_exit.errors[no_errors:] if errors_on_exit else []
+    return {"states": states, "errors": errors, "counts": stage.counts}
+
+
+def run_sharded(
+    runner: Runner,
+    names: ListTuple[str],
+    countryiso3s: ListTuple[str],
+    workers: int,
+) -> None:
+    """Run scrapers in worker processes sharded by country, setting the
+    resulting state on the scrapers of runner.
+
+    Args:
+        runner (Runner): Runner containing scrapers
+        names (ListTuple[str]): Names of scrapers to run
+        countryiso3s (ListTuple[str]): Country ISO3 codes
+        workers (int): Number of worker processes
+
+    Returns:
+        None
+    """
+    if not can_fork():
+        logger.warning(
+            f"Cannot fork worker processes on {sys.platform}, running "
+            "scrapers in the main process"
+        )
+        runner.run(what_to_run=list(names))
+        return
+    shards = get_shards(names, countryiso3s, workers)
+    if not shards:
+        return
+    logger.info(
+        f"Running {len(names)} scrapers in {len(shards)} worker processes"
+    )
+
+    def run_shard(shard: List[str]) -> Dict:
+        return _run_shard(runner, shard)
+
+    for result in map_sharded(run_shard, shards):
+        for name, state in result["states"].items():
+            scraper = runner.get_scraper(name)
+            for attribute, value in state.items():
+                setattr(scraper, attribute, value)
+        # Add what workers counted eg. bytes downloaded to the current stage
+        for counter, value in result["counts"].items():
+            instrumentation.add_count(counter, value)
+        if runner.errors_on_exit:
+            for error in result["errors"]:
+                runner.errors_on_exit.add(error)
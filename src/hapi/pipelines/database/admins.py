@@ -2,18 +2,21 @@
 
 import logging
 from abc import ABC
-from typing import Dict, List, Literal
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
 
 import hxl
 from hapi_schema.db_admin1 import DBAdmin1
 from hapi_schema.db_admin2 import DBAdmin2
-from hapi_schema.db_location import DBLocation
 from hdx.api.configuration import Configuration
 from hdx.utilities.dateparse import parse_date
 from hxl.filters import AbstractStreamingFilter
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import is_incremental
+from ..utilities.instrumentation import count_rows_read
+from ..utilities.sinks import populate_with_ids
 from .base_uploader import BaseUploader
 from .locations import Locations
 
@@ -38,41 +41,91 @@ class Admins(BaseUploader):
         self._libhxl_dataset = libhxl_dataset
         self.admin1_data = {}
         self.admin2_data = {}
+        self._admin1_reference_period_starts = {}
 
     def populate(self):
+        if is_incremental(self._session):
+            # Only add admin units that aren't already in the database
+            self._read_existing_admins(
+                DBAdmin1,
+                self.admin1_data,
+                self._admin1_reference_period_starts,
+            )
+            self._read_existing_admins(DBAdmin2, self.admin2_data)
         logger.info("Populating admin1 table")
-        self._update_admin_table(
+        admin1_rows = self._get_admin_rows(
             desired_admin_level="1",
             parent_dict=self._locations.data,
         )
-        self._add_admin1_connector_rows()
-        results = self._session.execute(select(DBAdmin1.id, DBAdmin1.code))
-        self.admin1_data = {result[1]: result[0] for result in results}
+        admin1_rows.extend(self._get_admin1_connector_rows())
+        self._insert_admin_rows(DBAdmin1, admin1_rows, self.admin1_data)
+        for row in admin1_rows:
+            self._admin1_reference_period_starts[row["code"]] = row[
+                "reference_period_start"
+            ]
         logger.info("Populating admin2 table")
-        self._update_admin_table(
+        admin2_rows = self._get_admin_rows(
             desired_admin_level="2",
             parent_dict=self.admin1_data,
         )
-        self._add_admin2_connector_rows()
-        results = self._session.execute(select(DBAdmin2.id, DBAdmin2.code))
-        for result in results:
-            self.admin2_data[result[1]] = result[0]
+        admin2_rows.extend(self._get_admin2_connector_rows())
+        self._insert_admin_rows(DBAdmin2, admin2_rows, self.admin2_data)
+        self._session.commit()
+
+    def _read_existing_admins(
+        self,
+        DBAdmin,
+        admin_data: Dict[str, int],
+        reference_period_starts: Optional[Dict[str, datetime]] = None,
+    ) -> None:
+        results = self._session.execute(
+            select(DBAdmin.id, DBAdmin.code, DBAdmin.reference_period_start)
+        )
+        for admin_id, code, reference_period_start in results:
+            admin_data[code] = admin_id
+            if reference_period_starts is not None:
+                reference_period_starts[code] = reference_period_start
+
+    def _insert_admin_rows(
+        self, DBAdmin, rows: List[Dict], admin_data: Dict[str, int]
+    ) -> None:
+        """Insert admin rows in batches of commit_limit rows, adding the ids
+        returned by the database (or sink) to admin_data.
+
+        Args:
+            DBAdmin: Admin table class ie. DBAdmin1 or DBAdmin2
+            rows (List[Dict]): Admin rows to insert
+            admin_data (Dict[str, int]): Dictionary of codes to ids to update
+
+        Returns:
+            None
+        """
+        admin_data.update(
+            populate_with_ids(rows, self._session, DBAdmin, self._limit)
+        )
 
-    def _update_admin_table(
+    def _get_admin_rows(
         self,
         desired_admin_level: _ADMIN_LEVELS_LITERAL,
         parent_dict: Dict,
-    ):
+    ) -> List[Dict]:
         if desired_admin_level not in _ADMIN_LEVELS:
             raise ValueError(f"Admin levels must be one of {_ADMIN_LEVELS}")
+        if desired_admin_level == "1":
+            existing_data = self.admin1_data
+        else:
+            existing_data = self.admin2_data
         # Filter admin level and countries
         admin_filter = _AdminFilter(
             source=self._libhxl_dataset,
             desired_admin_level=desired_admin_level,
             country_codes=list(self._locations.hapi_countries),
         )
-        for i, row in enumerate(admin_filter):
+        admin_rows = []
+        for row in count_rows_read(admin_filter):
             code = row.get("#adm+code")
+            if code in existing_data:
+                continue
             name = row.get("#adm+name")
             time_period_start = parse_date(row.get("#date+start"))
             parent = row.get("#adm+code+parent")
@@ -91,63 +144,65 @@ class Admins(BaseUploader):
                     logger.warning(f"Missing parent {parent} for code {code}")
                     continue
             if desired_admin_level == "1":
-                admin_row = DBAdmin1(
+                admin_row = dict(
                     location_ref=parent_ref,
                     code=code,
                     name=name,
+                    is_unspecified=False,
                     reference_period_start=time_period_start,
                 )
             elif desired_admin_level == "2":
-                admin_row = DBAdmin2(
+                admin_row = dict(
                     admin1_ref=parent_ref,
                     code=code,
                     name=name,
+                    is_unspecified=False,
                     reference_period_start=time_period_start,
                 )
-            self._session.add(admin_row)
-            if i % self._limit == 0:
-                self._session.commit()
-        self._session.commit()
+            admin_rows.append(admin_row)
+        return admin_rows
 
-    def _add_admin1_connector_rows(self):
+    def _get_admin1_connector_rows(self) -> List[Dict]:
+        admin_rows = []
         for location_code, location_ref in self._locations.data.items():
-            time_period_start = (
-                self._session.query(DBLocation)
-                .filter(DBLocation.id == location_ref)
-                .one()
-                .reference_period_start
+            code = _get_admin1_to_location_connector_code(
+                location_code=location_code
             )
-            admin_row = DBAdmin1(
-                location_ref=location_ref,
-                code=_get_admin1_to_location_connector_code(
-                    location_code=location_code
-                ),
-                name="UNSPECIFIED",
-                is_unspecified=True,
-                reference_period_start=time_period_start,
+            if code in self.admin1_data:
+                continue
+            admin_rows.append(
+                dict(
+                    location_ref=location_ref,
+                    code=code,
+                    name="UNSPECIFIED",
+                    is_unspecified=True,
+                    reference_period_start=self._locations.reference_period_starts[
+                        location_code
+                    ],
+                )
             )
-            self._session.add(admin_row)
-        self._session.commit()
+        return admin_rows
 
-    def _add_admin2_connector_rows(self):
+    def _get_admin2_connector_rows(self) -> List[Dict]:
+        admin_rows = []
         for admin1_code, admin1_ref in self.admin1_data.items():
-            time_period_start = (
-                self._session.query(DBAdmin1)
-                .filter(DBAdmin1.id == admin1_ref)
-                .one()
-                .reference_period_start
+            code = _get_admin2_to_admin1_connector_code(
+                admin1_code=admin1_code
             )
-            admin_row = DBAdmin2(
-                admin1_ref=admin1_ref,
-                code=_get_admin2_to_admin1_connector_code(
-                    admin1_code=admin1_code
-                ),
-                name="UNSPECIFIED",
-                is_unspecified=True,
-                reference_period_start=time_period_start,
+            if code in self.admin2_data:
+                continue
+            admin_rows.append(
+                dict(
+                    admin1_ref=admin1_ref,
+                    code=code,
+                    name="UNSPECIFIED",
+                    is_unspecified=True,
+                    reference_period_start=self._admin1_reference_period_starts[
+                        admin1_code
+                    ],
+                )
             )
-            self._session.add(admin_row)
-        self._session.commit()
+        return admin_rows
 
     def get_admin_level(self, pcode: str) -> _ADMIN_LEVELS_LITERAL:
         """Given a pcode, return the admin level."""
@@ -2,11 +2,21 @@ from abc import ABC, abstractmethod
 
 from sqlalchemy.orm import Session
 
+from ..utilities.instrumentation import instrumented
+
 
 class BaseUploader(ABC):
     def __init__(self, session: Session):
         self._session = session
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Record every populate as a stage
+        if "populate" in cls.__dict__:
+            cls.populate = instrumented(f"{cls.__name__}.populate")(
+                cls.populate
+            )
+
     @abstractmethod
     def populate(self) -> None:
         """
@@ -9,6 +9,7 @@ from hdx.utilities.dateparse import parse_date_range
 from sqlalchemy.orm import Session
 
 from ..utilities.batch_populate import batch_populate
+from ..utilities.dedupe import Dedupe
 from ..utilities.logging_helpers import add_message
 from . import admins
 from .base_uploader import BaseUploader
@@ -35,10 +36,10 @@ class ConflictEvent(BaseUploader):
     def populate(self):
         logger.info("Populating conflict event table")
         errors = set()
+        dedupe = Dedupe()
         for dataset in self._results.values():
             dataset_name = dataset["hdx_stub"]
             conflict_event_rows = []
-            number_duplicates = 0
             for admin_level, admin_results in dataset["results"].items():
                 # TODO: this is only one resource id, but three resources are downloaded per dataset
                 resource_id = admin_results["hapi_resource_metadata"]["hdx_id"]
@@ -47,7 +48,8 @@ class ConflictEvent(BaseUploader):
                 values = admin_results["values"]
 
                 for admin_code in admin_codes:
-                    admin_rows = []
+                    # Rows are only compared within an admin unit
+                    dedupe.reset()
                     admin2_code = admins.get_admin2_code_based_on_level(
                         admin_code=admin_code, admin_level=admin_level
                     )
@@ -84,21 +86,18 @@ class ConflictEvent(BaseUploader):
                                 reference_period_start=time_period_range[0],
                                 reference_period_end=time_period_range[1],
                             )
-                            if conflict_event_row in admin_rows:
-                                number_duplicates += 1
+                            if dedupe.is_duplicate(
+                                conflict_event_row, dataset_name
+                            ):
                                 continue
-                            admin_rows.append(conflict_event_row)
                             conflict_event_rows.append(conflict_event_row)
 
-            if number_duplicates > 0:
-                add_message(
-                    errors, dataset_name, f"{number_duplicates} duplicate rows"
-                )
             if len(conflict_event_rows) == 0:
                 add_message(errors, dataset_name, "no rows found")
                 continue
             batch_populate(conflict_event_rows, self._session, DBConflictEvent)
 
+        dedupe.add_messages(errors)
         for dataset, msg in self._config.get(
             "conflict_event_error_messages", dict()
         ).items():
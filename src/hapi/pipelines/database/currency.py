@@ -7,6 +7,7 @@ from hdx.api.configuration import Configuration
 from hdx.scraper.utilities.reader import Read
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
 from .base_uploader import BaseUploader
 
 logger = getLogger(__name__)
@@ -33,12 +34,12 @@ class Currency(BaseUploader):
         reader = Read.get_reader("wfp_databridges")
         reader.downloader.set_bearer_token(bearer_token)
         json = reader.download_json(self._configuration["wfp_currencies_url"])
+        currency_rows = []
         for currency in json["items"]:
             code = currency["name"]
             name = currency["extendedName"]
             if not name:
                 logger.warning(f"Using {code} as name because name is empty!")
                 name = code
-            currency_row = DBCurrency(code=code, name=name)
-            self._session.add(currency_row)
-        self._session.commit()
+            currency_rows.append(dict(code=code, name=name))
+        batch_populate(currency_rows, self._session, DBCurrency)
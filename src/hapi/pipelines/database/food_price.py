@@ -1,15 +1,27 @@
 """Populate the WFP market table."""
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from itertools import islice
 from logging import getLogger
-from typing import Dict, List
+from threading import Lock, Semaphore, local
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
 
 from dateutil.relativedelta import relativedelta
 from hapi_schema.db_food_price import DBFoodPrice
+from hdx.api.configuration import Configuration
 from hdx.scraper.utilities.reader import Read
 from hdx.utilities.dateparse import parse_date
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
+from ..utilities.download_cache import clone_downloader
+from ..utilities.instrumentation import count_rows_read
 from ..utilities.logging_helpers import add_missing_value_message
+from ..utilities.resource_updates import ResourceUpdates
 from .base_uploader import BaseUploader
 from .currency import Currency
 from .metadata import Metadata
@@ -18,6 +30,19 @@ from .wfp_market import WFPMarket
 
 logger = getLogger(__name__)
 
+_PRICE_COLUMNS = (
+    "resource_hdx_id",
+    "market_code",
+    "commodity_code",
+    "currency_code",
+    "unit",
+    "price_flag",
+    "price_type",
+    "price",
+    "reference_period_start",
+    "reference_period_end",
+)
+
 
 class FoodPrice(BaseUploader):
     def __init__(
@@ -29,6 +54,10 @@ class FoodPrice(BaseUploader):
         currency: Currency,
         commodity: WFPCommodity,
         market: WFPMarket,
+        resource_updates: Optional[ResourceUpdates] = None,
+        download_workers: int = 1,
+        host_concurrency: int = 1,
+        stream: bool = False,
     ):
         super().__init__(session)
         self._datasetinfo = datasetinfo
@@ -37,6 +66,168 @@ class FoodPrice(BaseUploader):
         self._currency = currency
         self._commodity = commodity
         self._market = market
+        if resource_updates and resource_updates.previous_resources:
+            self._resource_updates = resource_updates
+        else:
+            self._resource_updates = None
+        self._download_workers = download_workers
+        self._host_concurrency = host_concurrency
+        self._stream = stream
+        self._host_semaphores = {}
+        self._lock = Lock()
+        self._thread_local = local()
+
+    def _get_host_semaphore(self, url: str) -> Semaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = Semaphore(self._host_concurrency)
+                self._host_semaphores[host] = semaphore
+        return semaphore
+
+    def _download(
+        self, reader: Read, datasetinfo: Dict
+    ) -> Tuple[Optional[Dict], Optional[List[Dict]], Dict]:
+        """Read metadata for a country then download and parse its prices.
+        Runs in a worker thread with a reader that has its own downloader.
+        When streaming, only the metadata is read and the prices are left to
+        be read lazily by the caller.
+
+        Args:
+            reader (Read): Reader to clone for this thread
+            datasetinfo (Dict): Dictionary of information about dataset
+
+        Returns:
+            Tuple[Optional[Dict], Optional[List[Dict]], Dict]: (datasetinfo or None if unchanged, rows or None if streaming, timings)
+        """
+        thread_reader = getattr(self._thread_local, "reader", None)
+        if thread_reader is None:
+            thread_reader = reader.clone(clone_downloader(reader.downloader))
+            self._thread_local.reader = thread_reader
+        timing = {"countryiso3": datasetinfo["admin_single"]}
+        start = perf_counter()
+        with self._get_host_semaphore(Configuration.read().get_hdx_site_url()):
+            resource = thread_reader.read_hdx_metadata(datasetinfo)
+        timing["metadata"] = perf_counter() - start
+        if self._resource_updates and self._resource_updates.is_unchanged(
+            datasetinfo.get("hapi_resource_metadata")
+        ):
+            logger.info(f"Skipping unchanged {datasetinfo['admin_single']}")
+            return None, None, timing
+        # Same filename as Read.read_hdx would use
+        datasetinfo["filename"] = thread_reader.construct_filename(
+            resource["name"], resource.get_format()
+        )
+        if self._stream:
+            return datasetinfo, None, timing
+        start = perf_counter()
+        with self._get_host_semaphore(datasetinfo["url"]):
+            headers, iterator = thread_reader.read_tabular(datasetinfo)
+            timing["download"] = perf_counter() - start
+        start = perf_counter()
+        rows = list(iterator)
+        timing["parse"] = perf_counter() - start
+        return datasetinfo, rows, timing
+
+    def _prefetch(
+        self, reader: Read, datasetinfos: List[Dict]
+    ) -> Iterator[Tuple[Optional[Dict], Optional[List[Dict]], Dict]]:
+        """Download and parse countries concurrently, yielding results in
+        the order of datasetinfos so that database writes stay ordered. At
+        most twice the number of workers countries are held in memory
+        unless streaming when only their metadata is prefetched.
+
+        Args:
+            reader (Read): Reader to clone for worker threads
+            datasetinfos (List[Dict]): Dictionaries of information about datasets
+
+        Returns:
+            Iterator[Tuple[Optional[Dict], Optional[List[Dict]], Dict]]: (datasetinfo or None if unchanged, rows or None if streaming, timings)
+        """
+        pending = deque()
+        datasetinfos = iter(datasetinfos)
+        with ThreadPoolExecutor(max_workers=self._download_workers) as pool:
+            for datasetinfo in islice(
+                datasetinfos, 2 * self._download_workers
+            ):
+                pending.append(
+                    pool.submit(
+                        copy_context().run, self._download, reader, datasetinfo
+                    )
+                )
+            while pending:
+                result = pending.popleft().result()
+                for datasetinfo in islice(datasetinfos, 1):
+                    pending.append(
+                        pool.submit(
+                            copy_context().run,
+                            self._download,
+                            reader,
+                            datasetinfo,
+                        )
+                    )
+                yield result
+
+    def _get_price_rows(
+        self,
+        iterator: Iterator[Dict],
+        countryiso3: str,
+        dataset_name: str,
+        resource_id: str,
+        errors: Set[str],
+        timing: Dict,
+    ) -> Iterator[Tuple]:
+        """Lazily convert the rows of a country's prices to tuples of values
+        in the order of _PRICE_COLUMNS, counting them in timing.
+
+        Args:
+            iterator (Iterator[Dict]): Rows of country's prices
+            countryiso3 (str): Country ISO3 code
+            dataset_name (str): Dataset name
+            resource_id (str): Resource HDX id
+            errors (Set[str]): Set of errors to which to add
+            timing (Dict): Timings of country
+
+        Returns:
+            Iterator[Tuple]: Tuples of price values
+        """
+        timing["rows"] = 0
+        for row in iterator:
+            market = row["market"]
+            market_code = self._market.get_market_code(countryiso3, market)
+            if not market_code:
+                add_missing_value_message(
+                    errors, dataset_name, "market code", market
+                )
+                continue
+            commodity_code = self._commodity.get_commodity_code(
+                row["commodity"]
+            )
+            reference_period_start = parse_date(
+                row["date"], date_format="%Y-%m-%d"
+            )
+            reference_period_end = reference_period_start + relativedelta(
+                months=1,
+                days=-1,
+                hours=23,
+                minutes=59,
+                seconds=59,
+                microseconds=999999,
+            )  # food price reference period is one month
+            timing["rows"] += 1
+            yield (
+                resource_id,
+                market_code,
+                commodity_code,
+                row["currency"],
+                row["unit"],
+                row["priceflag"],
+                row["pricetype"],
+                row["price"],
+                reference_period_start,
+                reference_period_end,
+            )
 
     def populate(self):
         logger.info("Populating WFP price table")
@@ -57,58 +248,52 @@ class FoodPrice(BaseUploader):
             )
         warnings = set()
         errors = set()
-        for datasetinfo in datasetinfos:
-            headers, iterator = reader.read(datasetinfo)
+        timings = []
+        for datasetinfo, rows, timing in self._prefetch(reader, datasetinfos):
+            if datasetinfo is None:
+                continue
+            if rows is None:
+                # Stream rows so that only a batch of them is held in memory
+                start = perf_counter()
+                with self._get_host_semaphore(datasetinfo["url"]):
+                    headers, iterator = reader.read_tabular(datasetinfo)
+                timing["download"] = perf_counter() - start
+            else:
+                iterator = iter(rows)
+            load_start = perf_counter()
             hapi_dataset_metadata = datasetinfo["hapi_dataset_metadata"]
             hapi_resource_metadata = datasetinfo["hapi_resource_metadata"]
             self._metadata.add_hapi_metadata(
                 hapi_dataset_metadata, hapi_resource_metadata
             )
-            countryiso3 = datasetinfo["admin_single"]
-            dataset_name = hapi_dataset_metadata["hdx_stub"]
-            resource_id = hapi_resource_metadata["hdx_id"]
             next(iterator)  # ignore HXL hashtags
-            for row in iterator:
-                market = row["market"]
-                market_code = self._market.get_market_code(countryiso3, market)
-                if not market_code:
-                    add_missing_value_message(
-                        errors, dataset_name, "market code", market
-                    )
-                    continue
-                commodity_code = self._commodity.get_commodity_code(
-                    row["commodity"]
-                )
-                currency_code = row["currency"]
-                unit = row["unit"]
-                price_flag = row["priceflag"]
-                price_type = row["pricetype"]
-                price = row["price"]
-                reference_period_start = parse_date(
-                    row["date"], date_format="%Y-%m-%d"
-                )
-                reference_period_end = reference_period_start + relativedelta(
-                    months=1,
-                    days=-1,
-                    hours=23,
-                    minutes=59,
-                    seconds=59,
-                    microseconds=999999,
-                )  # food price reference period is one month
-                price_row = DBFoodPrice(
-                    resource_hdx_id=resource_id,
-                    market_code=market_code,
-                    commodity_code=commodity_code,
-                    currency_code=currency_code,
-                    unit=unit,
-                    price_flag=price_flag,
-                    price_type=price_type,
-                    price=price,
-                    reference_period_start=reference_period_start,
-                    reference_period_end=reference_period_end,
-                )
-                self._session.add(price_row)
-            self._session.commit()
+            price_rows = self._get_price_rows(
+                count_rows_read(iterator),
+                datasetinfo["admin_single"],
+                hapi_dataset_metadata["hdx_stub"],
+                hapi_resource_metadata["hdx_id"],
+                errors,
+                timing,
+            )
+            batch_populate(
+                price_rows,
+                self._session,
+                DBFoodPrice,
+                column_names=_PRICE_COLUMNS,
+            )
+            timing["load"] = perf_counter() - load_start
+            timings.append(timing)
+        for timing in timings:
+            if "parse" in timing:
+                parse = f"parse {timing['parse']:.1f}s, "
+            else:
+                parse = ""  # parsed while loading
+            logger.info(
+                f"{timing['countryiso3']}: {timing['rows']} rows, "
+                f"metadata {timing['metadata']:.1f}s, "
+                f"download {timing['download']:.1f}s, "
+                f"{parse}load {timing['load']:.1f}s"
+            )
         for warning in sorted(warnings):
             logger.warning(warning)
         for error in sorted(errors):
@@ -10,6 +10,7 @@ from hdx.utilities.dateparse import parse_date_range
 from hdx.utilities.dictandlist import dict_of_lists_add
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
 from . import admins
 from .base_uploader import BaseUploader
 from .metadata import Metadata
@@ -32,6 +33,7 @@ class FoodSecurity(BaseUploader):
 
     def populate(self):
         logger.info("Populating food security table")
+        food_security_rows = []
         for dataset in self._results.values():
             for admin_level, admin_results in dataset["results"].items():
                 resource_id = admin_results["hapi_resource_metadata"]["hdx_id"]
@@ -119,7 +121,7 @@ class FoodSecurity(BaseUploader):
                             filter(None, population_totals[key[1:]])
                         )
                         population_in_phase = sum(population_in_phases[key])
-                        food_security_row = DBFoodSecurity(
+                        food_security_row = dict(
                             resource_hdx_id=resource_id,
                             admin2_ref=admin2_ref,
                             ipc_phase=key[0],
@@ -133,8 +135,8 @@ class FoodSecurity(BaseUploader):
                                 else 0.0
                             ),
                         )
-                        self._session.add(food_security_row)
-        self._session.commit()
+                        food_security_rows.append(food_security_row)
+        batch_populate(food_security_rows, self._session, DBFoodSecurity)
 
 
 def _get_ipc_type_code_from_data(ipc_type_from_data: str) -> str:
@@ -7,6 +7,7 @@ from hapi_schema.db_funding import DBFunding
 from hdx.utilities.dateparse import parse_date
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
 from . import locations
 from .base_uploader import BaseUploader
 from .metadata import Metadata
@@ -29,6 +30,7 @@ class Funding(BaseUploader):
 
     def populate(self):
         logger.info("Populating funding table")
+        funding_rows = []
         for dataset in self._results.values():
             for admin_level, admin_results in dataset["results"].items():
                 resource_id = admin_results["hapi_resource_metadata"]["hdx_id"]
@@ -59,7 +61,7 @@ class Funding(BaseUploader):
                                 f"Date misalignment in funding data for {appeal_code} in {admin_code}"
                             )
                             continue
-                        funding_row = DBFunding(
+                        funding_row = dict(
                             resource_hdx_id=resource_id,
                             location_ref=self._locations.data[admin_code],
                             appeal_code=appeal_code,
@@ -81,6 +83,5 @@ class Funding(BaseUploader):
                             reference_period_start=reference_period_start,
                             reference_period_end=reference_period_end,
                         )
-
-                        self._session.add(funding_row)
-        self._session.commit()
+                        funding_rows.append(funding_row)
+        batch_populate(funding_rows, self._session, DBFunding)
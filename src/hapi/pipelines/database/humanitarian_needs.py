@@ -1,6 +1,7 @@
 """Functions specific to the humanitarian needs theme."""
 
 from logging import getLogger
+from typing import Optional
 
 from hapi_schema.db_humanitarian_needs import DBHumanitarianNeeds
 from hdx.api.configuration import Configuration
@@ -8,10 +9,13 @@ from hdx.scraper.utilities.reader import Read
 from hdx.utilities.text import get_numeric_if_possible
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
+from ..utilities.instrumentation import count_rows_read
 from ..utilities.logging_helpers import (
     add_missing_value_message,
     add_multi_valued_message,
 )
+from ..utilities.resource_updates import ResourceUpdates
 from . import admins
 from .base_uploader import BaseUploader
 from .metadata import Metadata
@@ -27,11 +31,13 @@ class HumanitarianNeeds(BaseUploader):
         metadata: Metadata,
         admins: admins.Admins,
         sector: Sector,
+        resource_updates: Optional[ResourceUpdates] = None,
     ):
         super().__init__(session)
         self._metadata = metadata
         self._admins = admins
         self._sector = sector
+        self._resource_updates = resource_updates
 
     def get_admin2_ref(self, countryiso3, row, dataset_name, errors):
         admin_code = row["Admin 2 PCode"]
@@ -69,9 +75,15 @@ class HumanitarianNeeds(BaseUploader):
         warnings = set()
         errors = set()
         for dataset in datasets:
+            humanitarian_needs_rows = []
             negative_values = []
             rounded_values = []
             dataset_name = dataset["name"]
+            if self._resource_updates and self._resource_updates.is_unchanged(
+                Read.get_hapi_resource_metadata(dataset.get_resource())
+            ):
+                logger.info(f"Skipping unchanged {dataset_name}")
+                continue
             self._metadata.add_dataset(dataset)
             countryiso3 = dataset.get_location_iso3s()[0]
             time_period = dataset.get_time_period()
@@ -82,7 +94,7 @@ class HumanitarianNeeds(BaseUploader):
             url = resource["url"]
             headers, rows = reader.get_tabular_rows(url, dict_form=True)
             # Admin 1 PCode,Admin 2 PCode,Sector,Gender,Age Group,Disabled,Population Group,Population,In Need,Targeted,Affected,Reached
-            for row in rows:
+            for row in count_rows_read(rows):
                 admin2_ref = self.get_admin2_ref(
                     countryiso3, row, dataset_name, errors
                 )
@@ -119,7 +131,7 @@ class HumanitarianNeeds(BaseUploader):
                     if isinstance(value, float):
                         rounded_values.append(str(value))
                         value = round(value)
-                    humanitarian_needs_row = DBHumanitarianNeeds(
+                    humanitarian_needs_row = dict(
                         resource_hdx_id=resource_id,
                         admin2_ref=admin2_ref,
                         gender=gender,
@@ -134,7 +146,7 @@ class HumanitarianNeeds(BaseUploader):
                         reference_period_start=time_period_start,
                         reference_period_end=time_period_end,
                     )
-                    self._session.add(humanitarian_needs_row)
+                    humanitarian_needs_rows.append(humanitarian_needs_row)
 
                 create_row("Population", "POP")
                 create_row("Affected", "AFF")
@@ -142,7 +154,9 @@ class HumanitarianNeeds(BaseUploader):
                 create_row("Targeted", "TGT")
                 create_row("Reached", "REA")
 
-            self._session.commit()
+            batch_populate(
+                humanitarian_needs_rows, self._session, DBHumanitarianNeeds
+            )
             add_multi_valued_message(
                 errors,
                 dataset_name,
@@ -4,8 +4,11 @@ from hapi_schema.db_location import DBLocation
 from hdx.api.configuration import Configuration
 from hdx.location.country import Country
 from hdx.utilities.dateparse import parse_date
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import is_incremental
+from ..utilities.sinks import populate_with_ids
 from .base_uploader import BaseUploader
 
 
@@ -23,16 +26,39 @@ class Locations(BaseUploader):
             country_name_mappings=configuration["country_name_mappings"],
         )
         self.hapi_countries = configuration["HAPI_countries"]
+        self._limit = configuration["commit_limit"]
         self.data = {}
+        self.reference_period_starts = {}
 
     def populate(self):
+        if is_incremental(self._session):
+            results = self._session.execute(
+                select(
+                    DBLocation.id,
+                    DBLocation.code,
+                    DBLocation.reference_period_start,
+                )
+            )
+            for location_id, code, reference_period_start in results:
+                self.data[code] = location_id
+                self.reference_period_starts[code] = reference_period_start
+        location_rows = []
         for country in Country.countriesdata()["countries"].values():
             code = country["#country+code+v_iso3"]
-            location_row = DBLocation(
-                code=code,
-                name=country["#country+name+preferred"],
-                reference_period_start=parse_date(country["#date+start"]),
+            if code in self.data:
+                continue
+            reference_period_start = parse_date(country["#date+start"])
+            location_rows.append(
+                dict(
+                    code=code,
+                    name=country["#country+name+preferred"],
+                    reference_period_start=reference_period_start,
+                )
+            )
+            self.reference_period_starts[code] = reference_period_start
+        self.data.update(
+            populate_with_ids(
+                location_rows, self._session, DBLocation, self._limit
             )
-            self._session.add(location_row)
-            self._session.commit()
-            self.data[code] = location_row.id
+        )
+        self._session.commit()
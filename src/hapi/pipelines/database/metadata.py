@@ -9,6 +9,7 @@ from hdx.scraper.runner import Runner
 from hdx.scraper.utilities.reader import Read
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
 from .base_uploader import BaseUploader
 
 logger = logging.getLogger(__name__)
@@ -24,6 +25,8 @@ class Metadata(BaseUploader):
     def populate(self):
         logger.info("Populating metadata")
         datasets = self.runner.get_hapi_metadata()
+        dataset_rows = []
+        resource_rows = []
         for dataset_id, dataset in datasets.items():
             # First add dataset
 
@@ -32,52 +35,65 @@ class Metadata(BaseUploader):
             # dataset-resource pairs
             if dataset_id in self.dataset_data:
                 continue
-            dataset_row = DBDataset(
-                hdx_id=dataset_id,
-                hdx_stub=dataset["hdx_stub"],
-                title=dataset["title"],
-                hdx_provider_stub=dataset["hdx_provider_stub"],
-                hdx_provider_name=dataset["hdx_provider_name"],
+            dataset_rows.append(
+                dict(
+                    hdx_id=dataset_id,
+                    hdx_stub=dataset["hdx_stub"],
+                    title=dataset["title"],
+                    hdx_provider_stub=dataset["hdx_provider_stub"],
+                    hdx_provider_name=dataset["hdx_provider_name"],
+                )
             )
-            self._session.add(dataset_row)
-            self._session.commit()
             self.dataset_data.append(dataset_id)
 
             resources = dataset["resources"]
             for resource_id, resource in resources.items():
                 # Then add the resources
-                resource_row = DBResource(
-                    hdx_id=resource_id,
-                    dataset_hdx_id=dataset_row.hdx_id,
-                    name=resource["name"],
-                    format=resource["format"],
-                    update_date=resource["update_date"],
-                    is_hxl=resource["is_hxl"],
-                    download_url=resource["download_url"],
-                    hapi_updated_date=self.today,
+                resource_rows.append(
+                    dict(
+                        hdx_id=resource_id,
+                        dataset_hdx_id=dataset_id,
+                        name=resource["name"],
+                        format=resource["format"],
+                        update_date=resource["update_date"],
+                        is_hxl=resource["is_hxl"],
+                        download_url=resource["download_url"],
+                        hapi_updated_date=self.today,
+                    )
                 )
-                self._session.add(resource_row)
-                self._session.commit()
+        # Datasets must be added before the resources that reference them
+        batch_populate(dataset_rows, self._session, DBDataset, commit=False)
+        batch_populate(resource_rows, self._session, DBResource)
 
     def add_hapi_metadata(
         self, hapi_dataset_metadata: Dict, hapi_resource_metadata: Dict
     ):
+        """Add a dataset and its resource without committing so that they are
+        committed along with the rows that reference them.
+
+        Args:
+            hapi_dataset_metadata (Dict): HAPI dataset metadata
+            hapi_resource_metadata (Dict): HAPI resource metadata
+
+        Returns:
+            None
+        """
         dataset_id = hapi_dataset_metadata["hdx_id"]
-        dataset_row = DBDataset(
+        dataset_row = dict(
             hdx_id=dataset_id,
             hdx_stub=hapi_dataset_metadata["hdx_stub"],
             title=hapi_dataset_metadata["title"],
             hdx_provider_stub=hapi_dataset_metadata["hdx_provider_stub"],
             hdx_provider_name=hapi_dataset_metadata["hdx_provider_name"],
         )
-        self._session.add(dataset_row)
+        batch_populate([dataset_row], self._session, DBDataset, commit=False)
         hapi_resource_metadata["dataset_hdx_id"] = dataset_id
         hapi_resource_metadata["is_hxl"] = True
         hapi_resource_metadata["hapi_updated_date"] = self.today
 
-        resource_row = DBResource(**hapi_resource_metadata)
-        self._session.add(resource_row)
-        self._session.commit()
+        batch_populate(
+            [hapi_resource_metadata], self._session, DBResource, commit=False
+        )
 
         self.dataset_data.append(dataset_id)
 
@@ -6,6 +6,7 @@ from typing import Dict
 from hapi_schema.db_national_risk import DBNationalRisk
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
 from . import locations
 from .base_uploader import BaseUploader
 from .metadata import Metadata
@@ -28,6 +29,7 @@ class NationalRisk(BaseUploader):
 
     def populate(self):
         logger.info("Populating national risk table")
+        national_risk_rows = []
         for dataset in self._results.values():
             time_period_start = dataset["time_period"]["start"]
             time_period_end = dataset["time_period"]["end"]
@@ -44,7 +46,7 @@ class NationalRisk(BaseUploader):
                     if risk_class:
                         risk_class = _get_risk_class_code_from_data(risk_class)
 
-                    national_risk_row = DBNationalRisk(
+                    national_risk_row = dict(
                         resource_hdx_id=resource_id,
                         location_ref=self._locations.data[admin_code],
                         risk_class=risk_class,
@@ -72,9 +74,8 @@ class NationalRisk(BaseUploader):
                         reference_period_start=time_period_start,
                         reference_period_end=time_period_end,
                     )
-
-                    self._session.add(national_risk_row)
-        self._session.commit()
+                    national_risk_rows.append(national_risk_row)
+        batch_populate(national_risk_rows, self._session, DBNationalRisk)
 
 
 def _get_risk_class_code_from_data(risk_class: str) -> int:
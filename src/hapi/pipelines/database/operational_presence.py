@@ -11,6 +11,7 @@ from hdx.utilities.dictandlist import write_list_to_csv
 from sqlalchemy.orm import Session
 
 from ..utilities.batch_populate import batch_populate
+from ..utilities.dedupe import Dedupe
 from ..utilities.logging_helpers import add_message, add_missing_value_message
 from . import admins
 from .base_uploader import BaseUploader
@@ -50,10 +51,12 @@ class OperationalPresence(BaseUploader):
     def populate(self, debug=False):
         logger.info("Populating operational presence table")
         operational_presence_rows = []
+        dedupe = Dedupe()
         if debug:
             debug_rows = []
-        number_duplicates = 0
+            debug_dedupe = Dedupe()
         errors = set()
+        warnings = set()
         for dataset in self._results.values():
             dataset_name = dataset["hdx_stub"]
             time_period_start = dataset["time_period"]["start"]
@@ -157,7 +160,7 @@ class OperationalPresence(BaseUploader):
                                 "org_type": org_type_code,
                                 "sector": sector_code,
                             }
-                            if debug_row in debug_rows:
+                            if debug_dedupe.is_duplicate(debug_row):
                                 continue
                             debug_rows.append(debug_row)
                             continue
@@ -178,11 +181,9 @@ class OperationalPresence(BaseUploader):
                             reference_period_start=time_period_start,
                             reference_period_end=time_period_end,
                         )
-                        if (
-                            operational_presence_row
-                            in operational_presence_rows
+                        if dedupe.is_duplicate(
+                            operational_presence_row, dataset_name
                         ):
-                            number_duplicates += 1
                             continue
                         operational_presence_rows.append(
                             operational_presence_row
@@ -194,14 +195,17 @@ class OperationalPresence(BaseUploader):
             )
             return
 
-        self._org.populate_multiple()
+        self._org.populate_multiple(self._session)
         batch_populate(
             operational_presence_rows, self._session, DBOperationalPresence
         )
 
         logger.warning(
-            f"There were {number_duplicates} duplicate operational presence rows!"
+            f"There were {dedupe.number_duplicates} duplicate operational presence rows!"
         )
+        dedupe.add_messages(warnings)
+        for warning in sorted(warnings):
+            logger.warning(warning)
         for dataset, msg in self._config.get(
             "conflict_event_error_messages", dict()
         ).items():
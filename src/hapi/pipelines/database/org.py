@@ -1,7 +1,7 @@
 """Populate the org table."""
 
 import logging
-from typing import Dict
+from typing import Dict, Optional
 
 from hapi_schema.db_org import DBOrg
 from hdx.location.names import clean_name
@@ -10,6 +10,7 @@ from hdx.utilities.dictandlist import dict_of_sets_add
 from sqlalchemy.orm import Session
 
 from ..utilities.batch_populate import batch_populate
+from ..utilities.instrumentation import count_rows_read
 from .base_uploader import BaseUploader
 
 logger = logging.getLogger(__name__)
@@ -27,6 +28,7 @@ class Org(BaseUploader):
         self._datasetinfo = datasetinfo
         self.data = {}
         self._org_map = {}
+        self._org_clean_index = {}
         self._org_lookup = {}
 
     def populate(self):
@@ -39,7 +41,7 @@ class Org(BaseUploader):
             format="csv",
             file_prefix="org",
         )
-        for row in iterator:
+        for row in count_rows_read(iterator):
             org_name = row.get("#x_pattern")
             canonical_org_name = row.get("#org+name")
             if not canonical_org_name:
@@ -49,6 +51,18 @@ class Org(BaseUploader):
             org_acronym = row.get("#org+acronym")
             if org_acronym:
                 self._org_map[org_acronym] = row
+        self._build_clean_index()
+
+    def _build_clean_index(self):
+        # Index org mappings by country and cleaned name. Where cleaned names
+        # clash, the later mapping wins, so keep its position to choose
+        # between the country specific and global (None) mappings
+        self._org_clean_index = {}
+        for position, (org_name, row) in enumerate(self._org_map.items()):
+            country_index = self._org_clean_index.setdefault(
+                row["#country+code"], {}
+            )
+            country_index[clean_name(org_name)] = (position, row)
 
     def add_or_match_org(
         self,
@@ -72,7 +86,15 @@ class Org(BaseUploader):
             )
         ] = (acronym, org_name, org_type)
 
-    def populate_multiple(self):
+    def populate_multiple(self, session: Optional[Session] = None):
+        """Add orgs collected by add_or_match_org to the database.
+
+        Args:
+            session (Optional[Session]): Session to use. Defaults to None (session given in constructor).
+
+        Returns:
+            None
+        """
         org_rows = [
             dict(
                 acronym=values[0],
@@ -81,21 +103,24 @@ class Org(BaseUploader):
             )
             for values in self.data.values()
         ]
-        batch_populate(org_rows, self._session, DBOrg)
+        batch_populate(org_rows, session or self._session, DBOrg)
 
     def get_org_info(self, org_name: str, location: str) -> Dict[str, str]:
-        org_name_map = {
-            on: self._org_map[on]
-            for on in self._org_map
-            if self._org_map[on]["#country+code"] in [location, None]
-        }
-        org_map_info = org_name_map.get(org_name)
+        countries = (location, None)
+        org_map_info = self._org_map.get(org_name)
+        if org_map_info and org_map_info["#country+code"] not in countries:
+            org_map_info = None
         if not org_map_info:
-            org_name_map_clean = {
-                clean_name(on): org_name_map[on] for on in org_name_map
-            }
             org_name_clean = clean_name(org_name)
-            org_map_info = org_name_map_clean.get(org_name_clean)
+            matches = []
+            for country in set(countries):
+                match = self._org_clean_index.get(country, {}).get(
+                    org_name_clean
+                )
+                if match:
+                    matches.append(match)
+            if matches:
+                org_map_info = max(matches, key=lambda x: x[0])[1]
         if not org_map_info:
             return {"#org+name": org_name}
         org_info = {"#org+name": org_map_info["#org+name"]}
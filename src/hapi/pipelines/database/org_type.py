@@ -7,7 +7,9 @@ from hapi_schema.db_org_type import DBOrgType
 from hdx.scraper.utilities.reader import Read
 from sqlalchemy.orm import Session
 
-from ..utilities.mappings import get_code_from_name
+from ..utilities.batch_populate import batch_populate
+from ..utilities.instrumentation import count_rows_read
+from ..utilities.mappings import CodeMatcher
 from .base_uploader import BaseUploader
 
 logger = logging.getLogger(__name__)
@@ -24,23 +26,25 @@ class OrgType(BaseUploader):
         self._datasetinfo = datasetinfo
         self.data = {}
         self._org_type_map = org_type_map
+        self._matcher = CodeMatcher(self.data, self._org_type_map)
 
     def populate(self):
         logger.info("Populating org type table")
+        org_type_rows = []
 
         def parse_org_type_values(code: str, description: str) -> None:
             self.data[description] = code
-            org_type_row = DBOrgType(
+            org_type_row = dict(
                 code=code,
                 description=description,
             )
-            self._session.add(org_type_row)
+            org_type_rows.append(org_type_row)
 
         reader = Read.get_reader()
         headers, iterator = reader.read(
             self._datasetinfo, file_prefix="org_type"
         )
-        for row in iterator:
+        for row in count_rows_read(iterator):
             parse_org_type_values(
                 code=row["#org +type +code +v_hrinfo"],
                 description=row["#org +type +preferred"],
@@ -58,14 +62,11 @@ class OrgType(BaseUploader):
                 description=extra_entries[code],
             )
 
-        self._session.commit()
+        self._matcher.invalidate()
+        batch_populate(org_type_rows, self._session, DBOrgType)
 
     def get_org_type_code(self, org_type: str) -> str:
-        org_type_code, name_clean, add = get_code_from_name(
-            name=org_type,
-            code_lookup=self.data,
-            code_mapping=self._org_type_map,
-        )
+        org_type_code, name_clean, add = self._matcher.get_code(org_type)
         if add:
-            self._org_type_map[name_clean] = org_type_code
+            self._matcher.add_mapping(name_clean, org_type_code)
         return org_type_code
@@ -7,6 +7,7 @@ from typing import Dict
 from hapi_schema.db_population import DBPopulation
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
 from ..utilities.parse_tags import (
     get_gender_and_age_range,
     get_min_and_max_age,
@@ -37,6 +38,7 @@ class Population(BaseUploader):
 
     def populate(self):
         logger.info("Populating population table")
+        population_rows = []
         for dataset in self._results.values():
             time_period_start = dataset["time_period"]["start"]
             time_period_end = dataset["time_period"]["end"]
@@ -58,7 +60,7 @@ class Population(BaseUploader):
                         admin2_code = admins.get_admin2_code_based_on_level(
                             admin_code=admin_code, admin_level=admin_level
                         )
-                        population_row = DBPopulation(
+                        population_row = dict(
                             resource_hdx_id=resource_id,
                             admin2_ref=self._admins.admin2_data[admin2_code],
                             gender=gender,
@@ -69,9 +71,8 @@ class Population(BaseUploader):
                             reference_period_start=time_period_start,
                             reference_period_end=time_period_end,
                         )
-
-                        self._session.add(population_row)
-        self._session.commit()
+                        population_rows.append(population_row)
+        batch_populate(population_rows, self._session, DBPopulation)
 
 
 def _validate_gender_and_age_range_hxl_tag(hxl_tag: str) -> bool:
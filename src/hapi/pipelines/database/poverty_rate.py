@@ -8,6 +8,7 @@ from typing import Dict
 from hapi_schema.db_poverty_rate import DBPovertyRate
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
 from . import admins
 from .admins import get_admin1_code_based_on_level
 from .base_uploader import BaseUploader
@@ -35,6 +36,7 @@ class PovertyRate(BaseUploader):
 
     def populate(self):
         logger.info("Populating poverty rate table")
+        poverty_rate_rows = []
         # Loop through datasets (countries)
         for dataset in self._results.values():
             # There is only one admin level, so no need to loop, just take the national level for now,
@@ -77,7 +79,7 @@ class PovertyRate(BaseUploader):
                     reference_period_start, reference_period_end = (
                         _convert_year_to_reference_period(year=year)
                     )
-                    row = DBPovertyRate(
+                    row = dict(
                         resource_hdx_id=resource_id,
                         admin1_name=admin1_name,
                         admin1_ref=admin1_ref,
@@ -103,8 +105,8 @@ class PovertyRate(BaseUploader):
                             hxl_tags.index("#poverty+severe+t0")
                         ][admin0_code][irow],
                     )
-                    self._session.add(row)
-        self._session.commit()
+                    poverty_rate_rows.append(row)
+        batch_populate(poverty_rate_rows, self._session, DBPovertyRate)
 
 
 def _convert_year_to_reference_period(year: str) -> [date, date]:
@@ -8,6 +8,7 @@ from hdx.utilities.dateparse import parse_date
 from hdx.utilities.dictandlist import dict_of_lists_add
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
 from ..utilities.parse_tags import (
     get_gender_and_age_range,
     get_min_and_max_age,
@@ -34,6 +35,7 @@ class Refugees(BaseUploader):
 
     def populate(self):
         logger.info("Populating refugees table")
+        refugees_rows = []
         for dataset in self._results.values():
             for admin_level, admin_results in dataset["results"].items():
                 resource_id = admin_results["hapi_resource_metadata"]["hdx_id"]
@@ -78,7 +80,7 @@ class Refugees(BaseUploader):
                             )
 
                     for key in rows:
-                        refugees_row = DBRefugees(
+                        refugees_row = dict(
                             resource_hdx_id=resource_id,
                             origin_location_ref=self._locations.data[key[0]],
                             asylum_location_ref=self._locations.data[key[1]],
@@ -95,6 +97,5 @@ class Refugees(BaseUploader):
                                 f"{key[3]}-12-31", "%Y-%m-%d"
                             ),
                         )
-
-                        self._session.add(refugees_row)
-        self._session.commit()
+                        refugees_rows.append(refugees_row)
+        batch_populate(refugees_rows, self._session, DBRefugees)
@@ -8,7 +8,9 @@ from hdx.scraper.utilities.reader import Read
 from hxl import TagPattern
 from sqlalchemy.orm import Session
 
-from ..utilities.mappings import get_code_from_name
+from ..utilities.batch_populate import batch_populate
+from ..utilities.instrumentation import count_rows_read
+from ..utilities.mappings import CodeMatcher
 from .base_uploader import BaseUploader
 
 logger = logging.getLogger(__name__)
@@ -25,10 +27,12 @@ class Sector(BaseUploader):
         self._datasetinfo = datasetinfo
         self.data = {}
         self._sector_map = sector_map
+        self._matcher = CodeMatcher(self.data, self._sector_map)
         self.pattern_to_code = {}
 
     def populate(self):
         logger.info("Populating sector table")
+        sector_rows = []
 
         def parse_sector_values(code: str, name: str):
             if code != "intersectoral":
@@ -37,17 +41,17 @@ class Sector(BaseUploader):
                 pattern = code.lower().replace("-", "_")
                 pattern = TagPattern.parse(f"#*+{pattern}")
                 self.pattern_to_code[pattern] = code
-            sector_row = DBSector(
+            sector_row = dict(
                 code=code,
                 name=name,
             )
-            self._session.add(sector_row)
+            sector_rows.append(sector_row)
 
         reader = Read.get_reader()
         headers, iterator = reader.read(
             self._datasetinfo, file_prefix="sector"
         )
-        for row in iterator:
+        for row in count_rows_read(iterator):
             parse_sector_values(
                 code=row["#sector +code +acronym"],
                 name=row["#sector +name +preferred +i_en"],
@@ -62,14 +66,11 @@ class Sector(BaseUploader):
         for code, name in extra_entries.items():
             parse_sector_values(code=code, name=name)
 
-        self._session.commit()
+        self._matcher.invalidate()
+        batch_populate(sector_rows, self._session, DBSector)
 
     def get_sector_code(self, sector: str) -> str:
-        sector_code, name_clean, add = get_code_from_name(
-            name=sector,
-            code_lookup=self.data,
-            code_mapping=self._sector_map,
-        )
+        sector_code, name_clean, add = self._matcher.get_code(sector)
         if add:
-            self._sector_map[name_clean] = sector_code
+            self._matcher.add_mapping(name_clean, sector_code)
         return sector_code
@@ -8,6 +8,8 @@ from hapi_schema.utils.enums import CommodityCategory
 from hdx.scraper.utilities.reader import Read
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
+from ..utilities.instrumentation import count_rows_read
 from .base_uploader import BaseUploader
 
 logger = getLogger(__name__)
@@ -28,18 +30,17 @@ class WFPCommodity(BaseUploader):
         reader = Read.get_reader("hdx")
         headers, iterator = reader.read(datasetinfo=self._datasetinfo)
         next(iterator)  # ignore HXL hashtags
-        for commodity in iterator:
+        commodity_rows = []
+        for commodity in count_rows_read(iterator):
             code = commodity["commodity_id"]
             category = CommodityCategory(commodity["category"])
             name = commodity["commodity"]
 
-            commodity_row = DBWFPCommodity(
-                code=code, category=category, name=name
-            )
+            commodity_row = dict(code=code, category=category, name=name)
             self.data[name] = code
             self.data[code] = name
-            self._session.add(commodity_row)
-        self._session.commit()
+            commodity_rows.append(commodity_row)
+        batch_populate(commodity_rows, self._session, DBWFPCommodity)
 
     def get_commodity_code(self, commodity: str) -> Optional[str]:
         return self.data.get(commodity)
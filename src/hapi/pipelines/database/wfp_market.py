@@ -9,6 +9,8 @@ from hdx.scraper.utilities.reader import Read
 from hdx.utilities.dictandlist import dict_of_dicts_add
 from sqlalchemy.orm import Session
 
+from ..utilities.batch_populate import batch_populate
+from ..utilities.instrumentation import count_rows_read
 from ..utilities.logging_helpers import add_missing_value_message
 from . import admins
 from .base_uploader import BaseUploader
@@ -42,7 +44,8 @@ class WFPMarket(BaseUploader):
         warnings = set()
         errors = set()
         next(iterator)  # ignore HXL hashtags
-        for market in iterator:
+        market_rows = []
+        for market in count_rows_read(iterator):
             countryiso3 = market["countryiso3"]
             if countryiso3 not in self._countryiso3s:
                 continue
@@ -81,11 +84,11 @@ class WFPMarket(BaseUploader):
             lon = market["longitude"]
             dict_of_dicts_add(self.name_to_code, countryiso3, name, code)
             self.data[code] = name
-            market_row = DBWFPMarket(
+            market_row = dict(
                 code=code, admin2_ref=ref, name=name, lat=lat, lon=lon
             )
-            self._session.add(market_row)
-        self._session.commit()
+            market_rows.append(market_row)
+        batch_populate(market_rows, self._session, DBWFPMarket)
         for warning in sorted(warnings):
             logger.warning(warning)
         for error in sorted(errors):
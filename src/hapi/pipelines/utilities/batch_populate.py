@@ -1,17 +1,562 @@
-from typing import Dict, List
+"""Load rows into database tables in bulk.
 
-from sqlalchemy import insert
+On PostgreSQL with the psycopg driver, rows are streamed into the table with
+COPY ... FROM STDIN using either CSV or binary framing. On other databases
+(eg. SQLite), rows are inserted with executemany in batches. COPY runs on the
+raw psycopg cursor, bypassing the events of the engine, so functions that
+need to know about it (eg. the SQL profiler) can be added with
+add_copy_listener.
+
+When the session is in incremental mode (see set_incremental), the database
+is not recreated on each run, so rather than appending rows, the rows of a
+table are reconciled with the rows supplied. Rows are matched on the
+table's primary key a batch at a time: new rows are inserted, changed rows
+are updated and unchanged rows are left alone. For tables with a
+resource_hdx_id column, rows of the supplied resources that are no longer
+present are deleted, while delete_stale_resources removes the rows of
+resources that are no longer loaded at all.
+
+When a sink is set on the session (see set_sink and utilities/sinks.py), rows
+are written to the sink (eg. files or nowhere) instead of the database.
+"""
+
+import logging
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from enum import Enum
+from itertools import chain, islice
+from time import perf_counter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from hdx.utilities.dateparse import parse_date
+from hdx.utilities.typehint import ListTuple
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    Integer,
+    Numeric,
+    SmallInteger,
+    Table,
+    delete,
+    insert,
+    select,
+    tuple_,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
+from .instrumentation import instrumentation
+
+if TYPE_CHECKING:
+    from .sinks import Sink
+
+logger = logging.getLogger(__name__)
+
 _BATCH_SIZE = 1000
 
+COPY_FORMATS = ("csv", "binary")
+_COPY_FORMATS_LITERAL = Literal["csv", "binary"]
+
+# Functions called with table name, number of rows and duration of each COPY
+_copy_listeners: List[Callable[[str, int, float], None]] = []
+
+
+def batch_populate(
+    rows: Iterable[Union[Dict, Sequence]],
+    session: Session,
+    DBTable,
+    copy_format: _COPY_FORMATS_LITERAL = "csv",
+    commit: bool = True,
+    column_names: Optional[ListTuple[str]] = None,
+) -> int:
+    """Add rows to a table in bulk and commit. Rows are dictionaries mapping
+    column names to values and must all have the same keys. Rows can be a
+    list or any other iterable (eg. a generator) which is consumed in batches
+    of _BATCH_SIZE rows. If column_names is given, rows are instead tuples of
+    values in the order of column_names, which take less memory than
+    dictionaries and are only converted to dictionaries a batch at a time.
+
+    Args:
+        rows (Iterable[Dict]): Rows to add
+        session (Session): Session to use
+        DBTable: Table class eg. DBPopulation
+        copy_format (str): Framing to use with COPY: "csv" or "binary". Defaults to "csv".
+        commit (bool): Whether to commit once rows are added. Defaults to True.
+        column_names (Optional[ListTuple[str]]): Column names if rows are tuples. Defaults to None.
+
+    Returns:
+        int: Number of rows added (or inserted and updated in incremental mode)
+    """
+    if copy_format not in COPY_FORMATS:
+        raise ValueError(f"Copy format must be one of {COPY_FORMATS}")
+    iterator = iter(rows)
+    if column_names is not None:
+        iterator = (dict(zip(column_names, row)) for row in iterator)
+    first_row = next(iterator, None)
+    if first_row is None:
+        if commit:
+            session.commit()
+        return 0
+    iterator = chain((first_row,), iterator)
+    sink = get_sink(session)
+    if sink is None:
+        no_rows = write_rows(iterator, session, DBTable, copy_format)
+    else:
+        no_rows = sink.write(session, get_table(DBTable), iterator)
+    instrumentation.add_count("rows_written", no_rows)
+    if commit:
+        session.commit()
+    return no_rows
+
+
+def write_rows(
+    rows: Iterator[Dict],
+    session: Session,
+    DBTable,
+    copy_format: _COPY_FORMATS_LITERAL = "csv",
+) -> int:
+    """Write rows to a table in the database without committing, using
+    COPY where supported or reconciling them with existing rows in
+    incremental mode.
+
+    Args:
+        rows (Iterator[Dict]): Rows to write
+        session (Session): Session to use
+        DBTable: Table class eg. DBPopulation
+        copy_format (str): Framing to use with COPY: "csv" or "binary". Defaults to "csv".
+
+    Returns:
+        int: Number of rows written (or inserted and updated in incremental mode)
+    """
+    table = get_table(DBTable)
+    if is_incremental(session):
+        return _upsert_rows(rows, session, table)
+    if supports_copy(session):
+        return _copy_rows(rows, session, table, copy_format)
+    no_rows = 0
+    for batch_rows in get_batches(rows):
+        session.execute(insert(table), batch_rows)
+        no_rows += len(batch_rows)
+    return no_rows
+
+
+def set_incremental(session: Session, incremental: bool = True) -> None:
+    """Set whether rows should be reconciled with existing rows in the
+    database (incremental mode) rather than added to empty tables.
+
+    Args:
+        session (Session): Session to use
+        incremental (bool): Whether to use incremental mode. Defaults to True.
+
+    Returns:
+        None
+    """
+    session.info["incremental"] = incremental
+
+
+def is_incremental(session: Session) -> bool:
+    """Whether the session is in incremental mode.
+
+    Args:
+        session (Session): Session to use
+
+    Returns:
+        bool: True if in incremental mode, False if not
+    """
+    return session.info.get("incremental", False)
+
+
+def set_sink(session: Session, sink: Optional["Sink"]) -> None:
+    """Set the sink to which rows are written instead of the database.
+
+    Args:
+        session (Session): Session to use
+        sink (Optional[Sink]): Sink or None to write to the database
+
+    Returns:
+        None
+    """
+    session.info["sink"] = sink
+
+
+def get_sink(session: Session) -> Optional["Sink"]:
+    """Get the sink to which rows are written instead of the database.
+
+    Args:
+        session (Session): Session to use
+
+    Returns:
+        Optional[Sink]: Sink or None if rows are written to the database
+    """
+    return session.info.get("sink")
+
+
+def add_copy_listener(listener: Callable[[str, int, float], None]) -> None:
+    """Add a function to be called after each COPY with the table name,
+    number of rows and duration in seconds. It is called in the thread that
+    ran the COPY.
+
+    Args:
+        listener (Callable[[str, int, float], None]): Function to call
+
+    Returns:
+        None
+    """
+    _copy_listeners.append(listener)
+
+
+def remove_copy_listener(
+    listener: Callable[[str, int, float], None],
+) -> None:
+    """Remove a function added with add_copy_listener.
+
+    Args:
+        listener (Callable[[str, int, float], None]): Function to remove
+
+    Returns:
+        None
+    """
+    _copy_listeners.remove(listener)
 
-def batch_populate(rows: List[Dict], session: Session, DBTable):
-    batches = range(len(rows) // _BATCH_SIZE + 1)
-    for batch in batches:
-        start_row = batch * _BATCH_SIZE
-        end_row = start_row + _BATCH_SIZE
-        batch_rows = rows[start_row:end_row]
-        session.execute(insert(DBTable), batch_rows)
+
+def supports_copy(session: Session) -> bool:
+    """Whether the database behind the session can be loaded using COPY.
+
+    Args:
+        session (Session): Session to use
+
+    Returns:
+        bool: True if COPY can be used, False if not
+    """
+    dialect = session.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg"
+
+
+def get_table(DBTable) -> Table:
+    """Get the table of an ORM class.
+
+    Args:
+        DBTable: ORM class or table
+
+    Returns:
+        Table: Table
+    """
+    return getattr(DBTable, "__table__", DBTable)
+
+
+def get_batches(iterator: Iterator[Dict]) -> Iterator[List[Dict]]:
+    """Split rows into batches of the batch size used to load tables.
+
+    Args:
+        iterator (Iterator[Dict]): Rows
+
+    Returns:
+        Iterator[List[Dict]]: Batches of rows
+    """
+    while True:
+        batch_rows = list(islice(iterator, _BATCH_SIZE))
+        if not batch_rows:
+            return
+        yield batch_rows
+
+
+def get_typed_value(column: Column, value: Any) -> Any:
+    """Convert a value to the Python type of a column eg. for COPY in
+    binary format or for Parquet.
+
+    Args:
+        column (Column): Column
+        value (Any): Value
+
+    Returns:
+        Any: Value of column type or None
+    """
+    value = _get_value(value)
+    if value is None:
+        return None
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        return bool(value)
+    if isinstance(column_type, Integer):
+        return int(value)
+    if isinstance(column_type, Float):
+        return float(value)
+    if isinstance(column_type, Numeric):
+        return Decimal(str(value))
+    if isinstance(column_type, DateTime):
+        if isinstance(value, str):
+            value = _get_value(parse_date(value))
+        elif not isinstance(value, datetime):
+            value = datetime(value.year, value.month, value.day)
+        if column_type.timezone:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+    if isinstance(column_type, Date):
+        return value
+    return str(value)
+
+
+def _copy_rows(
+    iterator: Iterator[Dict],
+    session: Session,
+    table: Table,
+    copy_format: _COPY_FORMATS_LITERAL,
+) -> int:
+    batches = get_batches(iterator)
+    batch_rows = next(batches)
+    column_names = list(batch_rows[0].keys())
+    columns = [table.columns[name] for name in column_names]
+    preparer = session.get_bind().dialect.identifier_preparer
+    quoted_columns = ", ".join(preparer.quote(name) for name in column_names)
+    sql = (
+        f"COPY {preparer.format_table(table)} ({quoted_columns}) "
+        f"FROM STDIN (FORMAT {copy_format})"
+    )
+    no_rows = 0
+    start = perf_counter()
+    # Run COPY on the session's connection so it is part of its transaction
+    cursor = session.connection().connection.cursor()
+    try:
+        with cursor.copy(sql) as copy:
+            if copy_format == "binary":
+                copy.set_types(
+                    [_get_binary_type(column) for column in columns]
+                )
+            for batch_rows in chain((batch_rows,), batches):
+                if copy_format == "binary":
+                    for row in batch_rows:
+                        copy.write_row(
+                            [
+                                get_typed_value(column, row.get(name))
+                                for name, column in zip(column_names, columns)
+                            ]
+                        )
+                else:
+                    copy.write(
+                        "".join(
+                            _get_csv_line([row.get(x) for x in column_names])
+                            for row in batch_rows
+                        )
+                    )
+                no_rows += len(batch_rows)
+    finally:
+        cursor.close()
+    # COPY bypasses engine events so isn't counted by instrumentation
+    instrumentation.add_count("round_trips", 1)
+    duration = perf_counter() - start
+    for listener in list(_copy_listeners):
+        listener(table.name, no_rows, duration)
+    return no_rows
+
+
+def _upsert_rows(
+    iterator: Iterator[Dict], session: Session, table: Table
+) -> int:
+    batches = get_batches(iterator)
+    batch_rows = next(batches)
+    column_names = list(batch_rows[0].keys())
+    key_columns = list(table.primary_key.columns)
+    key_names = [column.name for column in key_columns]
+    columns = [table.columns[name] for name in column_names]
+    resource_column = table.columns.get("resource_hdx_id")
+    if "resource_hdx_id" not in column_names:
+        resource_column = None
+
+    def get_key(row: Dict) -> Tuple:
+        return tuple(
+            get_typed_value(column, row.get(column.name))
+            for column in key_columns
+        )
+
+    def get_values(row: Dict) -> Tuple:
+        return tuple(
+            get_typed_value(column, row.get(column.name)) for column in columns
+        )
+
+    statement = _get_upsert(session, table)
+    update_names = [x for x in column_names if x not in key_names]
+    if update_names:
+        statement = statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={x: statement.excluded[x] for x in update_names},
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(
+            index_elements=key_columns
+        )
+
+    # Compare each batch with the existing rows that have the same keys so
+    # that only a batch of rows and the keys seen are held in memory
+    no_rows = 0
+    no_changed = 0
+    keys = set()
+    resource_ids = set()
+    for batch_rows in chain((batch_rows,), batches):
+        batch_keys = [get_key(row) for row in batch_rows]
+        results = session.execute(
+            select(*columns).where(tuple_(*key_columns).in_(batch_keys))
+        )
+        existing = {
+            get_key(existing_row): get_values(existing_row)
+            for existing_row in results.mappings()
+        }
+        changed_rows = [
+            row
+            for key, row in zip(batch_keys, batch_rows)
+            if existing.get(key) != get_values(row)
+        ]
+        if changed_rows:
+            session.execute(statement, changed_rows)
+        keys.update(batch_keys)
+        if resource_column is not None:
+            resource_ids.update(row["resource_hdx_id"] for row in batch_rows)
+        no_rows += len(batch_rows)
+        no_changed += len(changed_rows)
+
+    # Rows of the resources loaded that are no longer present are stale.
+    # Resources that are no longer loaded at all are removed by
+    # delete_stale_resources once their theme has run.
+    no_deleted = 0
+    if resource_ids:
+        results = session.execute(
+            select(*key_columns).where(resource_column.in_(resource_ids))
+        )
+        stale_keys = [
+            key for key in map(get_key, results.mappings()) if key not in keys
+        ]
+        for i in range(0, len(stale_keys), _BATCH_SIZE):
+            batch_keys = stale_keys[i : i + _BATCH_SIZE]
+            session.execute(
+                delete(table).where(tuple_(*key_columns).in_(batch_keys))
+            )
+        no_deleted = len(stale_keys)
+    logger.info(
+        f"{table.name}: {no_changed} rows inserted or updated, "
+        f"{no_rows - no_changed} unchanged, {no_deleted} deleted"
+    )
+    return no_changed
+
+
+def delete_stale_resources(
+    session: Session, DBTable, resource_ids: Iterable[str]
+) -> int:
+    """Delete the rows of a table that belong to resources other than those
+    given (in incremental mode, the resources loaded or left unchanged by
+    the current run) and commit. This removes rows of resources that are no
+    longer produced, which are not seen when rows are reconciled.
+
+    Args:
+        session (Session): Session to use
+        DBTable: Table class eg. DBPopulation
+        resource_ids (Iterable[str]): Resources whose rows to keep
+
+    Returns:
+        int: Number of rows deleted
+    """
+    table = get_table(DBTable)
+    resource_column = table.columns["resource_hdx_id"]
+    resource_ids = set(resource_ids)
+    results = session.execute(select(resource_column).distinct())
+    stale_ids = sorted(x for x in results.scalars() if x not in resource_ids)
+    no_deleted = 0
+    for i in range(0, len(stale_ids), _BATCH_SIZE):
+        result = session.execute(
+            delete(table).where(
+                resource_column.in_(stale_ids[i : i + _BATCH_SIZE])
+            )
+        )
+        no_deleted += result.rowcount
     session.commit()
-    return
+    if stale_ids:
+        logger.info(
+            f"{table.name}: {no_deleted} rows of {len(stale_ids)} resources "
+            f"no longer loaded deleted"
+        )
+    return no_deleted
+
+
+def _get_upsert(session: Session, table: Table):
+    dialect_name = session.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        return postgresql.insert(table)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table)
+    raise ValueError(f"Incremental mode not supported for {dialect_name}!")
+
+
+def _get_value(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime) and value.tzinfo:
+        # Columns are timezoneless and store UTC
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _get_csv_field(value) -> str:
+    value = _get_value(value)
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        # Give the offset so that timestamptz columns do not depend upon the
+        # session time zone: it is ignored by timestamp columns
+        return f"{value}+00:00"
+    if isinstance(value, (date, int, float, Decimal)):
+        return str(value)
+    # Quote all strings so that empty strings are not read as NULL
+    value = str(value).replace('"', '""')
+    return f'"{value}"'
+
+
+def _get_csv_line(values: List) -> str:
+    """Get a line of CSV for COPY ... (FORMAT csv) where NULL is an unquoted
+    empty field.
+
+    Args:
+        values (List): Values for a row
+
+    Returns:
+        str: Line of CSV
+    """
+    return f"{','.join(_get_csv_field(value) for value in values)}\n"
+
+
+def _get_binary_type(column) -> str:
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        return "bool"
+    if isinstance(column_type, BigInteger):
+        return "int8"
+    if isinstance(column_type, SmallInteger):
+        return "int2"
+    if isinstance(column_type, Integer):
+        return "int4"
+    if isinstance(column_type, Float):
+        return "float8"
+    if isinstance(column_type, Numeric):
+        return "numeric"
+    if isinstance(column_type, DateTime):
+        return "timestamptz" if column_type.timezone else "timestamp"
+    if isinstance(column_type, Date):
+        return "date"
+    # Strings and enums have the same binary representation as text
+    return "text"
@@ -0,0 +1,251 @@
+"""Export the HAPI views to gzipped CSV files with hashes.
+
+The layout is that of the database export branch: for each view,
+<folder>/<view>.csv.gz holds the view as CSV with a header and
+<folder>/<view>.hash holds the MD5 hash of the uncompressed CSV. Each view is
+read with COPY on its own pooled connection, several views at once, and the
+chunks are streamed to a gzip thread and a hashing thread so that
+compression, hashing and reading overlap.
+
+Views whose hash matches the one from the previous export are skipped: when
+there is a previous hash, they are first read with only hashing, which
+avoids compressing and writing them, so that the cost of an export grows
+with what changed rather than with the size of the database. Only views that
+changed are read a second time to be compressed and written.
+"""
+
+import gzip
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from os import makedirs, replace
+from os.path import exists, join
+from queue import Queue
+from threading import Thread
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from hdx.utilities.typehint import ListTuple
+from sqlalchemy import Engine, inspect
+
+from .files import write_atomically
+
+logger = logging.getLogger(__name__)
+
+
+class _ChunkThread:
+    """Thread that calls a function on each chunk put to it. Once the
+    function has failed, remaining chunks are discarded so that the producer
+    is never blocked."""
+
+    def __init__(self, function: Callable[[bytes], None], maxsize: int = 64):
+        self._function = function
+        self._queue: Queue = Queue(maxsize)
+        self._exception: Optional[BaseException] = None
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self._exception is not None:
+                continue
+            try:
+                self._function(chunk)
+            except BaseException as ex:
+                self._exception = ex
+
+    def put(self, chunk: bytes) -> None:
+        self._queue.put(chunk)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        if self._exception is not None:
+            raise self._exception
+
+
+def fan_out(
+    chunks: Iterable[bytes], functions: ListTuple[Callable[[bytes], None]]
+) -> int:
+    """Call each function on every chunk, each function on its own thread.
+
+    Args:
+        chunks (Iterable[bytes]): Chunks of data
+        functions (ListTuple[Callable[[bytes], None]]): Functions to call on chunks
+
+    Returns:
+        int: Number of bytes
+    """
+    threads = [_ChunkThread(function) for function in functions]
+    no_bytes = 0
+    try:
+        for chunk in chunks:
+            for thread in threads:
+                thread.put(chunk)
+            no_bytes += len(chunk)
+    finally:
+        for thread in threads:
+            thread.close()
+    return no_bytes
+
+
+class CSVExport:
+    """Export views to gzipped CSV files with hashes. Requires PostgreSQL
+    with the psycopg driver.
+
+    Args:
+        engine (Engine): Engine of database with a pool of at least workers connections
+        folder (str): Folder in which to write files
+        workers (int): Number of views to export at once. Defaults to 4.
+        compresslevel (int): Gzip compression level. Defaults to 6.
+        force (bool): Whether to export views even if unchanged. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        folder: str,
+        workers: int = 4,
+        compresslevel: int = 6,
+        force: bool = False,
+    ):
+        dialect = engine.dialect
+        if dialect.name != "postgresql" or dialect.driver != "psycopg":
+            raise ValueError(
+                "CSV export requires PostgreSQL with the psycopg driver!"
+            )
+        self._engine = engine
+        self._folder = folder
+        self._workers = workers
+        self._compresslevel = compresslevel
+        self._force = force
+
+    def get_view_names(self) -> List[str]:
+        """Get the names of the views in the database.
+
+        Returns:
+            List[str]: Names of views
+        """
+        return sorted(inspect(self._engine).get_view_names())
+
+    def get_csv_path(self, view: str) -> str:
+        """Get the path of the gzipped CSV file for a view.
+
+        Args:
+            view (str): Name of view
+
+        Returns:
+            str: Path of file
+        """
+        return join(self._folder, f"{view}.csv.gz")
+
+    def get_hash_path(self, view: str) -> str:
+        """Get the path of the hash file for a view.
+
+        Args:
+            view (str): Name of view
+
+        Returns:
+            str: Path of file
+        """
+        return join(self._folder, f"{view}.hash")
+
+    def get_previous_hash(self, view: str) -> Optional[str]:
+        """Get the hash of a view from the previous export.
+
+        Args:
+            view (str): Name of view
+
+        Returns:
+            Optional[str]: Hash or None if view was not exported
+        """
+        try:
+            with open(self.get_hash_path(view)) as file:
+                return file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _copy(self, view: str) -> Iterator[bytes]:
+        quoted_view = self._engine.dialect.identifier_preparer.quote(view)
+        sql = f"COPY (SELECT * FROM {quoted_view}) TO STDOUT (FORMAT csv, HEADER)"
+        connection = self._engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            try:
+                with cursor.copy(sql) as copy:
+                    for chunk in copy:
+                        yield bytes(chunk)
+            finally:
+                cursor.close()
+        finally:
+            connection.close()
+
+    def export_one(self, view: str) -> bool:
+        """Export a view unless its hash matches the previous export, which
+        is checked by reading the view with only hashing. The CSV is written
+        under a temporary name and moved into place when complete, followed
+        by the hash.
+
+        Args:
+            view (str): Name of view
+
+        Returns:
+            bool: True if view was exported, False if unchanged
+        """
+        start = perf_counter()
+        csv_path = self.get_csv_path(view)
+        previous_hash = None if self._force else self.get_previous_hash(view)
+        if previous_hash and exists(csv_path):
+            md5 = hashlib.md5()
+            fan_out(self._copy(view), (md5.update,))
+            if md5.hexdigest() == previous_hash:
+                logger.info(f"Skipped {view}: unchanged")
+                return False
+        part_path = f"{csv_path}.part"
+        md5 = hashlib.md5()
+        with open(part_path, "wb") as file:
+            # No filename or timestamp so that unchanged data gives the
+            # same file
+            with gzip.GzipFile(
+                filename="",
+                mode="wb",
+                compresslevel=self._compresslevel,
+                fileobj=file,
+                mtime=0,
+            ) as gzip_file:
+                no_bytes = fan_out(
+                    self._copy(view), (gzip_file.write, md5.update)
+                )
+        replace(part_path, csv_path)
+        write_atomically(self.get_hash_path(view), f"{md5.hexdigest()}\n")
+        logger.info(
+            f"Exported {view}: {no_bytes} bytes in "
+            f"{perf_counter() - start:.1f}s"
+        )
+        return True
+
+    def export(
+        self, views: Optional[ListTuple[str]] = None
+    ) -> Dict[str, bool]:
+        """Export views concurrently, skipping those that are unchanged.
+
+        Args:
+            views (Optional[ListTuple[str]]): Views to export. Defaults to None (all).
+
+        Returns:
+            Dict[str, bool]: View to whether it was exported (False if unchanged)
+        """
+        makedirs(self._folder, exist_ok=True)
+        if views is None:
+            views = self.get_view_names()
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            exported = dict(zip(views, executor.map(self.export_one, views)))
+        no_exported = sum(exported.values())
+        logger.info(
+            f"Exported {no_exported} views, "
+            f"{len(exported) - no_exported} unchanged"
+        )
+        return exported
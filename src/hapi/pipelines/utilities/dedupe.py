@@ -0,0 +1,85 @@
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+from hdx.utilities.typehint import ListTuple
+
+from .logging_helpers import add_message
+
+
+class Dedupe:
+    """Detect duplicate rows by hashing their key fields into a set rather
+    than comparing each row with all previous rows. Duplicates are counted
+    per identifier (usually a dataset name) so that they can be reported.
+
+    Args:
+        key_fields (Optional[ListTuple[str]]): Fields identifying a row. Defaults to None (all fields).
+    """
+
+    def __init__(self, key_fields: Optional[ListTuple[str]] = None):
+        self._key_fields = key_fields
+        self._seen: Set[Tuple[Hashable, ...]] = set()
+        self.duplicates: Dict[str, int] = {}
+
+    def get_key(self, row: Dict) -> Tuple[Hashable, ...]:
+        """Get the hashable key of a row.
+
+        Args:
+            row (Dict): Row
+
+        Returns:
+            Tuple[Hashable, ...]: Key of row
+        """
+        if self._key_fields is None:
+            return tuple(row.items())
+        return tuple(row.get(field) for field in self._key_fields)
+
+    def is_duplicate(self, row: Dict, identifier: str = "") -> bool:
+        """Check if a row has been seen before, recording it if not and
+        counting it against the identifier if it has.
+
+        Args:
+            row (Dict): Row
+            identifier (str): Identifier eg. dataset name. Defaults to "".
+
+        Returns:
+            bool: True if row is a duplicate, False if not
+        """
+        key = self.get_key(row)
+        if key in self._seen:
+            self.duplicates[identifier] = (
+                self.duplicates.get(identifier, 0) + 1
+            )
+            return True
+        self._seen.add(key)
+        return False
+
+    def reset(self) -> None:
+        """Forget rows seen so far so that subsequent rows are only compared
+        with each other. Duplicate counts are kept.
+
+        Returns:
+            None
+        """
+        self._seen.clear()
+
+    @property
+    def number_duplicates(self) -> int:
+        """Total number of duplicates found.
+
+        Returns:
+            int: Number of duplicates
+        """
+        return sum(self.duplicates.values())
+
+    def add_messages(self, messages: Set[str]) -> None:
+        """Add a message for each identifier with duplicates in the form:
+
+            identifier - n duplicate rows
+
+        Args:
+            messages (Set[str]): Set of messages to which to add messages
+
+        Returns:
+            None
+        """
+        for identifier, number in self.duplicates.items():
+            add_message(messages, identifier, f"{number} duplicate rows")
@@ -0,0 +1,143 @@
+"""Defer secondary indexes and foreign keys until tables have been loaded.
+
+The HAPI tables are created with their indexes and foreign keys, so every
+row loaded pays for index maintenance and foreign key checks. With the bulk
+load profile, once the (empty) tables have been created, their secondary
+indexes and foreign keys are dropped and their definitions kept. When all
+themes have been loaded, the indexes are built concurrently on separate
+connections and the foreign keys are added back without checking existing
+rows (NOT VALID) then validated, which checks all rows of a table at once.
+Primary keys and unique constraints are kept since loading relies on them.
+"""
+
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Connection, Engine, text
+
+logger = logging.getLogger(__name__)
+
+LOAD_PROFILES = ("default", "bulk")
+
+_INDEXES_QUERY = """
+SELECT c.relname, i.relname, pg_get_indexdef(x.indexrelid)
+FROM pg_index x
+JOIN pg_class c ON c.oid = x.indrelid
+JOIN pg_class i ON i.oid = x.indexrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = current_schema() AND c.relkind = 'r'
+AND NOT EXISTS (
+    SELECT 1 FROM pg_constraint k
+    WHERE k.conindid = x.indexrelid AND k.contype IN ('p', 'u', 'x')
+)
+ORDER BY c.relname, i.relname
+"""
+
+_FOREIGN_KEYS_QUERY = """
+SELECT c.relname, k.conname, pg_get_constraintdef(k.oid)
+FROM pg_constraint k
+JOIN pg_class c ON c.oid = k.conrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = current_schema() AND k.contype = 'f'
+ORDER BY c.relname, k.conname
+"""
+
+
+class DeferredConstraints:
+    def __init__(self, engine: Engine, workers: int = 4):
+        if engine.dialect.name != "postgresql":
+            raise ValueError("The bulk load profile requires PostgreSQL!")
+        if workers < 1:
+            raise ValueError("Number of workers must be at least 1!")
+        self._engine = engine
+        self._workers = workers
+        self.indexes: List[Tuple[str, str, str]] = []
+        self.foreign_keys: List[Tuple[str, str, str]] = []
+
+    def _quote(self, connection: Connection, name: str) -> str:
+        return connection.dialect.identifier_preparer.quote(name)
+
+    def defer(self) -> None:
+        """Drop the secondary indexes and foreign keys of the tables in the
+        current schema, keeping their definitions. Should be called once the
+        tables have been created and before they are loaded.
+
+        Returns:
+            None
+        """
+        with self._engine.begin() as connection:
+            self.foreign_keys = [
+                tuple(x) for x in connection.execute(text(_FOREIGN_KEYS_QUERY))
+            ]
+            for table, name, _ in self.foreign_keys:
+                table = self._quote(connection, table)
+                name = self._quote(connection, name)
+                connection.execute(
+                    text(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+                )
+            # Foreign keys must be dropped first as they can depend on indexes
+            self.indexes = [
+                tuple(x) for x in connection.execute(text(_INDEXES_QUERY))
+            ]
+            for _, name, _ in self.indexes:
+                name = self._quote(connection, name)
+                connection.execute(text(f"DROP INDEX {name}"))
+        logger.info(
+            f"Deferred {len(self.indexes)} indexes and "
+            f"{len(self.foreign_keys)} foreign keys"
+        )
+
+    def _execute(self, statements: List[str]) -> None:
+        with self._engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+
+    def _run_concurrently(self, statement_groups: List[List[str]]) -> None:
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            for future in [
+                executor.submit(self._execute, statements)
+                for statements in statement_groups
+            ]:
+                future.result()
+
+    def restore(self) -> None:
+        """Build the deferred indexes concurrently then add back the foreign
+        keys and validate them, one table per worker.
+
+        Returns:
+            None
+        """
+        start = perf_counter()
+        self._run_concurrently(
+            [[definition] for _, _, definition in self.indexes]
+        )
+        logger.info(
+            f"Built {len(self.indexes)} indexes in "
+            f"{perf_counter() - start:.1f}s"
+        )
+        start = perf_counter()
+        table_statements: Dict[str, List[str]] = defaultdict(list)
+        with self._engine.begin() as connection:
+            # Adding a NOT VALID foreign key doesn't check existing rows
+            for table, name, definition in self.foreign_keys:
+                table = self._quote(connection, table)
+                name = self._quote(connection, name)
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table} ADD CONSTRAINT {name} "
+                        f"{definition} NOT VALID"
+                    )
+                )
+                table_statements[table].append(
+                    f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}"
+                )
+        # Validating takes a lock that conflicts with validating another
+        # constraint of the same table, so group validations by table
+        self._run_concurrently(list(table_statements.values()))
+        logger.info(
+            f"Validated {len(self.foreign_keys)} foreign keys in "
+            f"{perf_counter() - start:.1f}s"
+        )
@@ -0,0 +1,327 @@
+"""Persistent cache of downloaded files.
+
+Files downloaded by the readers are kept in a cache folder that persists
+between runs. Each file is stored once under the SHA-256 hash of its content
+(plus its extension so that parsers can tell its format) and an index maps
+urls to files along with the ETag and Last-Modified headers returned by the
+server. When a url is requested again, a conditional request is made and if
+the server responds with 304 Not Modified, the path of the cached file is
+returned without downloading it. When the files in the cache exceed the
+maximum size, the least recently used are deleted.
+
+The index is a SQLite database so that it can be shared by threads and
+processes.
+"""
+
+import logging
+import sqlite3
+from contextlib import closing
+from hashlib import sha256
+from os import makedirs, remove, replace
+from os.path import exists, getsize, join, splitext
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import time
+from typing import Any, Dict, Optional, Set
+from urllib.parse import urlsplit
+
+from hdx.scraper.utilities.reader import Read
+from hdx.utilities.downloader import Download, DownloadError
+from hdx.utilities.path import get_filename_from_url
+
+logger = logging.getLogger(__name__)
+
+# Rate limiting per host given to readers by Read.create_readers by default
+DEFAULT_RATE_LIMIT = {"calls": 1, "period": 0.1}
+
+_CREATE_INDEX = """
+CREATE TABLE IF NOT EXISTS entry (
+    url TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+class DownloadCache:
+    def __init__(self, folder: str, max_size: int = 2 * 1024**3):
+        self.folder = folder
+        self.max_size = max_size
+        makedirs(folder, exist_ok=True)
+        self._index_path = join(folder, "index.sqlite")
+        self._lock = Lock()
+        # Files returned in this process that must not be evicted
+        self._in_use: Set[str] = set()
+        with self._connect() as connection:
+            connection.execute(_CREATE_INDEX)
+            connection.commit()
+
+    def _connect(self) -> closing:
+        return closing(sqlite3.connect(self._index_path, timeout=60))
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Get the cache entry for a url if its file exists.
+
+        Args:
+            url (str): Url
+
+        Returns:
+            Optional[Dict]: Cache entry with keys path, etag and last_modified or None
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT filename, etag, last_modified FROM entry WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        filename, etag, last_modified = row
+        path = join(self.folder, filename)
+        if not exists(path):
+            return None
+        return {"path": path, "etag": etag, "last_modified": last_modified}
+
+    def touch(self, url: str) -> str:
+        """Mark the cache entry for a url as used and return its path.
+
+        Args:
+            url (str): Url
+
+        Returns:
+            str: Path of cached file
+        """
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE entry SET last_access = ? WHERE url = ?",
+                (time(), url),
+            )
+            connection.commit()
+            (filename,) = connection.execute(
+                "SELECT filename FROM entry WHERE url = ?", (url,)
+            ).fetchone()
+        with self._lock:
+            self._in_use.add(filename)
+        return join(self.folder, filename)
+
+    def add(
+        self,
+        url: str,
+        response: Any,
+        extension: str,
+    ) -> str:
+        """Stream a response into the cache, storing it under the hash of its
+        content, and evict the least recently used files if the cache is too
+        large.
+
+        Args:
+            url (str): Url
+            response (Any): Response to stream
+            extension (str): Extension of file eg. .csv
+
+        Returns:
+            str: Path of cached file
+        """
+        content_hash = sha256()
+        size = 0
+        with NamedTemporaryFile(
+            dir=self.folder, suffix=".part", delete=False
+        ) as file:
+            try:
+                for chunk in response.iter_content(chunk_size=10240):
+                    if chunk:  # filter out keep-alive new chunks
+                        file.write(chunk)
+                        content_hash.update(chunk)
+                        size += len(chunk)
+            except Exception:
+                file.close()
+                remove(file.name)
+                raise
+        filename = f"{content_hash.hexdigest()}{extension}"
+        path = join(self.folder, filename)
+        # Same content may already be cached for another url
+        replace(file.name, path)
+        headers = response.headers
+        with self._lock:
+            self._in_use.add(filename)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entry VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    filename,
+                    headers.get("ETag"),
+                    headers.get("Last-Modified"),
+                    size,
+                    time(),
+                ),
+            )
+            connection.commit()
+        self.evict()
+        return path
+
+    def evict(self) -> None:
+        """Delete least recently used files until the cache is no larger
+        than its maximum size. Files used in this process are kept.
+
+        Returns:
+            None
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT filename, MAX(size), MAX(last_access) FROM entry "
+                "GROUP BY filename ORDER BY MAX(last_access)"
+            ).fetchall()
+            total_size = sum(row[1] for row in rows)
+            with self._lock:
+                in_use = set(self._in_use)
+            for filename, size, _ in rows:
+                if total_size <= self.max_size:
+                    break
+                if filename in in_use:
+                    continue
+                connection.execute(
+                    "DELETE FROM entry WHERE filename = ?", (filename,)
+                )
+                try:
+                    remove(join(self.folder, filename))
+                except OSError:
+                    pass
+                total_size -= size
+                logger.info(f"Evicted {filename} from download cache")
+            connection.commit()
+
+    def get_size(self) -> int:
+        """Total size of files in cache.
+
+        Returns:
+            int: Size in bytes
+        """
+        with self._connect() as connection:
+            rows = connection.execute("SELECT DISTINCT filename FROM entry")
+            return sum(
+                getsize(join(self.folder, row[0]))
+                for row in rows
+                if exists(join(self.folder, row[0]))
+            )
+
+
+class CachedDownload(Download):
+    """Download that revalidates files against a DownloadCache using
+    conditional requests rather than always downloading them. POST requests
+    and local files are not cached.
+
+    Args:
+        cache (DownloadCache): Cache to use
+        rate_limit (Optional[Dict]): Rate limiting per host. Defaults to None (no rate limiting).
+        **kwargs: Parameters to pass to Download
+    """
+
+    def __init__(
+        self,
+        cache: DownloadCache,
+        rate_limit: Optional[Dict] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(rate_limit=rate_limit, **kwargs)
+        self.cache = cache
+        self.rate_limit = rate_limit
+
+    def download_file(self, url: str, **kwargs: Any) -> str:
+        if kwargs.get("post") or urlsplit(url).scheme not in (
+            "http",
+            "https",
+        ):
+            return super().download_file(url, **kwargs)
+        cache_url = self.get_url_for_get(url, kwargs.get("parameters"))
+        filename = (
+            kwargs.get("path")
+            or kwargs.get("filename")
+            or get_filename_from_url(url)
+        )
+        extension = splitext(filename)[1]
+        entry = self.cache.get(cache_url)
+        headers = dict(kwargs.get("headers") or {})
+        if entry:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        self.setup(
+            url,
+            stream=True,
+            parameters=kwargs.get("parameters"),
+            timeout=kwargs.get("timeout"),
+            headers=headers,
+            encoding=kwargs.get("encoding"),
+        )
+        try:
+            if entry and self.response.status_code == 304:
+                logger.info(f"Using cached {url}")
+                return self.cache.touch(cache_url)
+            return self.cache.add(cache_url, self.response, extension)
+        except Exception as e:
+            raise DownloadError(
+                f"Download of {url} failed in retrieval of stream!"
+            ) from e
+        finally:
+            self.close_response()
+
+
+def clone_downloader(
+    downloader: Download, rate_limit: Optional[Dict] = None
+) -> Download:
+    """Create a downloader for use in another thread that shares the
+    session (and cache if any) of the given downloader and has the same rate
+    limiting. Downloaders other than those of setup_download_cache don't
+    record their rate limiting, so are taken to have that given to readers
+    by Read.create_readers by default unless rate_limit is given.
+
+    Args:
+        downloader (Download): Downloader to clone
+        rate_limit (Optional[Dict]): Rate limiting per host. Defaults to None (that of downloader).
+
+    Returns:
+        Download: New downloader
+    """
+    if rate_limit is None:
+        rate_limit = getattr(downloader, "rate_limit", DEFAULT_RATE_LIMIT)
+    if isinstance(downloader, CachedDownload):
+        return CachedDownload(
+            downloader.cache,
+            rate_limit=rate_limit,
+            session=downloader.session,
+        )
+    return Download(rate_limit=rate_limit, session=downloader.session)
+
+
+def setup_download_cache(
+    folder: str,
+    max_size: int = 2 * 1024**3,
+    rate_limit: Optional[Dict] = None,
+) -> DownloadCache:
+    """Make all readers download through a persistent cache. Must be called
+    after Read.create_readers. The rate limit should be the one given to
+    Read.create_readers.
+
+    Args:
+        folder (str): Cache folder
+        max_size (int): Maximum size of cache in bytes. Defaults to 2GB.
+        rate_limit (Optional[Dict]): Rate limiting per host. Defaults to None (DEFAULT_RATE_LIMIT).
+
+    Returns:
+        DownloadCache: Download cache
+    """
+    if rate_limit is None:
+        rate_limit = DEFAULT_RATE_LIMIT
+    cache = DownloadCache(folder, max_size)
+    for retriever in Read.retrievers.values():
+        retriever.downloader = CachedDownload(
+            cache,
+            session=retriever.downloader.session,
+            rate_limit=rate_limit,
+        )
+    logger.info(f"Using download cache in {folder}")
+    return cache
@@ -0,0 +1,31 @@
+"""Write files that are read by other processes.
+
+Files such as the run report, the Prometheus textfile, export hashes and
+manifests are read by other processes (eg. the node exporter's textfile
+collector) which must never see a partial file. They are therefore written
+under a temporary name in the same folder and moved into place when
+complete.
+"""
+
+from os import replace
+from os.path import dirname
+from tempfile import NamedTemporaryFile
+
+
+def write_atomically(path: str, text: str) -> None:
+    """Write text to a file under a temporary name in the same folder and
+    move it into place when complete, so that readers see either the old or
+    the new file.
+
+    Args:
+        path (str): Path of file
+        text (str): Text to write
+
+    Returns:
+        None
+    """
+    with NamedTemporaryFile(
+        "w", dir=dirname(path) or ".", suffix=".part", delete=False
+    ) as file:
+        file.write(text)
+    replace(file.name, path)
@@ -0,0 +1,397 @@
+"""Record performance metrics for each stage of a run.
+
+A stage is a block of code such as running the scrapers, outputting a theme
+or populating a table. For each stage, wall time, CPU time, resident memory
+(RSS) at the end of the stage and its change over the stage, peak RSS, rows
+read, rows written, database round trips and bytes downloaded are recorded.
+Stages are nested: the stages active in the current thread are kept in a
+context variable, which is copied to the threads that run themes and
+download files, so counts are added to every active stage.
+For example, rows written by Population.populate also count towards the
+population theme and the output stage.
+
+Round trips are counted from the events of the database engine (COPY, which
+bypasses them, is counted where it is run). Bytes downloaded are counted from
+the Content-Length of responses to the readers' sessions. Rows read and
+written are counted by uploaders as they read source rows and load tables
+(reliable rowcounts aren't available for every statement eg. INSERT ...
+RETURNING on SQLite).
+
+RSS is sampled from /proc/self/statm at the start and end of each stage (0
+where that is unavailable). It is that of the current process only, not of
+worker processes. Peak RSS is the maximum RSS from getrusage at the end of
+the stage, which is the high water mark of the whole process so far, so
+whether the stage raised it is also recorded: that shows stages with short
+allocation spikes that RSS at the end of the stage misses.
+
+When tracemalloc is tracing (eg. in benchmarks), the peak memory allocated
+by Python during each stage, above that allocated when it started, is also
+recorded.
+
+At the end of a run, the stages can be written as a JSON report and as a
+Prometheus textfile for the node exporter's textfile collector.
+"""
+
+import json
+import logging
+import resource
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+from time import perf_counter, process_time, thread_time, time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from hdx.scraper.utilities.reader import Read
+from sqlalchemy import Engine, event
+
+from .files import write_atomically
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("rows_read", "rows_written", "round_trips", "bytes_downloaded")
+
+_active_stages: ContextVar[Tuple["Stage", ...]] = ContextVar(
+    "active_stages", default=()
+)
+
+
+def _get_cpu_time(whole_process: bool) -> float:
+    if not whole_process:
+        return thread_time()
+    # Include worker processes eg. for sharded scrapers
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return process_time() + children.ru_utime + children.ru_stime
+
+
+def _get_peak_rss() -> int:
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak_rss
+    return peak_rss * 1024
+
+
+def _get_rss() -> int:
+    # Resident pages are the second field
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return 0
+
+
+class Stage:
+    def __init__(self, name: str, parent: str, whole_process: bool):
+        self.name = name
+        self.parent = parent
+        self.whole_process = whole_process
+        self.start = time()
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.rss = 0
+        self.rss_delta = 0
+        self.peak_rss = 0
+        self.raised_peak_rss = False
+        self.peak_traced = 0
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self._start_wall = perf_counter()
+        self._start_cpu = _get_cpu_time(whole_process)
+        self._start_rss = _get_rss()
+        self._start_peak_rss = max(_get_peak_rss(), self._start_rss)
+        self._start_traced = 0
+        self._max_traced = 0
+        if tracemalloc.is_tracing():
+            self._start_traced = tracemalloc.get_traced_memory()[0]
+
+    def update_max_traced(self) -> None:
+        self._max_traced = max(
+            self._max_traced, tracemalloc.get_traced_memory()[1]
+        )
+
+    def finish(self) -> None:
+        self.wall_time = perf_counter() - self._start_wall
+        self.cpu_time = _get_cpu_time(self.whole_process) - self._start_cpu
+        self.rss = _get_rss()
+        self.rss_delta = self.rss - self._start_rss
+        # The kernel updates the maximum RSS lazily so it can lag behind
+        # the current RSS
+        self.peak_rss = max(_get_peak_rss(), self.rss)
+        self.raised_peak_rss = self.peak_rss > self._start_peak_rss
+        if tracemalloc.is_tracing():
+            self.update_max_traced()
+            self.peak_traced = max(self._max_traced - self._start_traced, 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "start": self.start,
+            "wall_time": round(self.wall_time, 6),
+            "cpu_time": round(self.cpu_time, 6),
+            "rss": self.rss,
+            "rss_delta": self.rss_delta,
+            "peak_rss": self.peak_rss,
+            "raised_peak_rss": self.raised_peak_rss,
+            "peak_traced": self.peak_traced,
+            **self.counts,
+        }
+
+
+class Instrumentation:
+    def __init__(self):
+        self._lock = Lock()
+        self.stages: List[Stage] = []
+
+    @contextmanager
+    def stage(self, name: str, whole_process: bool = False) -> Iterator[Stage]:
+        """Context manager that records the metrics of a stage. CPU time is
+        that of the current thread unless whole_process is True, in which
+        case it is that of the process and its worker processes.
+
+        Args:
+            name (str): Name of stage
+            whole_process (bool): Whether to record CPU time of whole process. Defaults to False.
+
+        Returns:
+            Iterator[Stage]: Stage being recorded
+        """
+        active_stages = _active_stages.get()
+        parent = active_stages[-1].name if active_stages else ""
+        if tracemalloc.is_tracing():
+            # Resetting the peak for this stage loses it for outer stages so
+            # keep it in them first
+            for active_stage in active_stages:
+                active_stage.update_max_traced()
+            tracemalloc.reset_peak()
+        stage = Stage(name, parent, whole_process)
+        token = _active_stages.set(active_stages + (stage,))
+        try:
+            yield stage
+        finally:
+            _active_stages.reset(token)
+            stage.finish()
+            with self._lock:
+                self.stages.append(stage)
+
+    def add_count(self, counter: str, value: int) -> None:
+        """Add to a counter of all active stages.
+
+        Args:
+            counter (str): One of COUNTERS
+            value (int): Value to add
+
+        Returns:
+            None
+        """
+        if not value:
+            return
+        active_stages = _active_stages.get()
+        if not active_stages:
+            return
+        with self._lock:
+            for stage in active_stages:
+                stage.counts[counter] += value
+
+    def get_stage_names(self) -> Tuple[str, ...]:
+        """Get the names of the active stages, outermost first.
+
+        Returns:
+            Tuple[str, ...]: Names of active stages
+        """
+        return tuple(stage.name for stage in _active_stages.get())
+
+    def get_theme_and_uploader(self) -> Tuple[str, str]:
+        """Get the theme and uploader running in the current thread from the
+        active stages. The theme is the stage within the outermost stage (eg.
+        population within output) and the uploader is the innermost.
+
+        Returns:
+            Tuple[str, str]: (theme, uploader)
+        """
+        names = self.get_stage_names()
+        if not names:
+            return "other", "other"
+        if len(names) == 1:
+            return names[0], names[0]
+        return names[1], names[-1]
+
+    def get_counts(self) -> Dict[str, int]:
+        """Get the counters of the innermost active stage.
+
+        Returns:
+            Dict[str, int]: Counters
+        """
+        active_stages = _active_stages.get()
+        if not active_stages:
+            return dict.fromkeys(COUNTERS, 0)
+        with self._lock:
+            return dict(active_stages[-1].counts)
+
+    def instrument_engine(self, engine: Engine) -> None:
+        """Count round trips (statements and commits) through an engine.
+
+        Args:
+            engine (Engine): Database engine
+
+        Returns:
+            None
+        """
+
+        def before_cursor_execute(
+            conn, cursor, statement, parameters, context, executemany
+        ):
+            self.add_count("round_trips", 1)
+
+        def commit(conn):
+            self.add_count("round_trips", 1)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "commit", commit)
+
+    def instrument_downloads(self) -> None:
+        """Count bytes downloaded by the readers. Must be called after
+        Read.create_readers.
+
+        Returns:
+            None
+        """
+
+        def count_response(response, *args, **kwargs):
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit():
+                self.add_count("bytes_downloaded", int(length))
+
+        sessions = {
+            id(retriever.downloader.session): retriever.downloader.session
+            for retriever in Read.retrievers.values()
+        }
+        for session in sessions.values():
+            session.hooks["response"].append(count_response)
+
+    def get_report(self) -> Dict[str, Any]:
+        """Get the report of all stages recorded so far.
+
+        Returns:
+            Dict[str, Any]: Report
+        """
+        with self._lock:
+            stages = [stage.to_dict() for stage in self.stages]
+        stages.sort(key=lambda x: x["start"])
+        return {"created": time(), "stages": stages}
+
+    def write_report(
+        self, path: str, sections: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Write the report of all stages as JSON along with any additional
+        sections eg. an SQL profile.
+
+        Args:
+            path (str): Path of JSON file
+            sections (Optional[Dict[str, Any]]): Additional sections. Defaults to None.
+
+        Returns:
+            None
+        """
+        report = self.get_report()
+        if sections:
+            report.update(sections)
+        write_atomically(path, json.dumps(report, indent=2))
+        logger.info(f"Wrote run report to {path}")
+
+    def write_prometheus(
+        self, path: str, prefix: str = "hapi_pipelines"
+    ) -> None:
+        """Write the metrics of all stages as a Prometheus textfile. Stages
+        that ran more than once (eg. Metadata.populate) are summed except for
+        RSS and peak RSS which are the maximum and whether the peak RSS was
+        raised which is 1 if any of them raised it.
+
+        Args:
+            path (str): Path of textfile (must end in .prom for node exporter)
+            prefix (str): Prefix of metric names. Defaults to "hapi_pipelines".
+
+        Returns:
+            None
+        """
+        metrics = {
+            "wall_seconds": ("wall_time", sum),
+            "cpu_seconds": ("cpu_time", sum),
+            "rss_bytes": ("rss", max),
+            "rss_delta_bytes": ("rss_delta", sum),
+            "peak_rss_bytes": ("peak_rss", max),
+            "raised_peak_rss": ("raised_peak_rss", lambda x: int(any(x))),
+            "rows_read": ("rows_read", sum),
+            "rows_written": ("rows_written", sum),
+            "round_trips": ("round_trips", sum),
+            "bytes_downloaded": ("bytes_downloaded", sum),
+        }
+        stages: Dict[str, List[Dict]] = {}
+        for stage in self.get_report()["stages"]:
+            stages.setdefault(stage["name"], []).append(stage)
+        lines = []
+        for metric, (key, aggregate) in metrics.items():
+            name = f"{prefix}_stage_{metric}"
+            lines.append(f"# TYPE {name} gauge")
+            for stage_name, stage_values in stages.items():
+                value = aggregate(x[key] for x in stage_values)
+                label = stage_name.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{name}{{stage="{label}"}} {value}')
+        lines.append(f"# TYPE {prefix}_last_run_timestamp_seconds gauge")
+        lines.append(f"{prefix}_last_run_timestamp_seconds {time():.0f}")
+        write_atomically(path, "\n".join(lines) + "\n")
+        logger.info(f"Wrote Prometheus metrics to {path}")
+
+
+instrumentation = Instrumentation()
+
+
+def instrumented(name: str, whole_process: bool = False) -> Callable:
+    """Decorator that records a function as a stage.
+
+    Args:
+        name (str): Name of stage
+        whole_process (bool): Whether to record CPU time of whole process. Defaults to False.
+
+    Returns:
+        Callable: Decorator
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with instrumentation.stage(name, whole_process):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count_rows_read(rows: Iterable) -> Iterator:
+    """Count rows read from a source as they are iterated over.
+
+    Args:
+        rows (Iterable): Rows
+
+    Returns:
+        Iterator: Rows
+    """
+    no_rows = 0
+    try:
+        for row in rows:
+            no_rows += 1
+            yield row
+    finally:
+        instrumentation.add_count("rows_read", no_rows)
@@ -1,10 +1,12 @@
-from typing import Dict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from hdx.location.names import clean_name
 from hdx.location.phonetics import Phonetics
 from hdx.utilities.text import multiple_replace
 
 MATCH_THRESHOLD = 5
+PHONETIC_THRESHOLD = 2
 
 
 def get_code_from_name(
@@ -26,25 +28,140 @@ def get_code_from_name(
     code = code_lookup.get(name)
     if code:
         return code, name, False
-    name_clean = clean_name(name)
-    name_clean = multiple_replace(
-        name_clean, {"_": " ", "-": " ", ",": "", ".": "", ":": ""}
-    )
-    name_clean = multiple_replace(name_clean, {"   ": " ", "  ": " "})
+    name_clean = _clean_name(name)
     code = code_mapping.get(name_clean)
     if code:
         return code, name_clean, False
     if len(name) <= MATCH_THRESHOLD:
         return None, name_clean, False
-    names = list(code_lookup.keys())
-    names_lower = [x.lower() for x in names]
-    name_index = Phonetics().match(
-        possible_names=names_lower,
-        name=name,
-        alternative_name=name_clean,
+    return _match_phonetically(
+        name,
+        name_clean,
+        code_lookup,
+        code_mapping,
+        list(code_lookup.keys()),
+        _get_phonetics(code_lookup.keys()),
+    )
+
+
+def _clean_name(name: str) -> str:
+    name_clean = clean_name(name)
+    name_clean = multiple_replace(
+        name_clean, {"_": " ", "-": " ", ",": "", ".": "", ":": ""}
     )
-    if name_index is None:
+    return multiple_replace(name_clean, {"   ": " ", "  ": " "})
+
+
+def _get_phonetics(names: Iterable[str]) -> List[Optional[str]]:
+    phonetics = Phonetics()
+    names_phonetics = []
+    for name in names:
+        name_lower = name.lower()
+        names_phonetics.append(
+            phonetics.phonetics(name_lower) if name_lower else None
+        )
+    return names_phonetics
+
+
+def _match_phonetically(
+    name: str,
+    name_clean: str,
+    code_lookup: Dict[str, str],
+    code_mapping: Dict[str, str],
+    names: List[str],
+    names_phonetics: List[Optional[str]],
+) -> Tuple[Optional[str], str, bool]:
+    # Equivalent to Phonetics().match but using precomputed phonetic forms
+    # of the possible names
+    phonetics = Phonetics()
+    levenshtein_distance = phonetics.distances["levenshtein"]
+    name_phonetics = [phonetics.phonetics(name)]
+    if name_clean:
+        name_phonetics.append(phonetics.phonetics(name_clean))
+    mindistance = None
+    name_index = None
+    for i, possible_phonetics in enumerate(names_phonetics):
+        if possible_phonetics is None:
+            continue
+        for phonetic in name_phonetics:
+            distance = levenshtein_distance(phonetic, possible_phonetics)
+            if mindistance is None or distance < mindistance:
+                mindistance = distance
+                name_index = i
+    if mindistance is None or mindistance > PHONETIC_THRESHOLD:
         return None, name_clean, False
     name = names[name_index]
     code = code_lookup.get(name, code_mapping.get(name))
     return code, name_clean, True
+
+
+class CodeMatcher:
+    """Match names to codes like get_code_from_name but with the phonetic
+    forms of the lookup's names computed once and results, including misses,
+    kept in an LRU cache. The matcher must be invalidated if the lookup
+    changes and mappings must be added through add_mapping so that the cache
+    stays consistent.
+
+    Args:
+        code_lookup (dict): Dictionary of official names and codes
+        code_mapping (dict): Additional dictionary of unofficial mappings provided by user
+        cache_size (int): Maximum number of results to cache. Defaults to 4096.
+    """
+
+    def __init__(
+        self,
+        code_lookup: Dict[str, str],
+        code_mapping: Dict[str, str],
+        cache_size: int = 4096,
+    ):
+        self._code_lookup = code_lookup
+        self._code_mapping = code_mapping
+        self._names = None
+        self._names_phonetics = None
+        self.get_code = lru_cache(maxsize=cache_size)(self._get_code)
+
+    def _get_code(self, name: str) -> Tuple[Optional[str], str, bool]:
+        code = self._code_lookup.get(name)
+        if code:
+            return code, name, False
+        name_clean = _clean_name(name)
+        code = self._code_mapping.get(name_clean)
+        if code:
+            return code, name_clean, False
+        if len(name) <= MATCH_THRESHOLD:
+            return None, name_clean, False
+        if self._names is None:
+            self._names = list(self._code_lookup.keys())
+            self._names_phonetics = _get_phonetics(self._names)
+        return _match_phonetically(
+            name,
+            name_clean,
+            self._code_lookup,
+            self._code_mapping,
+            self._names,
+            self._names_phonetics,
+        )
+
+    def add_mapping(self, name_clean: str, code: str) -> None:
+        """Add an unofficial mapping and clear cached results.
+
+        Args:
+            name_clean (str): Clean name
+            code (str): Code
+
+        Returns:
+            None
+        """
+        self._code_mapping[name_clean] = code
+        self.get_code.cache_clear()
+
+    def invalidate(self) -> None:
+        """Clear cached results and phonetic forms after the lookup has
+        changed.
+
+        Returns:
+            None
+        """
+        self._names = None
+        self._names_phonetics = None
+        self.get_code.cache_clear()
@@ -0,0 +1,190 @@
+"""Export the HAPI tables and views to Parquet.
+
+Each table and view is written to a Parquet file named after it, compressed
+and with statistics for each row group so that readers can skip row groups.
+Rows are streamed from a server-side cursor (where the database supports it)
+one row group at a time, so memory use does not grow with the size of the
+table. Several tables and views are exported at once, each on its own
+connection. Once all are done, a manifest is written giving the file, number
+of rows, size and MD5 hash of each one.
+
+Parquet export requires pyarrow (pip install hapi-pipelines[parquet]).
+"""
+
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from os import makedirs, replace
+from os.path import getsize, join
+from typing import Any, Dict, Optional
+
+from hdx.utilities.typehint import ListTuple
+from sqlalchemy import Engine, MetaData, Table, inspect, select
+
+from .files import write_atomically
+from .instrumentation import instrumentation
+from .sinks import get_arrow_schema, get_arrow_table
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def get_file_hash(path: str, chunk_size: int = 1024**2) -> str:
+    """Get the MD5 hash of a file.
+
+    Args:
+        path (str): Path of file
+        chunk_size (int): Number of bytes to read at a time. Defaults to 1MB.
+
+    Returns:
+        str: MD5 hash as hex
+    """
+    md5 = hashlib.md5()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class ParquetExport:
+    """Export tables and views to Parquet files.
+
+    Args:
+        engine (Engine): Engine of database to export
+        folder (str): Folder in which to write files
+        workers (int): Number of tables and views to export at once. Defaults to 4.
+        row_group_size (int): Number of rows in each row group. Defaults to 65536.
+        compression (str): Parquet compression codec. Defaults to "zstd".
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        folder: str,
+        workers: int = 4,
+        row_group_size: int = 65536,
+        compression: str = "zstd",
+    ):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError(
+                "Parquet export requires pyarrow: "
+                "pip install hapi-pipelines[parquet]"
+            )
+        self._engine = engine
+        self._folder = folder
+        self._workers = workers
+        self._row_group_size = row_group_size
+        self._compression = compression
+
+    def get_names(self) -> Dict[str, str]:
+        """Get the names of the tables and views in the database.
+
+        Returns:
+            Dict[str, str]: Name to "table" or "view"
+        """
+        inspector = inspect(self._engine)
+        names = {name: "table" for name in inspector.get_table_names()}
+        for name in inspector.get_view_names():
+            names[name] = "view"
+        return names
+
+    def get_path(self, name: str) -> str:
+        """Get the path of the Parquet file for a table or view.
+
+        Args:
+            name (str): Name of table or view
+
+        Returns:
+            str: Path of file
+        """
+        return join(self._folder, f"{name}.parquet")
+
+    def export_one(self, name: str) -> Dict[str, Any]:
+        """Export a table or view to a Parquet file. The file is written
+        under a temporary name and moved into place when complete.
+
+        Args:
+            name (str): Name of table or view
+
+        Returns:
+            Dict[str, Any]: Manifest entry with file, rows, row groups, bytes and md5
+        """
+        import pyarrow.parquet as pq
+
+        path = self.get_path(name)
+        part_path = f"{path}.part"
+        no_rows = 0
+        no_row_groups = 0
+        with self._engine.connect() as connection:
+            table = Table(name, MetaData(), autoload_with=connection)
+            schema = get_arrow_schema(table)
+            # yield_per streams results using a server-side cursor
+            result = connection.execution_options(
+                yield_per=self._row_group_size
+            ).execute(select(table))
+            with pq.ParquetWriter(
+                part_path,
+                schema,
+                compression=self._compression,
+                write_statistics=True,
+            ) as writer:
+                for rows in result.partitions():
+                    writer.write_table(
+                        get_arrow_table(schema, rows),
+                        row_group_size=self._row_group_size,
+                    )
+                    no_rows += len(rows)
+                    no_row_groups += 1
+        instrumentation.add_count("rows_read", no_rows)
+        replace(part_path, path)
+        return {
+            "file": f"{name}.parquet",
+            "rows": no_rows,
+            "row_groups": no_row_groups,
+            "bytes": getsize(path),
+            "md5": get_file_hash(path),
+        }
+
+    def export(
+        self, names: Optional[ListTuple[str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Export tables and views to Parquet files concurrently and write a
+        manifest of them.
+
+        Args:
+            names (Optional[ListTuple[str]]): Tables and views to export. Defaults to None (all).
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Manifest of table or view name to entry
+        """
+        makedirs(self._folder, exist_ok=True)
+        kinds = self.get_names()
+        if names is None:
+            names = sorted(kinds)
+        manifest = {}
+
+        def export_one(name: str) -> None:
+            with instrumentation.stage(name):
+                entry = self.export_one(name)
+            entry["kind"] = kinds.get(name, "table")
+            manifest[name] = entry
+            logger.info(f"Exported {entry['rows']} rows from {name}")
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            # Exports inherit context eg. the current stage
+            futures = [
+                executor.submit(copy_context().run, export_one, name)
+                for name in names
+            ]
+            for future in futures:
+                future.result()
+        manifest = {name: manifest[name] for name in names}
+        path = join(self._folder, MANIFEST_FILENAME)
+        write_atomically(path, json.dumps(manifest, indent=2) + "\n")
+        logger.info(f"Wrote manifest of {len(manifest)} files to {path}")
+        return manifest
@@ -0,0 +1,227 @@
+"""Local snapshot of the reference data prepared before any theme runs.
+
+Setting up the pipelines needs the global p-codes dataset, the p-code
+formats and the countries feed, which are downloaded and parsed into
+AdminLevel and Country structures whatever themes are run. Once prepared,
+these structures are pickled into a snapshot file named after a hash of
+everything they are built from (source urls, configuration and library
+versions). Later runs with the same sources load the snapshot instead,
+without touching the network. A snapshot older than a maximum age is rebuilt
+so that changes to the source data are picked up.
+"""
+
+import json
+import logging
+import pickle
+from datetime import timedelta
+from glob import glob
+from hashlib import sha256
+from importlib.metadata import version
+from os import makedirs, remove, replace
+from os.path import exists, getmtime, join
+from tempfile import NamedTemporaryFile
+from time import perf_counter, time
+from typing import Any, Dict, Optional
+
+import hxl
+from hdx.api.configuration import Configuration
+from hdx.location.adminlevel import AdminLevel
+from hdx.location.country import Country
+
+logger = logging.getLogger(__name__)
+
+# Increment when the structure of the snapshot changes
+SNAPSHOT_VERSION = 1
+
+
+def build_reference_data(
+    configuration: Configuration,
+    use_live: bool = True,
+    admin_levels: bool = True,
+) -> Dict[str, Any]:
+    """Download and prepare the reference data: countries data and, if
+    admin_levels is True, global p-codes dataset and admin levels 1 and 2.
+
+    Args:
+        configuration (Configuration): HDX configuration
+        use_live (bool): Whether to use latest countries data. Defaults to True.
+        admin_levels (bool): Whether to prepare admin levels. Defaults to True.
+
+    Returns:
+        Dict[str, Any]: Reference data
+    """
+    countriesdata = Country.countriesdata(
+        use_live=use_live,
+        country_name_overrides=configuration["country_name_overrides"],
+        country_name_mappings=configuration["country_name_mappings"],
+    )
+    if not admin_levels:
+        return {"countriesdata": countriesdata}
+    countries = configuration["HAPI_countries"]
+    libhxl_dataset = AdminLevel.get_libhxl_dataset().cache()
+    adminone = AdminLevel(admin_config=configuration["admin1"], admin_level=1)
+    admintwo = AdminLevel(admin_config=configuration["admin2"], admin_level=2)
+    adminone.setup_from_libhxl_dataset(libhxl_dataset, countries)
+    adminone.load_pcode_formats()
+    admintwo.setup_from_libhxl_dataset(libhxl_dataset, countries)
+    admintwo.load_pcode_formats()
+    admintwo.set_parent_admins_from_adminlevels([adminone])
+    return {
+        "countriesdata": countriesdata,
+        "libhxl_dataset": libhxl_dataset,
+        "adminone": adminone,
+        "admintwo": admintwo,
+    }
+
+
+class ReferenceSnapshot:
+    """Snapshot of reference data kept in a folder between runs.
+
+    Args:
+        configuration (Configuration): HDX configuration
+        folder (str): Folder in which to keep snapshot
+        use_live (bool): Whether to use latest countries data. Defaults to True.
+        max_age (timedelta): Age after which snapshot is rebuilt. Defaults to 7 days.
+    """
+
+    def __init__(
+        self,
+        configuration: Configuration,
+        folder: str,
+        use_live: bool = True,
+        max_age: timedelta = timedelta(days=7),
+    ):
+        self._configuration = configuration
+        self.folder = folder
+        self._use_live = use_live
+        self._max_age = max_age
+        self.key = self.get_key()
+        self.path = join(folder, f"reference-{self.key}.pickle")
+
+    def get_key(self) -> str:
+        """Get hash of everything the reference data is built from.
+
+        Returns:
+            str: Hash of sources
+        """
+        configuration = self._configuration
+        sources = {
+            "snapshot_version": SNAPSHOT_VERSION,
+            "hdx-python-country": version("hdx-python-country"),
+            "libhxl": version("libhxl"),
+            "admin_url": AdminLevel._admin_url,
+            "formats_url": AdminLevel._formats_url,
+            "countries_url": Country._ochaurl,
+            "use_live": self._use_live,
+            "HAPI_countries": configuration["HAPI_countries"],
+            "country_name_overrides": configuration["country_name_overrides"],
+            "country_name_mappings": configuration["country_name_mappings"],
+            "admin1": configuration["admin1"],
+            "admin2": configuration["admin2"],
+        }
+        sources = json.dumps(sources, sort_keys=True, default=str)
+        return sha256(sources.encode("utf-8")).hexdigest()[:16]
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Load reference data from snapshot if there is a snapshot for the
+        current sources that isn't too old.
+
+        Returns:
+            Optional[Dict[str, Any]]: Reference data or None
+        """
+        if not exists(self.path):
+            return None
+        if time() - getmtime(self.path) > self._max_age.total_seconds():
+            logger.info("Reference data snapshot is out of date")
+            return None
+        try:
+            with open(self.path, "rb") as file:
+                snapshot = pickle.load(file)
+        except Exception:
+            logger.exception(f"Reading {self.path} failed!")
+            return None
+        headers, tags, values = snapshot.pop("libhxl_rows")
+        snapshot["libhxl_dataset"] = hxl.data([headers, tags] + values).cache()
+        return snapshot
+
+    def save(self, reference_data: Dict[str, Any]) -> None:
+        """Save reference data to snapshot, deleting snapshots for other
+        sources.
+
+        Args:
+            reference_data (Dict[str, Any]): Reference data
+
+        Returns:
+            None
+        """
+        makedirs(self.folder, exist_ok=True)
+        snapshot = dict(reference_data)
+        # libhxl datasets can't be pickled so store their rows
+        libhxl_dataset = snapshot.pop("libhxl_dataset")
+        snapshot["libhxl_rows"] = (
+            [column.header or "" for column in libhxl_dataset.columns],
+            [column.display_tag for column in libhxl_dataset.columns],
+            libhxl_dataset.values,
+        )
+        with NamedTemporaryFile(
+            dir=self.folder, suffix=".part", delete=False
+        ) as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(file.name, self.path)
+        for path in glob(join(self.folder, "reference-*.pickle")):
+            if path != self.path:
+                remove(path)
+
+
+def get_reference_data(
+    configuration: Configuration,
+    use_live: bool = True,
+    folder: Optional[str] = None,
+    max_age: timedelta = timedelta(days=7),
+    admin_levels: bool = True,
+) -> Dict[str, Any]:
+    """Get the reference data from a snapshot in folder if possible,
+    otherwise download and prepare it (and save it to a snapshot if folder is
+    given). Country is set up with the countries data in either case. If
+    admin_levels is False, only the countries data is needed so that is all
+    that is prepared when there is no snapshot and no snapshot is saved.
+
+    Args:
+        configuration (Configuration): HDX configuration
+        use_live (bool): Whether to use latest countries data. Defaults to True.
+        folder (Optional[str]): Folder in which to keep snapshot. Defaults to None (no snapshot).
+        max_age (timedelta): Age after which snapshot is rebuilt. Defaults to 7 days.
+        admin_levels (bool): Whether admin levels are needed. Defaults to True.
+
+    Returns:
+        Dict[str, Any]: Reference data
+    """
+    if not folder:
+        return build_reference_data(configuration, use_live, admin_levels)
+    start = perf_counter()
+    snapshot = ReferenceSnapshot(configuration, folder, use_live, max_age)
+    reference_data = snapshot.load()
+    if reference_data:
+        Country.set_country_name_overrides(
+            configuration["country_name_overrides"]
+        )
+        Country.set_country_name_mappings(
+            configuration["country_name_mappings"]
+        )
+        Country._countriesdata = reference_data["countriesdata"]
+        logger.info(
+            f"Loaded reference data snapshot {snapshot.key} in "
+            f"{perf_counter() - start:.2f}s"
+        )
+        return reference_data
+    reference_data = build_reference_data(
+        configuration, use_live, admin_levels
+    )
+    if not admin_levels:
+        return reference_data
+    snapshot.save(reference_data)
+    logger.info(
+        f"Built reference data snapshot {snapshot.key} in "
+        f"{perf_counter() - start:.2f}s"
+    )
+    return reference_data
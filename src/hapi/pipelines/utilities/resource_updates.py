@@ -0,0 +1,135 @@
+"""Detect which sources have changed since the previous run.
+
+The resource table stores the update date and download url of every resource
+loaded by the previous run. In incremental mode, these are compared with the
+current HDX metadata so that scrapers and uploaders whose resources haven't
+changed can be skipped, keeping their existing rows.
+"""
+
+import logging
+from copy import deepcopy
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from hapi_schema.db_resource import DBResource
+from hdx.scraper.runner import Runner
+from hdx.utilities.typehint import ListTuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .batch_populate import is_incremental
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceUpdates:
+    def __init__(self, session: Session):
+        self.previous_resources = {}
+        self.unchanged_resources = set()
+        if not is_incremental(session):
+            return
+        results = session.execute(
+            select(
+                DBResource.hdx_id,
+                DBResource.update_date,
+                DBResource.download_url,
+            )
+        )
+        for hdx_id, update_date, download_url in results:
+            self.previous_resources[hdx_id] = (
+                _get_naive_utc(update_date),
+                download_url,
+            )
+        logger.info(
+            f"Read {len(self.previous_resources)} resources from previous run"
+        )
+
+    def is_unchanged(self, hapi_resource_metadata: Optional[Dict]) -> bool:
+        """Whether a resource has the same update date and download url as in
+        the previous run.
+
+        Args:
+            hapi_resource_metadata (Optional[Dict]): HAPI resource metadata
+
+        Returns:
+            bool: True if resource is unchanged, False if not
+        """
+        if not hapi_resource_metadata:
+            return False
+        previous = self.previous_resources.get(
+            hapi_resource_metadata["hdx_id"]
+        )
+        if previous is None:
+            return False
+        current = (
+            _get_naive_utc(hapi_resource_metadata["update_date"]),
+            hapi_resource_metadata["download_url"],
+        )
+        if current != previous:
+            return False
+        self.unchanged_resources.add(hapi_resource_metadata["hdx_id"])
+        return True
+
+    def get_current_resources(
+        self, session: Session, today: datetime
+    ) -> Set[str]:
+        """Get the resources of the current run: those loaded by it (which
+        are given today as their HAPI updated date) and those skipped as
+        unchanged.
+
+        Args:
+            session (Session): Session to use
+            today (datetime): Date of the current run
+
+        Returns:
+            Set[str]: Ids of resources
+        """
+        results = session.execute(
+            select(DBResource.hdx_id).where(
+                DBResource.hapi_updated_date >= _get_naive_utc(today)
+            )
+        )
+        return set(results.scalars()) | self.unchanged_resources
+
+    def get_changed_scrapers(
+        self, runner: Runner, names: Optional[ListTuple[str]] = None
+    ) -> List[str]:
+        """Get the names of scrapers whose resources have changed since the
+        previous run by reading their HDX metadata. Scrapers whose metadata
+        cannot be read or that don't read from a single HDX resource are
+        treated as changed.
+
+        Args:
+            runner (Runner): Runner containing scrapers
+            names (Optional[ListTuple[str]]): Names of scrapers. Defaults to None (all scrapers).
+
+        Returns:
+            List[str]: Names of scrapers that have changed
+        """
+        if not names:
+            names = runner.scrapers.keys()
+        changed_scrapers = []
+        for name in names:
+            scraper = runner.get_scraper(name)
+            if self.previous_resources and isinstance(
+                scraper.datasetinfo.get("dataset"), str
+            ):
+                datasetinfo = deepcopy(scraper.datasetinfo)
+                try:
+                    scraper.get_reader().read_hdx_metadata(datasetinfo)
+                except Exception:
+                    # Let the scraper run and report the problem
+                    datasetinfo = {}
+                if self.is_unchanged(
+                    datasetinfo.get("hapi_resource_metadata")
+                ):
+                    logger.info(f"Skipping unchanged scraper {name}")
+                    continue
+            changed_scrapers.append(name)
+        return changed_scrapers
+
+
+def _get_naive_utc(date: Optional[datetime]) -> Optional[datetime]:
+    if date is None or date.tzinfo is None:
+        return date
+    return date.astimezone(timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,402 @@
+"""Build the database in a staging schema and swap it into place.
+
+Rather than recreating the live schema in place, which leaves the API seeing
+empty or half-loaded tables while the pipelines run, tables and views are
+created and loaded in a staging schema. This is done by setting the
+PostgreSQL search_path of every connection to the staging schema so that no
+uploader needs to know about it. Once loading has finished, the staging
+schema is validated and analyzed and then, in one transaction, the live
+schema is renamed to the previous schema and the staging schema is renamed to
+the live schema. The previous schema is kept so that the swap can be rolled
+back instantly.
+
+The renames carry everything attached to a schema with it, so before the
+swap, the owners, grants and default privileges of the live schema and its
+tables, views and sequences are applied to the staging schema, and
+extensions installed in the live schema are moved into the staging schema so
+that they are not dropped along with the previous schema.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from hapi_schema.views import prepare_hapi_views
+from hdx.database.dburi import get_connection_uri
+from hdx.utilities.typehint import ListTuple
+from sqlalchemy import (
+    Connection,
+    Engine,
+    bindparam,
+    create_engine,
+    inspect,
+    text,
+)
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+# Tables that are always loaded whatever themes are run
+_REFERENCE_TABLES = ("location", "dataset", "resource")
+
+# Object types of default privileges
+_DEFAULT_PRIVILEGE_TYPES = {
+    "r": "TABLES",
+    "S": "SEQUENCES",
+    "f": "FUNCTIONS",
+    "T": "TYPES",
+}
+
+
+class ShadowSchema:
+    def __init__(
+        self,
+        params: Dict[str, Any],
+        live_schema: str = "public",
+        staging_schema: str = "hapi_staging",
+        previous_schema: str = "hapi_previous",
+    ):
+        if params.get("dialect", "postgresql") != "postgresql":
+            raise ValueError("Shadow schema builds require PostgreSQL!")
+        self._live_schema = live_schema
+        self._staging_schema = staging_schema
+        self._previous_schema = previous_schema
+        db_uri = params.get("db_uri")
+        if not db_uri:
+            db_uri = get_connection_uri(
+                database=params.get("database"),
+                host=params.get("host"),
+                port=params.get("port"),
+                username=params.get("username"),
+                password=params.get("password"),
+                dialect="postgresql",
+                driver=params.get("driver"),
+            )
+        self._db_uri = db_uri
+        # Connections are not pooled (as in hdx Database) so every
+        # connection gets the search path
+        self.engine: Engine = create_engine(
+            db_uri,
+            poolclass=NullPool,
+            connect_args={"options": f"-csearch_path={staging_schema}"},
+        )
+
+    def get_database_params(self) -> Dict[str, Any]:
+        """Get parameters for hdx Database that create an empty staging
+        schema containing the HAPI tables and views.
+
+        Returns:
+            Dict[str, Any]: Parameters for hdx Database
+        """
+        return {
+            "engine": self.engine,
+            "recreate_schema": True,
+            "schema": self._staging_schema,
+            "prepare_fn": prepare_hapi_views,
+        }
+
+    def _quote(self, connection: Connection, name: str) -> str:
+        return connection.dialect.identifier_preparer.quote(name)
+
+    def _schema_exists(self, connection: Connection, schema: str) -> bool:
+        return schema in inspect(connection).get_schema_names()
+
+    def _has_rows(
+        self, connection: Connection, schema: str, table: str
+    ) -> bool:
+        schema = self._quote(connection, schema)
+        table = self._quote(connection, table)
+        return connection.scalar(
+            text(f"SELECT EXISTS (SELECT 1 FROM {schema}.{table})")
+        )
+
+    def validate(self, connection: Connection) -> List[str]:
+        """Check the staging schema before it is swapped into place. All
+        views must be queryable, reference tables must not be empty and no
+        table that has rows in the live schema may be empty.
+
+        Args:
+            connection (Connection): Connection to use
+
+        Returns:
+            List[str]: Problems found (empty if staging schema is valid)
+        """
+        problems = []
+        inspector = inspect(connection)
+        staging = self._staging_schema
+        tables = inspector.get_table_names(schema=staging)
+        if not tables:
+            return [f"No tables in schema {staging}"]
+        views = inspector.get_view_names(schema=staging)
+        if not views:
+            problems.append(f"No views in schema {staging}")
+        quoted_staging = self._quote(connection, staging)
+        for view in views:
+            quoted_view = self._quote(connection, view)
+            try:
+                with connection.begin_nested():
+                    connection.execute(
+                        text(
+                            f"SELECT 1 FROM {quoted_staging}.{quoted_view} "
+                            "LIMIT 1"
+                        )
+                    )
+            except Exception as ex:
+                problems.append(f"View {view} cannot be queried: {ex}")
+        live_tables = set()
+        if self._schema_exists(connection, self._live_schema):
+            live_tables = set(
+                inspector.get_table_names(schema=self._live_schema)
+            )
+        for table in tables:
+            if self._has_rows(connection, staging, table):
+                continue
+            if table in _REFERENCE_TABLES:
+                problems.append(f"Reference table {table} is empty")
+            elif table in live_tables and self._has_rows(
+                connection, self._live_schema, table
+            ):
+                problems.append(
+                    f"Table {table} is empty but has rows in schema "
+                    f"{self._live_schema}"
+                )
+        return problems
+
+    def analyze(self, connection: Connection) -> None:
+        """Gather planner statistics for every table in the staging schema
+        so that they are fresh before any traffic arrives.
+
+        Args:
+            connection (Connection): Connection to use
+
+        Returns:
+            None
+        """
+        staging = self._quote(connection, self._staging_schema)
+        for table in inspect(connection).get_table_names(
+            schema=self._staging_schema
+        ):
+            table = self._quote(connection, table)
+            connection.execute(text(f"ANALYZE {staging}.{table}"))
+
+    def _rename(
+        self, connection: Connection, schema: str, new_schema: str
+    ) -> None:
+        schema = self._quote(connection, schema)
+        new_schema = self._quote(connection, new_schema)
+        connection.execute(
+            text(f"ALTER SCHEMA {schema} RENAME TO {new_schema}")
+        )
+
+    def _get_grant(
+        self,
+        connection: Connection,
+        privilege: str,
+        object_name: str,
+        grantee: Optional[str],
+        is_grantable: bool,
+    ) -> str:
+        if grantee is None:
+            grantee = "PUBLIC"
+        else:
+            grantee = self._quote(connection, grantee)
+        grant_option = " WITH GRANT OPTION" if is_grantable else ""
+        return f"GRANT {privilege} ON {object_name} TO {grantee}{grant_option}"
+
+    def copy_privileges(
+        self, connection: Connection, schema: str, new_schema: str
+    ) -> None:
+        """Apply the owners, grants and default privileges of a schema and
+        of its tables, views and sequences to another schema and the objects
+        of the same name in it.
+
+        Args:
+            connection (Connection): Connection to use
+            schema (str): Schema from which to copy privileges
+            new_schema (str): Schema to which to apply privileges
+
+        Returns:
+            None
+        """
+        quoted_schema = self._quote(connection, new_schema)
+        # Privileges of the owner are implied so are not granted. A NULL
+        # grantee is PUBLIC.
+        results = connection.execute(
+            text(
+                "SELECT c.relname, c.relkind, pg_get_userbyid(c.relowner), "
+                "a.privilege_type, pg_get_userbyid(NULLIF(a.grantee, 0)), "
+                "a.is_grantable FROM pg_class c "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "LEFT JOIN LATERAL aclexplode(c.relacl) a ON true "
+                "WHERE n.nspname = :schema "
+                "AND c.relkind IN ('r', 'p', 'v', 'm', 'S') "
+                "UNION ALL SELECT NULL, NULL, pg_get_userbyid(n.nspowner), "
+                "a.privilege_type, pg_get_userbyid(NULLIF(a.grantee, 0)), "
+                "a.is_grantable FROM pg_namespace n "
+                "LEFT JOIN LATERAL aclexplode(n.nspacl) a ON true "
+                "WHERE n.nspname = :schema"
+            ),
+            {"schema": schema},
+        )
+        inspector = inspect(connection)
+        new_names = set(inspector.get_table_names(schema=new_schema))
+        new_names.update(inspector.get_view_names(schema=new_schema))
+        new_names.update(inspector.get_sequence_names(schema=new_schema))
+        owned = set()
+        for name, kind, owner, privilege, grantee, is_grantable in results:
+            if name is None:
+                object_name = f"SCHEMA {quoted_schema}"
+            elif name in new_names:
+                object_type = "SEQUENCE" if kind == "S" else "TABLE"
+                quoted_name = self._quote(connection, name)
+                object_name = f"{object_type} {quoted_schema}.{quoted_name}"
+            else:
+                continue
+            if object_name not in owned:
+                quoted_owner = self._quote(connection, owner)
+                connection.execute(
+                    text(f"ALTER {object_name} OWNER TO {quoted_owner}")
+                )
+                owned.add(object_name)
+            if privilege is None or grantee == owner:
+                continue
+            grant = self._get_grant(
+                connection, privilege, object_name, grantee, is_grantable
+            )
+            connection.execute(text(grant))
+        results = connection.execute(
+            text(
+                "SELECT pg_get_userbyid(d.defaclrole), d.defaclobjtype, "
+                "a.privilege_type, pg_get_userbyid(NULLIF(a.grantee, 0)), "
+                "a.is_grantable FROM pg_default_acl d "
+                "JOIN pg_namespace n ON n.oid = d.defaclnamespace "
+                "CROSS JOIN LATERAL aclexplode(d.defaclacl) a "
+                "WHERE n.nspname = :schema"
+            ),
+            {"schema": schema},
+        )
+        for role, object_type, privilege, grantee, is_grantable in results:
+            quoted_role = self._quote(connection, role)
+            grant = self._get_grant(
+                connection,
+                privilege,
+                _DEFAULT_PRIVILEGE_TYPES[object_type],
+                grantee,
+                is_grantable,
+            )
+            connection.execute(
+                text(
+                    f"ALTER DEFAULT PRIVILEGES FOR ROLE {quoted_role} IN "
+                    f"SCHEMA {quoted_schema} {grant}"
+                )
+            )
+
+    def move_extensions(
+        self, connection: Connection, schemas: ListTuple[str], new_schema: str
+    ) -> None:
+        """Move the extensions installed in schemas to another schema so
+        that they are not renamed or dropped along with the schemas.
+
+        Args:
+            connection (Connection): Connection to use
+            schemas (ListTuple[str]): Schemas from which to move extensions
+            new_schema (str): Schema to which to move extensions
+
+        Returns:
+            None
+        """
+        results = connection.execute(
+            text(
+                "SELECT e.extname, e.extrelocatable FROM pg_extension e "
+                "JOIN pg_namespace n ON n.oid = e.extnamespace "
+                "WHERE n.nspname IN :schemas"
+            ).bindparams(bindparam("schemas", expanding=True)),
+            {"schemas": list(schemas)},
+        )
+        quoted_schema = self._quote(connection, new_schema)
+        for name, relocatable in results:
+            if not relocatable:
+                raise ValueError(
+                    f"Extension {name} cannot be moved to schema "
+                    f"{new_schema}: install it in another schema!"
+                )
+            quoted_name = self._quote(connection, name)
+            connection.execute(
+                text(
+                    f"ALTER EXTENSION {quoted_name} SET SCHEMA {quoted_schema}"
+                )
+            )
+            logger.info(f"Moved extension {name} to schema {new_schema}")
+
+    def swap(self) -> None:
+        """Validate and analyze the staging schema then, in one transaction,
+        replace the previous schema with the live schema and the live schema
+        with the staging schema. If validation fails, the live schema is left
+        untouched and the staging schema is kept for inspection.
+
+        Returns:
+            None
+        """
+        with self.engine.connect() as connection:
+            problems = self.validate(connection)
+            connection.rollback()
+            if problems:
+                for problem in problems:
+                    logger.error(problem)
+                raise ValueError(
+                    f"Schema {self._staging_schema} failed validation!"
+                )
+            logger.info(f"Analyzing schema {self._staging_schema}")
+            self.analyze(connection)
+            connection.commit()
+        with self.engine.begin() as connection:
+            self.move_extensions(
+                connection,
+                (self._live_schema, self._previous_schema),
+                self._staging_schema,
+            )
+            previous = self._quote(connection, self._previous_schema)
+            connection.execute(
+                text(f"DROP SCHEMA IF EXISTS {previous} CASCADE")
+            )
+            if self._schema_exists(connection, self._live_schema):
+                self.copy_privileges(
+                    connection, self._live_schema, self._staging_schema
+                )
+                self._rename(
+                    connection, self._live_schema, self._previous_schema
+                )
+            self._rename(connection, self._staging_schema, self._live_schema)
+        logger.info(
+            f"Swapped schema {self._staging_schema} into {self._live_schema}, "
+            f"previous schema kept as {self._previous_schema}"
+        )
+
+    def rollback(self) -> None:
+        """Swap the previous schema back into place in one transaction. The
+        schema being replaced becomes the previous schema so that rolling
+        back again undoes the rollback.
+
+        Returns:
+            None
+        """
+        with self.engine.begin() as connection:
+            if not self._schema_exists(connection, self._previous_schema):
+                raise ValueError(
+                    f"No schema {self._previous_schema} to roll back to!"
+                )
+            # Any staging schema left by a failed build is no longer needed
+            staging = self._quote(connection, self._staging_schema)
+            connection.execute(
+                text(f"DROP SCHEMA IF EXISTS {staging} CASCADE")
+            )
+            self.move_extensions(
+                connection, (self._live_schema,), self._previous_schema
+            )
+            self._rename(connection, self._live_schema, self._staging_schema)
+            self._rename(connection, self._previous_schema, self._live_schema)
+            self._rename(
+                connection, self._staging_schema, self._previous_schema
+            )
+        logger.info(
+            f"Rolled back schema {self._live_schema} to {self._previous_schema}"
+        )
@@ -0,0 +1,423 @@
+"""Sinks to which the uploaders write rows.
+
+By default, uploaders write rows to the database. A sink set on the session
+(see set_sink in batch_populate) is passed on to the sessions of the themes
+and receives the rows instead:
+
+- DatabaseSink writes to the database as if no sink were set
+- NullSink discards rows, so that the cost of the transforms can be measured
+  apart from the database and a run can be checked without touching it
+- FileSink writes the rows of each table to a CSV or Parquet file
+- CollectingSink keeps the rows of each table in memory, eg. so that rows
+  transformed in a worker process can be loaded by the main process
+
+Every sink counts the rows written to each table by each theme. Tables whose
+ids are generated by the database (location, admin1, admin2) are given
+sequential ids by sinks that don't write to the database.
+"""
+
+import csv
+import logging
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from os import makedirs
+from os.path import join
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Literal, Sequence
+
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Date,
+    DateTime,
+    Float,
+    Integer,
+    Numeric,
+    SmallInteger,
+    Table,
+    insert,
+)
+from sqlalchemy.orm import Session
+
+from .batch_populate import (
+    get_batches,
+    get_sink,
+    get_table,
+    get_typed_value,
+    write_rows,
+)
+from .instrumentation import instrumentation
+
+logger = logging.getLogger(__name__)
+
+FILE_FORMATS = ("csv", "parquet")
+_FILE_FORMATS_LITERAL = Literal["csv", "parquet"]
+
+
+class Sink(ABC):
+    def __init__(self):
+        self._lock = Lock()
+        # Theme -> table -> number of rows
+        self.rows: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+        self._next_ids: Dict[str, int] = defaultdict(lambda: 1)
+
+    @abstractmethod
+    def _write(
+        self, session: Session, table: Table, rows: Iterator[Dict]
+    ) -> int:
+        """Write rows to a table. Must be overridden.
+
+        Args:
+            session (Session): Session to use
+            table (Table): Table
+            rows (Iterator[Dict]): Rows to write
+
+        Returns:
+            int: Number of rows written
+        """
+
+    def _count(self, table: Table, no_rows: int) -> None:
+        theme, _ = instrumentation.get_theme_and_uploader()
+        with self._lock:
+            self.rows[theme][table.name] += no_rows
+
+    def write(
+        self, session: Session, table: Table, rows: Iterator[Dict]
+    ) -> int:
+        """Write rows to a table counting them against the current theme.
+
+        Args:
+            session (Session): Session to use
+            table (Table): Table
+            rows (Iterator[Dict]): Rows to write
+
+        Returns:
+            int: Number of rows written
+        """
+        no_rows = self._write(session, table, rows)
+        self._count(table, no_rows)
+        return no_rows
+
+    def write_with_ids(
+        self,
+        session: Session,
+        table: Table,
+        rows: List[Dict],
+        batch_size: int,
+        key: str = "code",
+    ) -> Dict[str, int]:
+        """Write rows to a table whose ids are generated by the database,
+        giving them sequential ids.
+
+        Args:
+            session (Session): Session to use
+            table (Table): Table
+            rows (List[Dict]): Rows to write
+            batch_size (int): Number of rows to write at a time
+            key (str): Column identifying rows. Defaults to "code".
+
+        Returns:
+            Dict[str, int]: Key of each row to its id
+        """
+        with self._lock:
+            next_id = self._next_ids[table.name]
+            self._next_ids[table.name] = next_id + len(rows)
+        ids = {}
+        for i, row in enumerate(rows):
+            row["id"] = next_id + i
+            ids[row[key]] = row["id"]
+        for i in range(0, len(rows), batch_size):
+            self.write(session, table, iter(rows[i : i + batch_size]))
+        return ids
+
+    def close(self) -> None:
+        """Close the sink once all rows have been written.
+
+        Returns:
+            None
+        """
+
+    def get_summary(self) -> Dict[str, Dict[str, int]]:
+        """Get the number of rows written to each table by each theme.
+
+        Returns:
+            Dict[str, Dict[str, int]]: Theme -> table -> number of rows
+        """
+        with self._lock:
+            return {theme: dict(tables) for theme, tables in self.rows.items()}
+
+    def log_summary(self) -> None:
+        """Log the number of rows written to each table by each theme.
+
+        Returns:
+            None
+        """
+        for theme, tables in self.get_summary().items():
+            for table_name, no_rows in sorted(tables.items()):
+                logger.info(f"{theme}: {no_rows} rows to {table_name}")
+
+
+class DatabaseSink(Sink):
+    """Sink that writes rows to the database as if no sink were set."""
+
+    def _write(
+        self, session: Session, table: Table, rows: Iterator[Dict]
+    ) -> int:
+        return write_rows(rows, session, table)
+
+    def write_with_ids(
+        self,
+        session: Session,
+        table: Table,
+        rows: List[Dict],
+        batch_size: int,
+        key: str = "code",
+    ) -> Dict[str, int]:
+        statement = insert(table).returning(
+            table.c.id, table.c[key], sort_by_parameter_order=True
+        )
+        ids = {}
+        for i in range(0, len(rows), batch_size):
+            results = session.execute(statement, rows[i : i + batch_size])
+            for row_id, row_key in results:
+                ids[row_key] = row_id
+        self._count(table, len(rows))
+        return ids
+
+
+class NullSink(Sink):
+    """Sink that discards rows, only counting them."""
+
+    def _write(
+        self, session: Session, table: Table, rows: Iterator[Dict]
+    ) -> int:
+        return sum(1 for _ in rows)
+
+
+class CollectingSink(Sink):
+    """Sink that keeps the rows written to each table in memory."""
+
+    def __init__(self):
+        super().__init__()
+        # Table name -> rows
+        self._tables: Dict[str, List[Dict]] = {}
+
+    def _write(
+        self, session: Session, table: Table, rows: Iterator[Dict]
+    ) -> int:
+        rows = list(rows)
+        with self._lock:
+            self._tables.setdefault(table.name, []).extend(rows)
+        return len(rows)
+
+    def get_rows(self) -> Dict[str, List[Dict]]:
+        """Get the rows written to each table.
+
+        Returns:
+            Dict[str, List[Dict]]: Table name -> rows
+        """
+        with self._lock:
+            return dict(self._tables)
+
+
+class FileSink(Sink):
+    """Sink that writes the rows of each table to a CSV or Parquet file named
+    after the table. Parquet requires pyarrow (pip install
+    hapi-pipelines[parquet]).
+
+    Args:
+        folder (str): Folder in which to write files
+        file_format (str): "csv" or "parquet". Defaults to "csv".
+    """
+
+    def __init__(
+        self, folder: str, file_format: _FILE_FORMATS_LITERAL = "csv"
+    ):
+        super().__init__()
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"File format must be one of {FILE_FORMATS}")
+        if file_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError(
+                    "Parquet output requires pyarrow: "
+                    "pip install hapi-pipelines[parquet]"
+                )
+        makedirs(folder, exist_ok=True)
+        self._folder = folder
+        self._file_format = file_format
+        # Table name -> (file, csv writer) or Parquet writer
+        self._writers: Dict[str, Any] = {}
+
+    def get_path(self, table: Table) -> str:
+        """Get the path of the file for a table.
+
+        Args:
+            table (Table): Table
+
+        Returns:
+            str: Path of file
+        """
+        return join(self._folder, f"{table.name}.{self._file_format}")
+
+    def _write(
+        self, session: Session, table: Table, rows: Iterator[Dict]
+    ) -> int:
+        columns = list(table.columns)
+        no_rows = 0
+        for batch_rows in get_batches(rows):
+            values = [
+                [
+                    get_typed_value(column, row.get(column.name))
+                    for column in columns
+                ]
+                for row in batch_rows
+            ]
+            # Themes run concurrently and can write to the same table
+            with self._lock:
+                if self._file_format == "csv":
+                    self._write_csv(table, values)
+                else:
+                    self._write_parquet(table, values)
+            no_rows += len(batch_rows)
+        return no_rows
+
+    def _write_csv(self, table: Table, values: List[List]) -> None:
+        writer = self._writers.get(table.name)
+        if writer is None:
+            file = open(
+                self.get_path(table), "w", newline="", encoding="utf-8"
+            )
+            writer = (file, csv.writer(file))
+            writer[1].writerow([column.name for column in table.columns])
+            self._writers[table.name] = writer
+        writer[1].writerows(
+            [["" if x is None else x for x in row] for row in values]
+        )
+
+    def _write_parquet(self, table: Table, values: List[List]) -> None:
+        import pyarrow.parquet as pq
+
+        schema = get_arrow_schema(table)
+        writer = self._writers.get(table.name)
+        if writer is None:
+            writer = pq.ParquetWriter(
+                self.get_path(table), schema, compression="zstd"
+            )
+            self._writers[table.name] = writer
+        writer.write_table(get_arrow_table(schema, values))
+
+    def close(self) -> None:
+        with self._lock:
+            for writer in self._writers.values():
+                if self._file_format == "csv":
+                    writer[0].close()
+                else:
+                    writer.close()
+            self._writers = {}
+
+
+def get_arrow_schema(table: Table):
+    """Get the Arrow schema of a table. Requires pyarrow.
+
+    Args:
+        table (Table): Table
+
+    Returns:
+        pyarrow.Schema: Arrow schema
+    """
+    import pyarrow as pa
+
+    fields = []
+    for column in table.columns:
+        column_type = column.type
+        if isinstance(column_type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column_type, BigInteger):
+            arrow_type = pa.int64()
+        elif isinstance(column_type, SmallInteger):
+            arrow_type = pa.int16()
+        elif isinstance(column_type, Integer):
+            arrow_type = pa.int32()
+        elif isinstance(column_type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column_type, Numeric):
+            if column_type.precision and column_type.scale is not None:
+                arrow_type = pa.decimal128(
+                    column_type.precision, column_type.scale
+                )
+            else:
+                arrow_type = pa.float64()
+        elif isinstance(column_type, DateTime):
+            timezone = "UTC" if column_type.timezone else None
+            arrow_type = pa.timestamp("us", tz=timezone)
+        elif isinstance(column_type, Date):
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.string()
+        # Values generated by the database are missing from rows written
+        # to files
+        nullable = (
+            column.nullable
+            or column.default is not None
+            or column.server_default is not None
+            or column is table.autoincrement_column
+        )
+        fields.append(pa.field(column.name, arrow_type, nullable))
+    return pa.schema(fields)
+
+
+def get_arrow_table(schema, rows: Sequence[Sequence]):
+    """Get an Arrow table from rows of values in the order of the columns of
+    an Arrow schema. Requires pyarrow.
+
+    Args:
+        schema (pyarrow.Schema): Arrow schema eg. from get_arrow_schema
+        rows (Sequence[Sequence]): Rows of values
+
+    Returns:
+        pyarrow.Table: Arrow table
+    """
+    import pyarrow as pa
+
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    arrays = []
+    for column_values, field in zip(columns, schema):
+        if pa.types.is_floating(field.type):
+            # Numeric columns without precision have Decimal values
+            column_values = [
+                None if x is None else float(x) for x in column_values
+            ]
+        arrays.append(pa.array(list(column_values), type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def populate_with_ids(
+    rows: List[Dict],
+    session: Session,
+    DBTable,
+    batch_size: int,
+    key: str = "code",
+) -> Dict[str, int]:
+    """Add rows to a table whose ids are generated by the database (or by
+    the sink if one is set) without committing.
+
+    Args:
+        rows (List[Dict]): Rows to add
+        session (Session): Session to use
+        DBTable: Table class eg. DBAdmin1
+        batch_size (int): Number of rows to add at a time
+        key (str): Column identifying rows. Defaults to "code".
+
+    Returns:
+        Dict[str, int]: Key of each row to its id
+    """
+    sink = get_sink(session) or DatabaseSink()
+    ids = sink.write_with_ids(
+        session, get_table(DBTable), rows, batch_size, key
+    )
+    instrumentation.add_count("rows_written", len(rows))
+    return ids
@@ -0,0 +1,264 @@
+"""Profile SQL statements and round trips by uploader.
+
+The profiler listens to the events of the database engine and of sessions.
+Every statement (a single execute or an executemany batch), commit and flush
+is attributed to the innermost active instrumentation stage, usually an
+uploader's populate (eg. Population.populate), and grouped under the theme
+being output. For each uploader, the number of statements, executemany
+batches and parameter sets, COPYs, commits and flushes, the total time spent
+in statements and flushes, and the slowest statements are recorded. A
+summary is logged per theme and can be added to the run report.
+
+COPY bypasses the events of the engine, so each COPY run by batch_populate
+is reported to the profiler by a COPY listener and recorded as a statement
+"COPY <table>" whose parameter sets are its rows.
+
+Flushes are listened to on all sessions and COPYs in all threads, so the
+profiler must be detached when done with it.
+"""
+
+import heapq
+import logging
+import re
+from collections import defaultdict
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session
+
+from .batch_populate import add_copy_listener, remove_copy_listener
+from .instrumentation import instrumentation
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class UploaderProfile:
+    def __init__(self):
+        self.statements = 0
+        self.executemany = 0
+        self.parameter_sets = 0
+        self.copies = 0
+        self.commits = 0
+        self.flushes = 0
+        self.statement_time = 0.0
+        self.flush_time = 0.0
+        # Min heap of (duration, statement, parameter sets)
+        self.slowest: List[Tuple[float, str, int]] = []
+
+    @property
+    def round_trips(self) -> int:
+        return self.statements + self.commits
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "statements": self.statements,
+            "executemany": self.executemany,
+            "parameter_sets": self.parameter_sets,
+            "copies": self.copies,
+            "commits": self.commits,
+            "flushes": self.flushes,
+            "round_trips": self.round_trips,
+            "statement_time": round(self.statement_time, 6),
+            "flush_time": round(self.flush_time, 6),
+            "slowest": [
+                {
+                    "duration": round(duration, 6),
+                    "statement": statement,
+                    "parameter_sets": parameter_sets,
+                }
+                for duration, statement, parameter_sets in sorted(
+                    self.slowest, reverse=True
+                )
+            ],
+        }
+
+
+class SQLProfiler:
+    """Profiler of SQL statements, commits and flushes by uploader.
+
+    Args:
+        slowest (int): Number of slowest statements to keep per uploader. Defaults to 5.
+        statement_length (int): Length to which to truncate statements. Defaults to 200.
+    """
+
+    def __init__(self, slowest: int = 5, statement_length: int = 200):
+        self._slowest = slowest
+        self._statement_length = statement_length
+        self._lock = Lock()
+        # Theme -> uploader -> profile
+        self.profiles: Dict[str, Dict[str, UploaderProfile]] = defaultdict(
+            lambda: defaultdict(UploaderProfile)
+        )
+        # (target, event name, listener) of attached listeners
+        self._listeners: List[Tuple[Any, str, Callable]] = []
+
+    def _get_profile(self) -> UploaderProfile:
+        theme, uploader = instrumentation.get_theme_and_uploader()
+        return self.profiles[theme][uploader]
+
+    def _add_statement(
+        self,
+        statement: str,
+        parameter_sets: int,
+        duration: float,
+        executemany: bool = False,
+        copy: bool = False,
+    ) -> None:
+        statement = statement[: self._statement_length]
+        slow_statement = (duration, statement, parameter_sets)
+        with self._lock:
+            profile = self._get_profile()
+            profile.statements += 1
+            profile.parameter_sets += parameter_sets
+            if executemany:
+                profile.executemany += 1
+            if copy:
+                profile.copies += 1
+            profile.statement_time += duration
+            if len(profile.slowest) < self._slowest:
+                heapq.heappush(profile.slowest, slow_statement)
+            else:
+                heapq.heappushpop(profile.slowest, slow_statement)
+
+    def _add_copy(
+        self, table_name: str, no_rows: int, duration: float
+    ) -> None:
+        self._add_statement(f"COPY {table_name}", no_rows, duration, copy=True)
+
+    def attach(self, engine: Engine) -> None:
+        """Listen to the statements and commits of an engine, the flushes
+        of all sessions and the COPYs run by batch_populate until detach is
+        called.
+
+        Args:
+            engine (Engine): Database engine
+
+        Returns:
+            None
+        """
+
+        def before_cursor_execute(
+            conn, cursor, statement, parameters, context, executemany
+        ):
+            # Kept on the execution context rather than the connection so
+            # that the start time of a statement that fails is discarded
+            # with it
+            if context is not None:
+                context.profile_start = perf_counter()
+
+        def after_cursor_execute(
+            conn, cursor, statement, parameters, context, executemany
+        ):
+            start = getattr(context, "profile_start", None)
+            if start is None:
+                return
+            duration = perf_counter() - start
+            if executemany:
+                parameter_sets = len(parameters)
+            else:
+                parameter_sets = 1
+            statement = _WHITESPACE.sub(" ", statement).strip()
+            self._add_statement(
+                statement, parameter_sets, duration, executemany=executemany
+            )
+
+        def commit(conn):
+            with self._lock:
+                self._get_profile().commits += 1
+
+        def before_flush(session, flush_context, instances):
+            session.info["profile_flush_start"] = perf_counter()
+
+        def after_flush_postexec(session, flush_context):
+            start = session.info.pop("profile_flush_start", None)
+            if start is None:
+                return
+            with self._lock:
+                profile = self._get_profile()
+                profile.flushes += 1
+                profile.flush_time += perf_counter() - start
+
+        self._listeners = [
+            (engine, "before_cursor_execute", before_cursor_execute),
+            (engine, "after_cursor_execute", after_cursor_execute),
+            (engine, "commit", commit),
+            # Theme sessions are created as needed so listen to all sessions
+            (Session, "before_flush", before_flush),
+            (Session, "after_flush_postexec", after_flush_postexec),
+        ]
+        for target, name, listener in self._listeners:
+            event.listen(target, name, listener)
+        add_copy_listener(self._add_copy)
+        logger.info("Profiling SQL statements")
+
+    def detach(self) -> None:
+        """Stop listening to the engine, sessions and COPYs.
+
+        Returns:
+            None
+        """
+        if not self._listeners:
+            return
+        for target, name, listener in self._listeners:
+            event.remove(target, name, listener)
+        self._listeners = []
+        remove_copy_listener(self._add_copy)
+
+    def get_summary(self) -> Dict[str, Dict[str, Dict]]:
+        """Get the profile of each uploader grouped by theme.
+
+        Returns:
+            Dict[str, Dict[str, Dict]]: Theme -> uploader -> profile
+        """
+        with self._lock:
+            return {
+                theme: {
+                    uploader: profile.to_dict()
+                    for uploader, profile in uploaders.items()
+                }
+                for theme, uploaders in self.profiles.items()
+            }
+
+    def log_summary(self) -> None:
+        """Log the profile of each theme and its uploaders, themes with most
+        round trips first.
+
+        Returns:
+            None
+        """
+        summary = self.get_summary()
+
+        def get_total(uploaders: Dict[str, Dict], key: str) -> float:
+            return sum(profile[key] for profile in uploaders.values())
+
+        for theme, uploaders in sorted(
+            summary.items(),
+            key=lambda x: get_total(x[1], "round_trips"),
+            reverse=True,
+        ):
+            logger.info(
+                f"SQL profile of {theme}: "
+                f"{get_total(uploaders, 'round_trips')} round trips, "
+                f"{get_total(uploaders, 'statement_time'):.2f}s in statements"
+            )
+            for uploader, profile in uploaders.items():
+                logger.info(
+                    f"  {uploader}: {profile['statements']} statements "
+                    f"({profile['executemany']} executemany and "
+                    f"{profile['copies']} COPY with "
+                    f"{profile['parameter_sets']} parameter sets), "
+                    f"{profile['commits']} commits, "
+                    f"{profile['flushes']} flushes, "
+                    f"{profile['statement_time']:.2f}s in statements, "
+                    f"{profile['flush_time']:.2f}s in flushes"
+                )
+                for slow in profile["slowest"]:
+                    logger.info(
+                        f"    {slow['duration']:.3f}s "
+                        f"({slow['parameter_sets']} parameter sets): "
+                        f"{slow['statement']}"
+                    )
@@ -0,0 +1,283 @@
+"""Generate larger synthetic inputs from the test fixtures for load testing.
+
+Inputs are scaled up by a multiplier by adding copies of the existing data
+that are made distinct from the original in the way the data would grow in
+production, so that the distributions of admin units, sectors, commodities
+etc. and the rate of duplicate rows within each copy stay as they are:
+
+- Runner results (and the WFP price CSVs) grow in history: copy k is moved
+  back in time by k times the number of years the data covers (rounded up to
+  a multiple of 4 so that 29 February stays valid). The dataset time period
+  and any year or date columns are shifted, so eg. a multiplier of 2 doubles
+  the history of ACLED conflict events. A fraction of the organisations in
+  each copy also get new names so that the org table grows too.
+- HNO CSVs grow in disaggregation: copy k has its age ranges relabelled.
+"""
+
+import csv
+import random
+import re
+from copy import deepcopy
+from datetime import date, datetime
+from logging import getLogger
+from math import ceil
+from os import listdir, makedirs
+from os.path import join
+from shutil import copy2
+from typing import Any, Dict, List, Optional
+
+logger = getLogger(__name__)
+
+_YEAR = re.compile(r"(?<!\d)(1[89]\d\d|2\d\d\d)(?!\d)")
+
+
+def _is_year_tag(hxl_tag: str) -> bool:
+    base, *attributes = hxl_tag.split("+")
+    if base == "#year":
+        return True
+    return base == "#date" and bool({"year", "years"} & set(attributes))
+
+
+def _is_date_tag(hxl_tag: str) -> bool:
+    base, *attributes = hxl_tag.split("+")
+    if base != "#date":
+        return False
+    return not {"year", "years", "month", "months"} & set(attributes)
+
+
+def _get_year(value: Any) -> Optional[int]:
+    if isinstance(value, (date, datetime)):
+        return value.year
+    match = _YEAR.search(str(value))
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def _get_shift(years: List[int]) -> int:
+    """Get the number of years by which to shift each copy: the number of
+    years covered rounded up to a multiple of 4 so that leap days stay
+    valid."""
+    if not years:
+        return 4
+    span = max(years) - min(years) + 1
+    return ceil(span / 4) * 4
+
+
+def shift_years(value: Any, years: int) -> Any:
+    """Shift the years in a value back. Dates and datetimes are shifted
+    keeping month and day, integers are treated as years and any years in
+    strings (eg. 2023-01-15 or 2019-2020) are shifted.
+
+    Args:
+        value (Any): Value to shift
+        years (int): Number of years to shift back
+
+    Returns:
+        Any: Shifted value
+    """
+    if isinstance(value, (date, datetime)):
+        return value.replace(year=value.year - years)
+    if isinstance(value, int):
+        return value - years
+    if isinstance(value, str):
+        return _YEAR.sub(lambda x: str(int(x.group(1)) - years), value)
+    return value
+
+
+def _get_org_columns(hxl_tags: List[str]) -> List[int]:
+    return [
+        i
+        for i, hxl_tag in enumerate(hxl_tags)
+        if hxl_tag in ("#org+name", "#org+acronym")
+    ]
+
+
+def _copy_dataset(
+    dataset: Dict,
+    copy_no: int,
+    shift: int,
+    rng: random.Random,
+    new_org_rate: float,
+) -> Dict:
+    dataset = deepcopy(dataset)
+    years = copy_no * shift
+    time_period = dataset.get("time_period")
+    if time_period:
+        for key in ("start", "end"):
+            time_period[key] = shift_years(time_period[key], years)
+    for admin_results in dataset["results"].values():
+        hxl_tags = admin_results["headers"][1]
+        values = admin_results["values"]
+        for i, hxl_tag in enumerate(hxl_tags):
+            if not (_is_year_tag(hxl_tag) or _is_date_tag(hxl_tag)):
+                continue
+            for admin_code, value in values[i].items():
+                if isinstance(value, list):
+                    values[i][admin_code] = [
+                        shift_years(x, years) for x in value
+                    ]
+                else:
+                    values[i][admin_code] = shift_years(value, years)
+        org_columns = _get_org_columns(hxl_tags)
+        if not org_columns:
+            continue
+        # Decide once per organisation so name and acronym stay consistent
+        renamed = {}
+        for admin_code, org_names in values[org_columns[0]].items():
+            if not isinstance(org_names, list):
+                continue
+            for irow, org_name in enumerate(org_names):
+                if org_name not in renamed:
+                    renamed[org_name] = rng.random() < new_org_rate
+                if not renamed[org_name]:
+                    continue
+                for column in org_columns:
+                    value = values[column][admin_code][irow]
+                    if value:
+                        values[column][admin_code][irow] = f"{value} {copy_no}"
+    return dataset
+
+
+def _get_dataset_years(dataset: Dict) -> List[int]:
+    years = []
+    time_period = dataset.get("time_period")
+    if time_period:
+        for key in ("start", "end"):
+            year = _get_year(time_period.get(key))
+            if year:
+                years.append(year)
+    for admin_results in dataset["results"].values():
+        for hxl_tag, column in zip(
+            admin_results["headers"][1], admin_results["values"]
+        ):
+            if not (_is_year_tag(hxl_tag) or _is_date_tag(hxl_tag)):
+                continue
+            for value in column.values():
+                for x in value if isinstance(value, list) else (value,):
+                    year = _get_year(x)
+                    if year:
+                        years.append(year)
+    return years
+
+
+def scale_results(
+    results: Dict,
+    multiplier: int,
+    new_org_rate: float = 0.1,
+    seed: int = 0,
+) -> Dict:
+    """Scale up Runner HAPI results (as returned by get_hapi_results) by
+    adding multiplier - 1 copies of each dataset moved back in time.
+
+    Args:
+        results (Dict): Runner HAPI results
+        multiplier (int): Multiplier
+        new_org_rate (float): Fraction of orgs renamed in each copy. Defaults to 0.1.
+        seed (int): Seed of random number generator. Defaults to 0.
+
+    Returns:
+        Dict: Scaled results
+    """
+    rng = random.Random(seed)
+    scaled = dict(results)
+    for dataset_id, dataset in results.items():
+        shift = _get_shift(_get_dataset_years(dataset))
+        for copy_no in range(1, multiplier):
+            scaled[f"{dataset_id}_synthetic_{copy_no}"] = _copy_dataset(
+                dataset, copy_no, shift, rng, new_org_rate
+            )
+    return scaled
+
+
+def _read_csv_tags(path: str) -> List[str]:
+    with open(path, newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        return next(reader, [])
+
+
+def scale_csv(input_path: str, output_path: str, multiplier: int) -> int:
+    """Scale up a HXLated CSV. If it has a #date column (eg. WFP prices),
+    each copy is moved back in time by the number of years covered. If it
+    has an #age+range column (eg. HNO), each copy has its age ranges
+    relabelled. The file is streamed once per copy.
+
+    Args:
+        input_path (str): Path of input CSV
+        output_path (str): Path of output CSV
+        multiplier (int): Multiplier
+
+    Returns:
+        int: Number of rows written
+    """
+    hxl_tags = _read_csv_tags(input_path)
+    date_columns = [i for i, x in enumerate(hxl_tags) if _is_date_tag(x)]
+    age_range_columns = [
+        i for i, x in enumerate(hxl_tags) if x == "#age+range"
+    ]
+    shift = 0
+    if date_columns:
+        years = []
+        with open(input_path, newline="", encoding="utf-8") as file:
+            reader = csv.reader(file)
+            next(reader)
+            next(reader)
+            for row in reader:
+                for column in date_columns:
+                    year = _get_year(row[column])
+                    if year:
+                        years.append(year)
+        shift = _get_shift(years)
+    no_rows = 0
+    with open(output_path, "w", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        for copy_no in range(multiplier):
+            with open(input_path, newline="", encoding="utf-8") as file:
+                reader = csv.reader(file)
+                header = next(reader)
+                hxl_row = next(reader)
+                if copy_no == 0:
+                    writer.writerow(header)
+                    writer.writerow(hxl_row)
+                for row in reader:
+                    if copy_no:
+                        for column in date_columns:
+                            row[column] = shift_years(
+                                row[column], copy_no * shift
+                            )
+                        for column in age_range_columns:
+                            row[column] = f"{row[column]}_{copy_no}"[:32]
+                    writer.writerow(row)
+                    no_rows += 1
+    return no_rows
+
+
+def scale_fixtures(
+    input_folder: str, output_folder: str, multiplier: int
+) -> None:
+    """Write a copy of a folder of saved data with WFP price CSVs and HNO
+    CSVs scaled up. Other files are copied as they are (Runner results are
+    scaled in memory by scale_results).
+
+    Args:
+        input_folder (str): Folder of saved data
+        output_folder (str): Folder for scaled data
+        multiplier (int): Multiplier
+
+    Returns:
+        None
+    """
+    makedirs(output_folder, exist_ok=True)
+    for filename in sorted(listdir(input_folder)):
+        input_path = join(input_folder, filename)
+        output_path = join(output_folder, filename)
+        if filename.endswith(".csv"):
+            hxl_tags = _read_csv_tags(input_path)
+            is_wfp = "#loc+market+name" in hxl_tags and "#date" in hxl_tags
+            is_hno = "#inneed" in hxl_tags and "#age+range" in hxl_tags
+            if is_wfp or is_hno:
+                no_rows = scale_csv(input_path, output_path, multiplier)
+                logger.info(f"Scaled {filename} to {no_rows} rows")
+                continue
+        copy2(input_path, output_path)
@@ -0,0 +1,108 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import hxl
+from hapi_schema.db_admin1 import DBAdmin1
+from hapi_schema.db_admin2 import DBAdmin2
+from hapi_schema.db_location import DBLocation
+from hdx.database import Database
+from sqlalchemy import select
+
+from hapi.pipelines.database.admins import Admins
+from hapi.pipelines.utilities.batch_populate import set_incremental
+
+_HEADERS = [
+    "#country+code",
+    "#geo+admin_level",
+    "#adm+code",
+    "#adm+name",
+    "#adm+code+parent",
+    "#date+start",
+]
+
+
+def _get_admins(session, rows):
+    configuration = {"commit_limit": 2, "orphan_admin2s": {"AF9901": "AFG"}}
+    locations = SimpleNamespace(
+        data={},
+        reference_period_starts={},
+        hapi_countries=["AFG"],
+    )
+    for location in session.execute(
+        select(
+            DBLocation.id, DBLocation.code, DBLocation.reference_period_start
+        )
+    ):
+        locations.data[location[1]] = location[0]
+        locations.reference_period_starts[location[1]] = location[2]
+    dataset = hxl.data([_HEADERS] + rows).cache()
+    return Admins(configuration, session, locations, dataset)
+
+
+def test_admins(tmp_path):
+    dbpath = str(tmp_path / "test_admins.db")
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        session.add(
+            DBLocation(
+                code="AFG",
+                name="Afghanistan",
+                reference_period_start=datetime(2020, 1, 1),
+            )
+        )
+        session.commit()
+        rows = [
+            ["AFG", "1", "AF01", "Kabul", "AFG", "2021-01-01"],
+            ["AFG", "1", "AF02", "Kapisa", "AFG", "2021-01-01"],
+            ["AFG", "2", "AF0101", "Kabul", "AF01", "2022-01-01"],
+            ["AFG", "2", "AF9901", "Orphan", "AF99", "2022-01-01"],
+            ["AFG", "2", "AF9902", "Missing", "AF99", "2022-01-01"],
+            ["BFA", "1", "BF01", "Boucle", "BFA", "2021-01-01"],
+        ]
+        admins = _get_admins(session, rows)
+        admins.populate()
+        results = session.execute(
+            select(
+                DBAdmin1.code, DBAdmin1.is_unspecified, DBLocation.code
+            ).join(DBLocation, DBAdmin1.location_ref == DBLocation.id)
+        )
+        assert sorted(tuple(result) for result in results) == [
+            ("AF01", False, "AFG"),
+            ("AF02", False, "AFG"),
+            ("AFG-XXX", True, "AFG"),
+        ]
+        results = session.execute(
+            select(
+                DBAdmin2.code,
+                DBAdmin2.reference_period_start,
+                DBAdmin1.code,
+            ).join(DBAdmin1, DBAdmin2.admin1_ref == DBAdmin1.id)
+        )
+        assert sorted(tuple(result) for result in results) == [
+            ("AF01-XXX", datetime(2021, 1, 1), "AF01"),
+            ("AF0101", datetime(2022, 1, 1), "AF01"),
+            ("AF02-XXX", datetime(2021, 1, 1), "AF02"),
+            ("AF9901", datetime(2022, 1, 1), "AFG-XXX"),
+            ("AFG-XXX-XXX", datetime(2020, 1, 1), "AFG-XXX"),
+        ]
+        assert admins.admin1_data == {
+            code: admin_id
+            for admin_id, code in session.execute(
+                select(DBAdmin1.id, DBAdmin1.code)
+            )
+        }
+        assert admins.get_admin_level("AF0101") == "2"
+
+        set_incremental(session)
+        rows.append(["AFG", "1", "AF03", "Parwan", "AFG", "2023-01-01"])
+        admins = _get_admins(session, rows)
+        admins.populate()
+        assert session.query(DBAdmin1).count() == 4
+        assert session.query(DBAdmin2).count() == 6
+        assert len(admins.admin1_data) == 4
+        assert len(admins.admin2_data) == 6
+        assert session.scalar(
+            select(DBAdmin2.reference_period_start).where(
+                DBAdmin2.code == "AF03-XXX"
+            )
+        ) == datetime(2023, 1, 1)
@@ -0,0 +1,208 @@
+import enum
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from hapi_schema.db_currency import DBCurrency
+from hdx.database import Database
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Enum,
+    Integer,
+    MetaData,
+    Numeric,
+    String,
+    Table,
+    select,
+    text,
+)
+from sqlalchemy.orm import Session
+
+from hapi.pipelines.utilities.batch_populate import (
+    _get_csv_line,
+    batch_populate,
+    delete_stale_resources,
+    set_incremental,
+)
+
+
+def test_get_csv_line():
+    assert _get_csv_line(["AFG", None, "", 1, 2.5, True]) == (
+        '"AFG",,"",1,2.5,t\n'
+    )
+    assert _get_csv_line(['say "hi", again']) == '"say ""hi"", again"\n'
+    date = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+    assert _get_csv_line([date]) == "2024-01-01 12:00:00+00:00\n"
+    date = datetime(2024, 1, 1, 16, 30, tzinfo=timezone(timedelta(hours=4.5)))
+    assert _get_csv_line([date]) == "2024-01-01 12:00:00+00:00\n"
+
+
+def test_batch_populate(tmp_path):
+    dbpath = str(tmp_path / "test_batch_populate.db")
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        rows = (
+            dict(code=f"C{i:03d}", name=f"Currency {i}") for i in range(2500)
+        )
+        assert batch_populate(rows, session, DBCurrency) == 2500
+        assert session.query(DBCurrency).count() == 2500
+        assert batch_populate([], session, DBCurrency) == 0
+        rows = ((f"T{i:03d}", f"Tuple {i}") for i in range(1500))
+        assert (
+            batch_populate(
+                rows, session, DBCurrency, column_names=("code", "name")
+            )
+            == 1500
+        )
+        assert session.query(DBCurrency).count() == 4000
+
+
+def test_batch_populate_incremental(tmp_path):
+    dbpath = str(tmp_path / "test_batch_populate_incremental.db")
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        rows = [
+            dict(code="AFN", name="Afghani"),
+            dict(code="USD", name="US Dollar"),
+        ]
+        batch_populate(rows, session, DBCurrency)
+        set_incremental(session)
+        rows = [
+            dict(code="AFN", name="Afghan Afghani"),
+            dict(code="USD", name="US Dollar"),
+            dict(code="XOF", name="CFA Franc BCEAO"),
+        ]
+        assert batch_populate(rows, session, DBCurrency) == 2
+        results = session.execute(
+            select(DBCurrency.code, DBCurrency.name).order_by(DBCurrency.code)
+        )
+        assert [tuple(result) for result in results] == [
+            ("AFN", "Afghan Afghani"),
+            ("USD", "US Dollar"),
+            ("XOF", "CFA Franc BCEAO"),
+        ]
+
+
+def test_batch_populate_incremental_resources(tmp_path):
+    dbpath = str(tmp_path / "test_batch_populate_incremental_resources.db")
+    table = Table(
+        "resource_test",
+        MetaData(),
+        Column("resource_hdx_id", String(36), nullable=False),
+        Column("code", String(32), primary_key=True),
+        Column("value", Integer, nullable=False),
+    )
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        table.create(session.get_bind())
+        rows = [
+            dict(resource_hdx_id=f"r{i % 3}", code=f"C{i:04d}", value=i)
+            for i in range(2500)
+        ]
+        batch_populate(rows, session, table)
+        set_incremental(session)
+        # Rows span several batches: one row changes, two of the rows of
+        # resource r1 disappear and resource r2 is not loaded at all
+        rows = [row for row in rows if row["resource_hdx_id"] != "r2"]
+        rows = [dict(row) for row in rows if row["code"] not in ("C0001",)]
+        rows = [row for row in rows if row["code"] != "C2497"]
+        rows[-1]["value"] = -1
+        assert batch_populate(iter(rows), session, table) == 1
+        assert session.query(table).count() == 2500 - 2
+        assert delete_stale_resources(session, table, ("r0", "r1")) == 833
+        results = session.execute(
+            select(table.c.resource_hdx_id)
+            .distinct()
+            .order_by(table.c.resource_hdx_id)
+        )
+        assert list(results.scalars()) == ["r0", "r1"]
+        assert session.query(table).count() == len(rows)
+        assert (
+            session.execute(
+                select(table.c.value).where(table.c.code == rows[-1]["code"])
+            ).scalar_one()
+            == -1
+        )
+        assert delete_stale_resources(session, table, ("r0", "r1")) == 0
+
+
+class CopyTestEnum(str, enum.Enum):
+    FIRST = "first value"
+    SECOND = "second value"
+
+
+@pytest.mark.parametrize("copy_format", ("csv", "binary"))
+def test_batch_populate_copy(engine, copy_format):
+    table = Table(
+        f"copy_test_{copy_format}",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("name", String(64), nullable=True),
+        Column("amount", Numeric, nullable=True),
+        Column("date", DateTime, nullable=True),
+        Column("timestamp", DateTime(timezone=True), nullable=True),
+        Column(
+            "kind",
+            Enum(
+                CopyTestEnum,
+                name=f"copy_test_{copy_format}_enum",
+                values_callable=lambda x: [member.value for member in x],
+            ),
+            nullable=True,
+        ),
+    )
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    kabul = timezone(timedelta(hours=4, minutes=30))
+    rows = [
+        dict(
+            id=1,
+            name='say "hi", again\nand again\\',
+            amount=Decimal("1234567.000000001"),
+            date=datetime(2024, 1, 1, 16, 30, tzinfo=kabul),
+            timestamp=datetime(2024, 1, 1, 16, 30, tzinfo=kabul),
+            kind=CopyTestEnum.FIRST,
+        ),
+        dict(
+            id=2,
+            name="",
+            amount=Decimal("-0.5"),
+            date=datetime(2024, 2, 29),
+            timestamp=datetime(2024, 2, 29, tzinfo=timezone.utc),
+            kind=CopyTestEnum.SECOND,
+        ),
+        dict(id=3, name=None, amount=None, date=None, timestamp=None),
+    ]
+    try:
+        with Session(engine) as session:
+            # Timestamps must not depend upon the session time zone
+            session.execute(text("SET TIME ZONE 'America/New_York'"))
+            assert (
+                batch_populate(rows, session, table, copy_format=copy_format)
+                == 3
+            )
+        with engine.connect() as connection:
+            results = connection.execute(select(table).order_by(table.c.id))
+            assert [tuple(result) for result in results] == [
+                (
+                    1,
+                    'say "hi", again\nand again\\',
+                    Decimal("1234567.000000001"),
+                    datetime(2024, 1, 1, 12, 0),
+                    datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc),
+                    CopyTestEnum.FIRST,
+                ),
+                (
+                    2,
+                    "",
+                    Decimal("-0.5"),
+                    datetime(2024, 2, 29),
+                    datetime(2024, 2, 29, tzinfo=timezone.utc),
+                    CopyTestEnum.SECOND,
+                ),
+                (3, None, None, None, None, None),
+            ]
+    finally:
+        table.drop(engine)
+        table.c.kind.type.drop(engine, checkfirst=True)
@@ -0,0 +1,60 @@
+import tracemalloc
+
+from hapi.pipelines.app.benchmark import compare
+from hapi.pipelines.utilities.instrumentation import instrumentation
+
+
+def _result(rows_written, seconds, peak_memory):
+    return {
+        "rows_read": rows_written,
+        "rows_written": rows_written,
+        "seconds": seconds,
+        "peak_memory": peak_memory,
+        "rows_per_second": rows_written / seconds if rows_written else 0.0,
+    }
+
+
+def test_compare():
+    baseline = {
+        "population": {
+            "Population.populate": _result(1000, 1.0, 1000000),
+            "Metadata.populate": _result(0, 0.5, 1000),
+        },
+        "funding": {"Funding.populate": _result(50, 0.01, 1000)},
+    }
+    results = {
+        "population": {
+            "Population.populate": _result(1000, 1.2, 1100000),
+            "Metadata.populate": _result(0, 0.55, 1000),
+        },
+        # Too fast to compare timings
+        "funding": {"Funding.populate": _result(50, 0.02, 1000)},
+        "refugees": {"Refugees.populate": _result(10, 1.0, 1000)},
+    }
+    assert compare(results, baseline) == []
+
+    results["population"]["Population.populate"] = _result(1000, 2.0, 2000000)
+    results["population"]["Metadata.populate"] = _result(0, 1.0, 1000)
+    assert compare(results, baseline) == [
+        "population Population.populate: 500 rows/s vs 1000 in baseline",
+        "population Population.populate: peak memory 2000000 bytes vs "
+        "1000000 in baseline",
+        "population Metadata.populate: 1.000s vs 0.500s in baseline",
+    ]
+
+
+def test_peak_traced():
+    tracemalloc.start()
+    try:
+        with instrumentation.stage("test_benchmark_outer") as outer:
+            with instrumentation.stage("test_benchmark_inner") as inner:
+                data = bytearray(10 * 1024**2)
+                del data
+            with instrumentation.stage("test_benchmark_after") as after:
+                data = bytearray(1024)
+                del data
+    finally:
+        tracemalloc.stop()
+    assert inner.peak_traced >= 10 * 1024**2
+    assert outer.peak_traced >= inner.peak_traced
+    assert after.peak_traced < 1024**2
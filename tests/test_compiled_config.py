@@ -0,0 +1,46 @@
+from os import listdir
+from os.path import join
+
+from hapi.pipelines.app import compiled_config, load_yamls
+from hapi.pipelines.app.compiled_config import (
+    compile_config,
+    get_config_hash,
+    get_default_folder,
+    load_config,
+)
+from hapi.pipelines.utilities.process_config_defaults import add_defaults
+
+
+def test_compiled_config(tmp_path):
+    folder = str(tmp_path)
+    config_files = ("core.yaml", "funding.yaml")
+    expected = add_defaults(load_yamls(config_files))
+    config_hash = get_config_hash(config_files)
+    assert load_config(config_files, folder) == expected
+    assert listdir(folder) == [f"config-{config_hash}.pickle"]
+    # Second load comes from compiled configuration
+    assert load_config(config_files, folder) == expected
+
+    # Compiled configuration for other inputs is replaced
+    other_files = ("core.yaml",)
+    other_hash = get_config_hash(other_files)
+    assert other_hash != config_hash
+    compile_config(other_files, folder)
+    assert listdir(folder) == [f"config-{other_hash}.pickle"]
+
+
+def test_get_config_hash(monkeypatch):
+    config_files = ("core.yaml",)
+    config_hash = get_config_hash(config_files)
+    monkeypatch.setattr(compiled_config, "version", lambda package: "0.0.1")
+    assert get_config_hash(config_files) != config_hash
+
+
+def test_get_default_folder(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONFIG_CACHE_DIR", str(tmp_path))
+    assert get_default_folder() == str(tmp_path)
+    monkeypatch.delenv("CONFIG_CACHE_DIR")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert get_default_folder() == join(
+        str(tmp_path), "hapi-pipelines", "compiled_config"
+    )
@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+import io
+from os import listdir
+from os.path import getmtime
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from hapi.pipelines.utilities import csv_export as csv_export_module
+from hapi.pipelines.utilities.csv_export import CSVExport, fan_out
+
+
+def test_fan_out():
+    chunks = [b"a,b\n", b"1,2\n", b"3,4\n"]
+    md5 = hashlib.md5()
+    file = io.BytesIO()
+    with gzip.GzipFile(fileobj=file, mode="wb") as gzip_file:
+        assert fan_out(iter(chunks), (gzip_file.write, md5.update)) == 12
+    assert gzip.decompress(file.getvalue()) == b"a,b\n1,2\n3,4\n"
+    assert md5.hexdigest() == hashlib.md5(b"a,b\n1,2\n3,4\n").hexdigest()
+
+    def fail(chunk):
+        raise OSError("Disk full")
+
+    with pytest.raises(OSError):
+        fan_out(iter(chunks * 100), (md5.update, fail))
+
+
+def test_csv_export(tmp_path):
+    with pytest.raises(ValueError):
+        CSVExport(create_engine("sqlite://"), str(tmp_path))
+    csv_export = CSVExport(
+        create_engine("postgresql+psycopg://postgres@localhost:5432/hapi"),
+        str(tmp_path),
+    )
+    assert csv_export.get_csv_path("org_view").endswith("org_view.csv.gz")
+    assert csv_export.get_previous_hash("org_view") is None
+    (tmp_path / "org_view.hash").write_text("abc123\n")
+    assert csv_export.get_previous_hash("org_view") == "abc123"
+
+
+def test_export_one(monkeypatch, engine, tmp_path):
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE csv_export_test (id integer PRIMARY KEY, "
+                "name text)"
+            )
+        )
+        connection.execute(
+            text("INSERT INTO csv_export_test VALUES (1, 'a'), (2, 'b')")
+        )
+        connection.execute(
+            text(
+                "CREATE VIEW csv_export_test_view AS "
+                "SELECT * FROM csv_export_test ORDER BY id"
+            )
+        )
+    try:
+        csv_export = CSVExport(engine, str(tmp_path), workers=1)
+        view = "csv_export_test_view"
+        csv_path = csv_export.get_csv_path(view)
+        assert csv_export.export_one(view) is True
+        with gzip.open(csv_path) as file:
+            data = file.read()
+        assert data == b"id,name\n1,a\n2,b\n"
+        assert (
+            csv_export.get_previous_hash(view) == hashlib.md5(data).hexdigest()
+        )
+
+        # Unchanged view is left alone, read once only to hash it
+        copies = []
+        gzip_files = []
+        copy = csv_export._copy
+        gzip_file = gzip.GzipFile
+
+        def count_copy(copy_view):
+            copies.append(copy_view)
+            return copy(copy_view)
+
+        def count_gzip_file(*args, **kwargs):
+            gzip_files.append(kwargs)
+            return gzip_file(*args, **kwargs)
+
+        monkeypatch.setattr(csv_export, "_copy", count_copy)
+        monkeypatch.setattr(
+            csv_export_module.gzip, "GzipFile", count_gzip_file
+        )
+        mtime = getmtime(csv_path)
+        assert csv_export.export_one(view) is False
+        assert getmtime(csv_path) == mtime
+        assert sorted(listdir(tmp_path)) == [
+            f"{view}.csv.gz",
+            f"{view}.hash",
+        ]
+        assert copies == [view]
+        assert gzip_files == []
+
+        with engine.begin() as connection:
+            connection.execute(
+                text("UPDATE csv_export_test SET name = 'c' WHERE id = 2")
+            )
+        copies.clear()
+        assert csv_export.export_one(view) is True
+        # Changed view is hashed, then read again to be compressed
+        assert copies == [view, view]
+        assert len(gzip_files) == 1
+        monkeypatch.undo()
+        with gzip.open(csv_path) as file:
+            assert file.read() == b"id,name\n1,a\n2,c\n"
+        forced_export = CSVExport(engine, str(tmp_path), force=True)
+        assert forced_export.export_one(view) is True
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text("DROP VIEW csv_export_test_view"))
+            connection.execute(text("DROP TABLE csv_export_test"))
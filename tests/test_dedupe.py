@@ -0,0 +1,24 @@
+from hapi.pipelines.utilities.dedupe import Dedupe
+
+
+def test_dedupe():
+    dedupe = Dedupe()
+    row = {"admin2_ref": 1, "event_type": "civilian_targeting", "events": 2}
+    assert dedupe.is_duplicate(row, "dataset-1") is False
+    assert dedupe.is_duplicate(dict(row), "dataset-1") is True
+    assert dedupe.is_duplicate({**row, "events": 3}, "dataset-1") is False
+    assert dedupe.is_duplicate(dict(row), "dataset-2") is True
+    assert dedupe.is_duplicate(dict(row), "dataset-2") is True
+    dedupe.reset()
+    assert dedupe.is_duplicate(dict(row), "dataset-2") is False
+    assert dedupe.number_duplicates == 3
+    messages = set()
+    dedupe.add_messages(messages)
+    assert messages == {
+        "dataset-1 - 1 duplicate rows",
+        "dataset-2 - 2 duplicate rows",
+    }
+
+    dedupe = Dedupe(key_fields=("admin2_ref", "event_type"))
+    assert dedupe.is_duplicate(row) is False
+    assert dedupe.is_duplicate({**row, "events": 3}) is True
@@ -0,0 +1,124 @@
+from datetime import datetime
+
+import pytest
+from hapi_schema.db_admin1 import DBAdmin1
+from hapi_schema.db_location import DBLocation
+from hapi_schema.views import prepare_hapi_views
+from hdx.database import Database
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from hapi.pipelines.utilities.batch_populate import batch_populate
+from hapi.pipelines.utilities.deferred_constraints import DeferredConstraints
+
+
+def test_deferred_constraints():
+    with pytest.raises(ValueError):
+        DeferredConstraints(create_engine("sqlite://"))
+    engine = create_engine("postgresql+psycopg://postgres@localhost/hapi")
+    with pytest.raises(ValueError):
+        DeferredConstraints(engine, workers=0)
+    deferred_constraints = DeferredConstraints(engine)
+    assert deferred_constraints.indexes == []
+    assert deferred_constraints.foreign_keys == []
+
+
+def test_deferred_constraints_restore(db_uri):
+    schema = "deferred_test"
+    engine = create_engine(
+        db_uri,
+        poolclass=NullPool,
+        connect_args={"options": f"-csearch_path={schema}"},
+    )
+
+    def get_indexes(connection):
+        results = connection.execute(
+            text(
+                "SELECT tablename, indexname, indexdef FROM pg_indexes "
+                "WHERE schemaname = :schema ORDER BY tablename, indexname"
+            ),
+            {"schema": schema},
+        )
+        return [tuple(result) for result in results]
+
+    def get_foreign_keys(connection):
+        results = connection.execute(
+            text(
+                "SELECT c.relname, k.conname, k.convalidated "
+                "FROM pg_constraint k "
+                "JOIN pg_class c ON c.oid = k.conrelid "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = :schema AND k.contype = 'f' "
+                "ORDER BY c.relname, k.conname"
+            ),
+            {"schema": schema},
+        )
+        return [tuple(result) for result in results]
+
+    try:
+        with Database(
+            engine=engine,
+            recreate_schema=True,
+            schema=schema,
+            prepare_fn=prepare_hapi_views,
+        ) as database:
+            with engine.connect() as connection:
+                indexes = get_indexes(connection)
+                foreign_keys = get_foreign_keys(connection)
+            deferred_constraints = DeferredConstraints(engine, workers=2)
+            deferred_constraints.defer()
+            assert len(deferred_constraints.foreign_keys) == len(foreign_keys)
+            with engine.connect() as connection:
+                assert get_foreign_keys(connection) == []
+                # Only indexes of primary keys and unique constraints are left
+                remaining = get_indexes(connection)
+                assert len(remaining) == len(indexes) - len(
+                    deferred_constraints.indexes
+                )
+                assert "ix_admin1_code" not in {x[1] for x in remaining}
+
+            session = database.get_session()
+            batch_populate(
+                [
+                    dict(
+                        id=1,
+                        code="AFG",
+                        name="Afghanistan",
+                        reference_period_start=datetime(2024, 1, 1),
+                    )
+                ],
+                session,
+                DBLocation,
+            )
+            batch_populate(
+                [
+                    dict(
+                        id=i,
+                        location_ref=1,
+                        code=f"AF{i:02d}",
+                        name=f"Province {i}",
+                        reference_period_start=datetime(2024, 1, 1),
+                    )
+                    for i in range(1, 35)
+                ],
+                session,
+                DBAdmin1,
+            )
+            session.close()
+
+            deferred_constraints.restore()
+            with engine.connect() as connection:
+                assert get_indexes(connection) == indexes
+                restored = get_foreign_keys(connection)
+                assert restored == foreign_keys
+                assert all(validated for _, _, validated in restored)
+                assert (
+                    connection.scalar(
+                        text("SELECT count(*) FROM admin1 WHERE code = 'AF07'")
+                    )
+                    == 1
+                )
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        engine.dispose()
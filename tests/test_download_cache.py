@@ -0,0 +1,87 @@
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from os import utime
+from os.path import basename
+from threading import Thread
+
+import pytest
+from hdx.utilities.downloader import Download
+
+from hapi.pipelines.utilities.download_cache import (
+    DEFAULT_RATE_LIMIT,
+    CachedDownload,
+    DownloadCache,
+    clone_downloader,
+)
+
+
+@pytest.fixture
+def server(tmp_path):
+    folder = tmp_path / "server"
+    folder.mkdir()
+    handler = partial(SimpleHTTPRequestHandler, directory=str(folder))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield folder, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_cache(tmp_path, server):
+    folder, url = server
+    (folder / "a.csv").write_text("a,b\n1,2\n")
+    (folder / "b.csv").write_text("a,b\n1,2\n")
+    (folder / "c.csv").write_text("c,d\n3,4\n")
+    cache = DownloadCache(str(tmp_path / "cache"), max_size=16)
+    downloader = CachedDownload(cache, user_agent="test")
+    path = downloader.download_file(f"{url}/a.csv")
+    assert basename(path).endswith(".csv")
+    assert cache.get(f"{url}/a.csv")["last_modified"]
+    # Revalidated with 304 so same file is returned
+    assert downloader.download_file(f"{url}/a.csv") == path
+    # Content addressed so same content is stored once
+    assert downloader.download_file(f"{url}/b.csv") == path
+    assert cache.get_size() == 8
+    (folder / "a.csv").write_text("a,b\n5,6\n")
+    utime(folder / "a.csv", (2000000000, 2000000000))
+    new_path = downloader.download_file(f"{url}/a.csv")
+    assert new_path != path
+    with open(new_path) as file:
+        assert file.read() == "a,b\n5,6\n"
+    # Files used in this process aren't evicted
+    downloader.download_file(f"{url}/c.csv")
+    assert cache.get_size() == 24
+    # but are in later processes
+    cache = DownloadCache(str(tmp_path / "cache"), max_size=16)
+    cache.evict()
+    assert cache.get_size() == 16
+    assert cache.get(f"{url}/b.csv") is None
+    headers, iterator = Download(user_agent="test").get_tabular_rows(
+        new_path, dict_form=True
+    )
+    assert list(iterator) == [{"a": "5", "b": "6"}]
+
+
+def test_clone_downloader(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"))
+    rate_limit = {"calls": 2, "period": 1}
+    with CachedDownload(
+        cache, rate_limit=rate_limit, user_agent="test"
+    ) as downloader:
+        clone = clone_downloader(downloader)
+        assert clone.cache is cache
+        assert clone.session is downloader.session
+        assert clone.rate_limit == rate_limit
+        assert clone.setup != clone.normal_setup
+        clone = clone_downloader(
+            CachedDownload(cache, session=downloader.session)
+        )
+        assert clone.rate_limit is None
+        assert clone.setup == clone.normal_setup
+        clone = clone_downloader(
+            Download(session=downloader.session), rate_limit=rate_limit
+        )
+        assert not isinstance(clone, CachedDownload)
+        assert clone.setup != clone.normal_setup
+    assert DEFAULT_RATE_LIMIT == {"calls": 1, "period": 0.1}
@@ -0,0 +1,38 @@
+import sys
+from os.path import exists
+
+from hapi.pipelines.app import export
+
+# Stands in for pg_dump: writes what it was given to the dump file
+_PG_DUMP = (
+    f"{sys.executable} -c "
+    "\"import os, sys; sys.stdout.write(os.environ['PGPASSWORD'] + ' ' + "
+    'sys.argv[-1])"'
+)
+
+
+def test_export_main(monkeypatch, db_uri, tmp_path):
+    monkeypatch.setattr(export, "setup_logging", lambda **kwargs: None)
+    output = tmp_path / "database"
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "hapi-export",
+            "-db",
+            db_uri,
+            "-o",
+            str(output),
+            "-w",
+            "2",
+            "-pd",
+            _PG_DUMP,
+        ],
+    )
+    export.main()
+    # The password is passed in the environment, not on the command line
+    dump = (output / "hapi_db.pg_restore").read_text()
+    assert dump == (
+        "postgres --dbname=postgresql://postgres@localhost:5432/hapitest"
+    )
+    assert exists(output / "csv" / "location_view.csv.gz")
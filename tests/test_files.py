@@ -0,0 +1,11 @@
+from os import listdir
+
+from hapi.pipelines.utilities.files import write_atomically
+
+
+def test_write_atomically(tmp_path):
+    path = tmp_path / "report.json"
+    write_atomically(str(path), "old")
+    write_atomically(str(path), "new")
+    assert path.read_text() == "new"
+    assert listdir(tmp_path) == ["report.json"]
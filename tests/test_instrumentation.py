@@ -0,0 +1,102 @@
+import json
+
+from hapi_schema.db_location import DBLocation
+from hdx.database import Database
+from hdx.utilities.dateparse import parse_date
+
+from hapi.pipelines.app.scheduler import Scheduler
+from hapi.pipelines.utilities.batch_populate import batch_populate
+from hapi.pipelines.utilities.instrumentation import (
+    count_rows_read,
+    instrumentation,
+)
+
+
+def _get_stages(names):
+    return {
+        stage["name"]: stage
+        for stage in instrumentation.get_report()["stages"]
+        if stage["name"] in names
+    }
+
+
+def test_instrumentation(tmp_path):
+    dbpath = str(tmp_path / "test_instrumentation.db")
+    rows = [
+        {
+            "code": code,
+            "name": code,
+            "reference_period_start": parse_date("2020-01-01"),
+        }
+        for code in ("AFG", "BFA", "MLI")
+    ]
+
+    def theme():
+        with instrumentation.stage("test_uploader"):
+            batch_populate(count_rows_read(rows), session, DBLocation)
+
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        instrumentation.instrument_engine(database.get_engine())
+        with instrumentation.stage("test_output", whole_process=True):
+            # Themes run in other threads but count towards test_output
+            scheduler = Scheduler(2)
+            scheduler.add("test_theme", theme)
+            scheduler.run()
+
+    stages = _get_stages(("test_output", "test_uploader"))
+    uploader = stages["test_uploader"]
+    assert uploader["parent"] == "test_output"
+    assert uploader["rows_read"] == 3
+    assert uploader["rows_written"] == 3
+    assert uploader["round_trips"] >= 2  # insert and commit
+    output = stages["test_output"]
+    for counter in ("rows_read", "rows_written", "round_trips"):
+        assert output[counter] == uploader[counter]
+    assert output["wall_time"] >= uploader["wall_time"]
+    assert output["rss"] > 0
+    assert output["peak_rss"] >= output["rss"]
+
+    report_path = tmp_path / "report.json"
+    instrumentation.write_report(str(report_path))
+    report = json.loads(report_path.read_text())
+    assert "test_uploader" in [x["name"] for x in report["stages"]]
+    prometheus_path = tmp_path / "report.prom"
+    instrumentation.write_prometheus(str(prometheus_path))
+    lines = prometheus_path.read_text().splitlines()
+    assert (
+        'hapi_pipelines_stage_rows_written{stage="test_uploader"} 3' in lines
+    )
+    assert "# TYPE hapi_pipelines_stage_peak_rss_bytes gauge" in lines
+    assert (
+        'hapi_pipelines_stage_raised_peak_rss{stage="test_uploader"} 0'
+        in lines
+        or 'hapi_pipelines_stage_raised_peak_rss{stage="test_uploader"} 1'
+        in lines
+    )
+
+
+def test_rss():
+    size = 64 * 1024**2
+    with instrumentation.stage("test_allocate"):
+        data = b"x" * size
+    del data
+    # RSS is not the high water mark of the process so the freed memory is
+    # not counted towards later stages
+    with instrumentation.stage("test_after"):
+        pass
+    # A spike freed within a stage is only seen in the peak
+    with instrumentation.stage("test_spike") as stage:
+        spike_size = stage._start_peak_rss - stage._start_rss + size
+        data = b"x" * spike_size
+        del data
+    stages = _get_stages(("test_allocate", "test_after", "test_spike"))
+    allocate = stages["test_allocate"]
+    after = stages["test_after"]
+    spike = stages["test_spike"]
+    assert allocate["rss_delta"] >= size * 0.9
+    assert after["rss"] <= allocate["rss"] - size * 0.9
+    assert not after["raised_peak_rss"]
+    assert spike["rss_delta"] < size * 0.5
+    assert spike["raised_peak_rss"]
+    assert spike["peak_rss"] >= spike["rss"] + size * 0.9
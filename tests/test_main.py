@@ -34,8 +34,7 @@ from hdx.utilities.useragent import UserAgent
 from pytest_check import check
 from sqlalchemy import func, select
 
-from hapi.pipelines.app import load_yamls
-from hapi.pipelines.app.__main__ import add_defaults
+from hapi.pipelines.app.compiled_config import load_config
 from hapi.pipelines.app.pipelines import Pipelines
 
 logger = logging.getLogger(__name__)
@@ -43,22 +42,9 @@ logger = logging.getLogger(__name__)
 
 class TestHAPIPipelines:
     @pytest.fixture(scope="function")
-    def configuration(self):
+    def configuration(self, tmp_path):
         UserAgent.set_global("test")
-        project_configs = [
-            "core.yaml",
-            "conflict_event.yaml",
-            "food_security.yaml",
-            "funding.yaml",
-            "national_risk.yaml",
-            "operational_presence.yaml",
-            "population.yaml",
-            "poverty_rate.yaml",
-            "refugees.yaml",
-            "wfp.yaml",
-        ]
-        project_config_dict = load_yamls(project_configs)
-        project_config_dict = add_defaults(project_config_dict)
+        project_config_dict = load_config(folder=str(tmp_path))
         Configuration._create(
             hdx_read_only=True,
             hdx_site="prod",
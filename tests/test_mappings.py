@@ -1,4 +1,4 @@
-from hapi.pipelines.utilities.mappings import get_code_from_name
+from hapi.pipelines.utilities.mappings import CodeMatcher, get_code_from_name
 
 
 def test_get_code_from_name():
@@ -101,3 +101,35 @@ def test_get_code_from_name():
         "ccs",
         False,
     )
+
+
+def test_code_matcher():
+    sector_lookup = {"Logistics": "LOG", "Protection": "PRO"}
+    sector_map = {"logistique": "LOG"}
+    matcher = CodeMatcher(sector_lookup, sector_map)
+    assert matcher.get_code("Logistic") == ("LOG", "logistic", True)
+    assert matcher.get_code("Shelter and NFI") == (
+        None,
+        "shelter and nfi",
+        False,
+    )
+    assert matcher.get_code.cache_info().currsize == 2
+    matcher.get_code("Logistic")
+    assert matcher.get_code.cache_info().hits == 1
+
+    matcher.add_mapping("logistic", "LOG")
+    assert sector_map["logistic"] == "LOG"
+    assert matcher.get_code("Logistic") == ("LOG", "logistic", False)
+
+    sector_lookup["Shelter and NFI"] = "SHL"
+    matcher.invalidate()
+    assert matcher.get_code("Shelter and NFI") == (
+        "SHL",
+        "Shelter and NFI",
+        False,
+    )
+    assert matcher.get_code("Shelter and NFIs") == (
+        "SHL",
+        "shelter and nfis",
+        True,
+    )
@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from hapi_schema.db_dataset import DBDataset
+from hapi_schema.db_resource import DBResource
+from hdx.database import Database
+from sqlalchemy import select
+
+from hapi.pipelines.database.metadata import Metadata
+from hapi.pipelines.utilities.batch_populate import set_incremental
+
+
+def _get_dataset(dataset_id, resource_ids):
+    return {
+        "hdx_stub": f"stub-{dataset_id}",
+        "title": f"Title {dataset_id}",
+        "hdx_provider_stub": "provider",
+        "hdx_provider_name": "Provider",
+        "resources": {
+            resource_id: {
+                "name": f"Resource {resource_id}",
+                "format": "csv",
+                "update_date": datetime(2024, 1, 1, tzinfo=timezone.utc),
+                "is_hxl": True,
+                "download_url": f"https://test/{resource_id}.csv",
+            }
+            for resource_id in resource_ids
+        },
+    }
+
+
+def test_metadata(tmp_path):
+    dbpath = str(tmp_path / "test_metadata.db")
+    today = datetime(2024, 6, 1)
+    runner = SimpleNamespace(
+        get_hapi_metadata=lambda: {
+            "d1": _get_dataset("d1", ["r1", "r2"]),
+            "d2": _get_dataset("d2", ["r3"]),
+        }
+    )
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        metadata = Metadata(runner, session, today)
+        metadata.populate()
+        assert metadata.dataset_data == ["d1", "d2"]
+        assert session.query(DBDataset).count() == 2
+        assert session.query(DBResource).count() == 3
+
+        metadata.add_hapi_metadata(
+            {
+                "hdx_id": "d3",
+                "hdx_stub": "stub-d3",
+                "title": "Title d3",
+                "hdx_provider_stub": "provider",
+                "hdx_provider_name": "Provider",
+            },
+            {
+                "hdx_id": "r4",
+                "name": "Resource r4",
+                "format": "csv",
+                "update_date": datetime(2024, 2, 1),
+                "download_url": "https://test/r4.csv",
+            },
+        )
+        # Not committed until the rows referencing it are committed
+        session.rollback()
+        assert session.query(DBResource).count() == 3
+
+        set_incremental(session)
+        runner.get_hapi_metadata = lambda: {
+            "d1": _get_dataset("d1", ["r1", "r2"]),
+            "d2": _get_dataset("d2", ["r3", "r5"]),
+        }
+        metadata = Metadata(runner, session, today)
+        metadata.populate()
+        results = session.execute(
+            select(DBResource.hdx_id, DBResource.dataset_hdx_id).order_by(
+                DBResource.hdx_id
+            )
+        )
+        assert [tuple(result) for result in results] == [
+            ("r1", "d1"),
+            ("r2", "d1"),
+            ("r3", "d2"),
+            ("r5", "d2"),
+        ]
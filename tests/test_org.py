@@ -0,0 +1,47 @@
+from hapi.pipelines.database.org import Org
+
+
+def test_get_org_info():
+    def row(name, pattern, acronym, country, org_type="433"):
+        return {
+            "#org+name": name,
+            "#x_pattern": pattern,
+            "#org+acronym": acronym,
+            "#country+code": country,
+            "#org+type+code": org_type,
+        }
+
+    org = Org(session=None, datasetinfo={})
+    unicef = row("United Nations Children's Fund", "UNICEF", "UNICEF", None)
+    acf_afg = row("Action Contre la Faim", "ACF-AFG", "ACF", "AFG")
+    acf_mli = row("Action Contre la Faim Mali", "acf mali", "ACF", "MLI")
+    org._org_map = {
+        "UNICEF": unicef,
+        "United Nations Children's Fund": unicef,
+        "ACF-AFG": acf_afg,
+        "acf mali": acf_mli,
+        "ACF MALI": acf_afg,
+    }
+    org._build_clean_index()
+
+    assert org.get_org_info("UNICEF", "NGA") == {
+        "#org+name": "United Nations Children's Fund",
+        "#org+acronym": "UNICEF",
+        "#org+type+code": "433",
+    }
+    assert org.get_org_info("unicef", "NGA")["#org+acronym"] == "UNICEF"
+    assert org.get_org_info("ACF-AFG", "AFG")["#org+name"] == (
+        "Action Contre la Faim"
+    )
+    # Exact match for another country is not used
+    assert org.get_org_info("ACF-AFG", "MLI") == {"#org+name": "ACF-AFG"}
+    # Cleaned names clash: the later mapping wins within a country
+    assert org.get_org_info("Acf Mali", "MLI")["#org+name"] == (
+        "Action Contre la Faim Mali"
+    )
+    assert org.get_org_info("Acf Mali", "AFG")["#org+name"] == (
+        "Action Contre la Faim"
+    )
+    assert org.get_org_info("Unknown Org", "AFG") == {
+        "#org+name": "Unknown Org"
+    }
@@ -0,0 +1,63 @@
+import hashlib
+import json
+
+import pyarrow.parquet as pq
+from hapi_schema.db_location import DBLocation
+from hapi_schema.views import prepare_hapi_views
+from hdx.database import Database
+from hdx.utilities.dateparse import parse_date
+
+from hapi.pipelines.utilities.batch_populate import batch_populate
+from hapi.pipelines.utilities.parquet_export import (
+    ParquetExport,
+    get_file_hash,
+)
+
+
+def test_get_file_hash(tmp_path):
+    path = tmp_path / "test.csv"
+    path.write_bytes(b"a,b\n1,2\n")
+    assert get_file_hash(str(path), chunk_size=3) == (
+        hashlib.md5(b"a,b\n1,2\n").hexdigest()
+    )
+
+
+def test_parquet_export(tmp_path):
+    dbpath = str(tmp_path / "test_parquet_export.db")
+    folder = tmp_path / "parquet"
+    with Database(
+        dialect="sqlite", database=dbpath, prepare_fn=prepare_hapi_views
+    ) as database:
+        session = database.get_session()
+        rows = [
+            {
+                "code": code,
+                "name": code,
+                "reference_period_start": parse_date("2020-01-01"),
+            }
+            for code in ("AFG", "BFA", "MLI")
+        ]
+        batch_populate(rows, session, DBLocation)
+        session.close()
+        parquet_export = ParquetExport(
+            database.get_engine(), str(folder), workers=2, row_group_size=2
+        )
+        names = parquet_export.get_names()
+        assert names["location"] == "table"
+        assert names["location_view"] == "view"
+        manifest = parquet_export.export(("location", "location_view", "org"))
+
+    assert manifest["location"]["rows"] == 3
+    assert manifest["location"]["row_groups"] == 2
+    assert manifest["location_view"]["kind"] == "view"
+    assert manifest["org"]["rows"] == 0
+    with open(folder / "manifest.json") as file:
+        assert json.load(file) == manifest
+    path = folder / "location.parquet"
+    assert manifest["location"]["md5"] == get_file_hash(str(path))
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.metadata.num_row_groups == 2
+    statistics = parquet_file.metadata.row_group(0).column(1).statistics
+    assert statistics.has_min_max
+    table = pq.read_table(folder / "location_view.parquet")
+    assert table.column("code").to_pylist() == ["AFG", "BFA", "MLI"]
@@ -0,0 +1,74 @@
+from unittest.mock import MagicMock
+
+from hdx.location.adminlevel import AdminLevel
+from hdx.utilities.dateparse import parse_date
+
+from hapi.pipelines.app import pipelines
+from hapi.pipelines.app.pipelines import Pipelines
+
+
+def _get_references(themes_to_run):
+    # Only get_references is tested so avoid setting up the pipelines
+    pipelines = Pipelines.__new__(Pipelines)
+    pipelines.themes_to_run = themes_to_run
+    return pipelines.get_references()
+
+
+def test_get_references():
+    assert _get_references({"funding": None, "refugees": None}) == set()
+    assert _get_references({"humanitarian_needs": None}) == {
+        "admins",
+        "sector",
+    }
+    assert _get_references({"food_prices": None, "funding": ("AFG",)}) == {
+        "admins",
+        "currency",
+    }
+    assert _get_references(None) == {
+        "admins",
+        "org",
+        "org_type",
+        "sector",
+        "currency",
+    }
+
+
+def test_pipelines_references(monkeypatch):
+    constructors = {}
+    for name in (
+        "Admins",
+        "Org",
+        "OrgType",
+        "Sector",
+        "Currency",
+        "Locations",
+        "Runner",
+        "Metadata",
+        "ResourceUpdates",
+    ):
+        constructors[name] = MagicMock()
+        monkeypatch.setattr(pipelines, name, constructors[name])
+    get_libhxl_dataset = MagicMock()
+    monkeypatch.setattr(AdminLevel, "get_libhxl_dataset", get_libhxl_dataset)
+    monkeypatch.setattr(Pipelines, "create_configurable_scrapers", MagicMock())
+    configuration = {
+        "reference_snapshot_max_age": 1,
+        "HAPI_countries": ["AFG"],
+        "country_name_overrides": {},
+        "country_name_mappings": {},
+    }
+    funding = Pipelines(
+        configuration,
+        MagicMock(),
+        parse_date("2024-01-01"),
+        themes_to_run={"funding": None},
+        use_live=False,
+    )
+    assert funding.references == set()
+    for name in ("Admins", "Org", "OrgType", "Sector", "Currency"):
+        constructors[name].assert_not_called()
+    get_libhxl_dataset.assert_not_called()
+    assert funding.admins is None
+    assert funding.org is None
+    assert funding.currency is None
+    constructors["Locations"].assert_called_once()
@@ -0,0 +1,75 @@
+from datetime import timedelta
+from os import listdir
+
+import hxl
+from hdx.location.adminlevel import AdminLevel
+
+from hapi.pipelines.utilities.reference_snapshot import ReferenceSnapshot
+
+_CONFIGURATION = {
+    "HAPI_countries": ["AFG"],
+    "country_name_overrides": {},
+    "country_name_mappings": {},
+    "admin1": {"admin_name_mappings": {"AFG|Kabol": "AF01"}},
+    "admin2": {},
+}
+
+
+def _get_reference_data():
+    libhxl_dataset = hxl.data(
+        [
+            ["Country", "Level", "Code", "Name", "Parent"],
+            [
+                "#country+code",
+                "#geo+admin_level",
+                "#adm+code",
+                "#adm+name",
+                "#adm+code+parent",
+            ],
+            ["AFG", "1", "AF01", "Kabul", "AFG"],
+            ["AFG", "2", "AF0101", "Kabul", "AF01"],
+        ]
+    ).cache()
+    adminone = AdminLevel(admin_config=_CONFIGURATION["admin1"], admin_level=1)
+    adminone.setup_from_libhxl_dataset(libhxl_dataset, ["AFG"])
+    admintwo = AdminLevel(admin_level=2)
+    admintwo.setup_from_libhxl_dataset(libhxl_dataset, ["AFG"])
+    admintwo.set_parent_admins_from_adminlevels([adminone])
+    return {
+        "countriesdata": {"countries": {"AFG": {}}},
+        "libhxl_dataset": libhxl_dataset,
+        "adminone": adminone,
+        "admintwo": admintwo,
+    }
+
+
+def test_reference_snapshot(tmp_path):
+    folder = str(tmp_path)
+    snapshot = ReferenceSnapshot(_CONFIGURATION, folder)
+    assert snapshot.load() is None
+    snapshot.save(_get_reference_data())
+
+    reference_data = ReferenceSnapshot(_CONFIGURATION, folder).load()
+    assert reference_data["countriesdata"] == {"countries": {"AFG": {}}}
+    assert [
+        row.get("#adm+code") for row in reference_data["libhxl_dataset"]
+    ] == ["AF01", "AF0101"]
+    adminone = reference_data["adminone"]
+    assert adminone.get_pcode("AFG", "Kabol") == ("AF01", True)
+    admintwo = reference_data["admintwo"]
+    assert admintwo.pcode_to_parent == {"AF0101": "AF01"}
+    assert admintwo.parent_admins == [["AF01"]]
+
+    # Snapshot is rebuilt when it is too old
+    old_snapshot = ReferenceSnapshot(
+        _CONFIGURATION, folder, max_age=timedelta(seconds=-1)
+    )
+    assert old_snapshot.load() is None
+
+    # Snapshot is keyed by its sources and replaces snapshots of other sources
+    configuration = dict(_CONFIGURATION, HAPI_countries=["AFG", "BFA"])
+    new_snapshot = ReferenceSnapshot(configuration, folder)
+    assert new_snapshot.key != snapshot.key
+    assert new_snapshot.load() is None
+    new_snapshot.save(_get_reference_data())
+    assert listdir(folder) == [f"reference-{new_snapshot.key}.pickle"]
@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+
+from hapi_schema.db_dataset import DBDataset
+from hapi_schema.db_resource import DBResource
+from hdx.database import Database
+
+from hapi.pipelines.utilities.batch_populate import set_incremental
+from hapi.pipelines.utilities.resource_updates import ResourceUpdates
+
+
+def test_resource_updates(tmp_path):
+    dbpath = str(tmp_path / "test_resource_updates.db")
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        session.add(
+            DBDataset(
+                hdx_id="d1",
+                hdx_stub="dataset-1",
+                title="Dataset 1",
+                hdx_provider_stub="provider",
+                hdx_provider_name="Provider",
+            )
+        )
+        session.add(
+            DBResource(
+                hdx_id="r1",
+                dataset_hdx_id="d1",
+                name="Resource 1",
+                format="csv",
+                update_date=datetime(2024, 5, 1, 10, 0),
+                is_hxl=True,
+                download_url="https://data.humdata.org/r1.csv",
+                hapi_updated_date=datetime(2024, 5, 2),
+            )
+        )
+        session.commit()
+        metadata = {
+            "hdx_id": "r1",
+            "update_date": datetime(2024, 5, 1, 10, 0, tzinfo=timezone.utc),
+            "download_url": "https://data.humdata.org/r1.csv",
+        }
+        assert ResourceUpdates(session).is_unchanged(metadata) is False
+
+        set_incremental(session)
+        resource_updates = ResourceUpdates(session)
+        assert resource_updates.is_unchanged(metadata) is True
+        metadata["update_date"] = datetime(2024, 6, 1, tzinfo=timezone.utc)
+        assert resource_updates.is_unchanged(metadata) is False
+        metadata["hdx_id"] = "r2"
+        assert resource_updates.is_unchanged(metadata) is False
+        assert resource_updates.is_unchanged(None) is False
+        assert resource_updates.unchanged_resources == {"r1"}
+
+        session.add(
+            DBResource(
+                hdx_id="r3",
+                dataset_hdx_id="d1",
+                name="Resource 3",
+                format="csv",
+                update_date=datetime(2024, 6, 1),
+                is_hxl=True,
+                download_url="https://data.humdata.org/r3.csv",
+                hapi_updated_date=datetime(2024, 6, 2, 12, 0),
+            )
+        )
+        session.commit()
+        today = datetime(2024, 6, 2, 12, 0, tzinfo=timezone.utc)
+        assert resource_updates.get_current_resources(session, today) == {
+            "r1",
+            "r3",
+        }
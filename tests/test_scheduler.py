@@ -0,0 +1,71 @@
+from threading import Lock
+from time import sleep
+
+import pytest
+
+from hapi.pipelines.app.scheduler import Scheduler
+
+
+def test_scheduler_sequential():
+    order = []
+    scheduler = Scheduler()
+    scheduler.add("reference", lambda: order.append("reference"))
+    scheduler.add("a", lambda: order.append("a"), dependencies=("reference",))
+    scheduler.add("b", lambda: order.append("b"), dependencies=("reference",))
+    scheduler.run()
+    assert order == ["reference", "a", "b"]
+    path, _ = scheduler.get_critical_path()
+    assert path[0] == "reference"
+    with pytest.raises(ValueError):
+        scheduler.add("c", lambda: None, dependencies=("d",))
+
+
+def test_scheduler_concurrent():
+    lock = Lock()
+    active = []
+    max_active = {"shared": 0, "all": 0}
+
+    def theme(name, duration):
+        def run():
+            with lock:
+                active.append(name)
+                max_active["all"] = max(max_active["all"], len(active))
+                shared = len([x for x in active if x in ("c", "d")])
+                max_active["shared"] = max(max_active["shared"], shared)
+            sleep(duration)
+            with lock:
+                active.remove(name)
+
+        return run
+
+    scheduler = Scheduler(workers=4)
+    scheduler.add("reference", theme("reference", 0.01))
+    scheduler.add("a", theme("a", 0.05), dependencies=("reference",))
+    scheduler.add("b", theme("b", 0.2), dependencies=("reference",))
+    for name in ("c", "d"):
+        scheduler.add(
+            name,
+            theme(name, 0.05),
+            dependencies=("reference",),
+            resources=("reader",),
+        )
+    scheduler.run()
+    assert max_active["all"] == 3
+    assert max_active["shared"] == 1
+    path, duration = scheduler.get_critical_path()
+    assert path == ["reference", "b"]
+    assert duration >= 0.21
+
+
+def test_scheduler_failure():
+    ran = []
+
+    def fail():
+        raise RuntimeError("Failed!")
+
+    scheduler = Scheduler()
+    scheduler.add("reference", fail)
+    scheduler.add("a", lambda: ran.append("a"), dependencies=("reference",))
+    with pytest.raises(RuntimeError):
+        scheduler.run()
+    assert ran == []
@@ -0,0 +1,136 @@
+import os
+
+import pytest
+from hapi_schema.db_currency import DBCurrency
+from hdx.database import Database
+from hdx.scraper.base_scraper import BaseScraper
+from hdx.scraper.runner import Runner
+from hdx.utilities.dateparse import parse_date
+from sqlalchemy import select
+
+from hapi.pipelines.app import sharding
+from hapi.pipelines.app.pipelines import Pipelines
+from hapi.pipelines.app.sharding import (
+    can_fork,
+    get_country,
+    get_shards,
+    run_sharded,
+)
+from hapi.pipelines.utilities.batch_populate import batch_populate
+
+_COUNTRIES = ("AFG", "BFA", "MLI", "NGA")
+
+
+class _TestScraper(BaseScraper):
+    def __init__(self, name):
+        super().__init__(
+            name,
+            {"hapi_dataset_metadata": {"hdx_id": name}},
+            {"national": (("Process",), ("#process",))},
+            source_configuration={"no_sources": True},
+        )
+
+    def run(self):
+        # Record the process that ran the scraper
+        self.get_values("national")[0]["value"] = os.getpid()
+
+
+def test_get_shards():
+    assert get_country("population_afg_national", _COUNTRIES) == "AFG"
+    assert get_country("national_risk", _COUNTRIES) is None
+    names = [
+        "population_afg_national",
+        "population_afg_adminone",
+        "population_afg_admintwo",
+        "population_bfa_national",
+        "population_mli_national",
+        "population_mli_adminone",
+        "national_risk",
+    ]
+    assert get_shards(names, _COUNTRIES, 2) == [
+        [
+            "population_afg_national",
+            "population_afg_adminone",
+            "population_afg_admintwo",
+            "national_risk",
+        ],
+        [
+            "population_mli_national",
+            "population_mli_adminone",
+            "population_bfa_national",
+        ],
+    ]
+    assert len(get_shards(names[:1], _COUNTRIES, 4)) == 1
+
+
+@pytest.mark.skipif(not can_fork(), reason="Workers cannot be forked")
+def test_run_sharded():
+    runner = Runner(_COUNTRIES, today=parse_date("2024-06-01"))
+    names = [f"population_{x.lower()}_national" for x in _COUNTRIES]
+    for name in names:
+        runner.add_custom(_TestScraper(name))
+    run_sharded(runner, names, _COUNTRIES, 2)
+    pids = set()
+    for name in names:
+        scraper = runner.get_scraper(name)
+        assert scraper.has_run is True
+        pids.add(scraper.get_values("national")[0]["value"])
+    # The pool may give both shards to the same worker, but the scrapers
+    # must have run in workers rather than in the main process
+    assert 1 <= len(pids) <= 2
+    assert os.getpid() not in pids
+
+
+def test_run_sharded_without_fork(monkeypatch):
+    monkeypatch.setattr(sharding, "can_fork", lambda: False)
+    runner = Runner(_COUNTRIES, today=parse_date("2024-06-01"))
+    names = [f"population_{x.lower()}_national" for x in _COUNTRIES]
+    for name in names:
+        runner.add_custom(_TestScraper(name))
+    run_sharded(runner, names, _COUNTRIES, 2)
+    for name in names:
+        scraper = runner.get_scraper(name)
+        assert scraper.has_run is True
+        assert scraper.get_values("national")[0]["value"] == os.getpid()
+
+
+@pytest.mark.skipif(not can_fork(), reason="Workers cannot be forked")
+def test_transform_sharded(tmp_path):
+    dbpath = str(tmp_path / "test_transform_sharded.db")
+    with Database(dialect="sqlite", database=dbpath) as database:
+        # Only the sharded transformation is tested so avoid setting up the
+        # pipelines
+        pipelines = Pipelines.__new__(Pipelines)
+        pipelines.session = database.get_session()
+        pipelines.runner = Runner(_COUNTRIES, today=parse_date("2024-06-01"))
+        pipelines.configuration = {"HAPI_countries": _COUNTRIES}
+        pipelines.themes_to_run = {"funding": None}
+        pipelines.shard_workers = 2
+        pipelines.configurable_scrapers = {
+            "funding": [f"funding_{x.lower()}_national" for x in _COUNTRIES]
+        }
+
+        def output_funding():
+            # Record the process that transformed each row
+            rows = [
+                dict(code=name.split("_")[1].upper(), name=str(os.getpid()))
+                for name in pipelines.configurable_scrapers["funding"]
+            ]
+            with pipelines.get_theme_session() as session:
+                batch_populate(rows, session, DBCurrency)
+
+        pipelines.output_funding = output_funding
+        pipelines.transform_sharded()
+        # Nothing is written until the theme is output
+        assert pipelines.session.query(DBCurrency).count() == 0
+        assert len(pipelines.transformed_rows["funding"]["currency"]) == 4
+        pipelines.output_theme("funding")
+        assert pipelines.transformed_rows == {}
+        results = pipelines.session.execute(
+            select(DBCurrency.code, DBCurrency.name).order_by(DBCurrency.code)
+        )
+        results = [tuple(result) for result in results]
+        assert [code for code, _ in results] == sorted(_COUNTRIES)
+        pids = {int(pid) for _, pid in results}
+        assert 1 <= len(pids) <= 2
+        assert os.getpid() not in pids
@@ -0,0 +1,103 @@
+import csv
+from datetime import datetime
+
+import pyarrow.parquet as pq
+from hapi_schema.db_location import DBLocation
+from hdx.database import Database
+from hdx.utilities.dateparse import parse_date
+from sqlalchemy import func, select
+
+from hapi.pipelines.utilities.batch_populate import batch_populate, set_sink
+from hapi.pipelines.utilities.instrumentation import instrumentation
+from hapi.pipelines.utilities.sinks import (
+    DatabaseSink,
+    FileSink,
+    NullSink,
+    populate_with_ids,
+)
+
+
+def _get_rows(codes):
+    return [
+        {
+            "code": code,
+            "name": code,
+            "reference_period_start": parse_date("2020-01-01"),
+        }
+        for code in codes
+    ]
+
+
+def _populate(session):
+    with instrumentation.stage("test_sinks_output"):
+        with instrumentation.stage("test_sinks_theme"):
+            ids = populate_with_ids(
+                _get_rows(("AFG", "BFA", "MLI")), session, DBLocation, 2
+            )
+            batch_populate(_get_rows(("NGA",)), session, DBLocation)
+    return ids
+
+
+def test_null_sink(tmp_path):
+    dbpath = str(tmp_path / "test_null_sink.db")
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        sink = NullSink()
+        set_sink(session, sink)
+        ids = _populate(session)
+        assert ids == {"AFG": 1, "BFA": 2, "MLI": 3}
+        assert session.scalar(select(func.count(DBLocation.id))) == 0
+    assert sink.get_summary() == {"test_sinks_theme": {"location": 4}}
+
+
+def test_database_sink(tmp_path):
+    dbpath = str(tmp_path / "test_database_sink.db")
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        sink = DatabaseSink()
+        set_sink(session, sink)
+        ids = _populate(session)
+        assert ids == {"AFG": 1, "BFA": 2, "MLI": 3}
+        assert session.scalar(select(func.count(DBLocation.id))) == 4
+    assert sink.get_summary() == {"test_sinks_theme": {"location": 4}}
+
+
+def test_file_sink(tmp_path):
+    dbpath = str(tmp_path / "test_file_sink.db")
+    folder = tmp_path / "tables"
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        sink = FileSink(str(folder))
+        set_sink(session, sink)
+        _populate(session)
+        sink.close()
+        assert session.scalar(select(func.count(DBLocation.id))) == 0
+    with open(folder / "location.csv", newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert [(row["id"], row["code"]) for row in rows] == [
+        ("1", "AFG"),
+        ("2", "BFA"),
+        ("3", "MLI"),
+        ("", "NGA"),
+    ]
+    assert rows[0]["reference_period_start"] == "2020-01-01 00:00:00"
+
+
+def test_file_sink_parquet(tmp_path):
+    dbpath = str(tmp_path / "test_file_sink_parquet.db")
+    folder = tmp_path / "tables"
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        sink = FileSink(str(folder), "parquet")
+        set_sink(session, sink)
+        _populate(session)
+        sink.close()
+        assert session.scalar(select(func.count(DBLocation.id))) == 0
+    table = pq.read_table(folder / "location.parquet")
+    assert table.column("id").to_pylist() == [1, 2, 3, None]
+    assert table.column("code").to_pylist() == ["AFG", "BFA", "MLI", "NGA"]
+    # Database defaults are not applied
+    assert table.column("from_cods").to_pylist() == [None] * 4
+    assert table.column("reference_period_start").to_pylist()[0] == (
+        datetime(2020, 1, 1)
+    )
@@ -0,0 +1,111 @@
+import pytest
+from hapi_schema.db_location import DBLocation
+from hdx.database import Database
+from hdx.utilities.dateparse import parse_date
+from sqlalchemy import Column, Integer, MetaData, String, Table, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from hapi.pipelines.utilities.batch_populate import batch_populate
+from hapi.pipelines.utilities.instrumentation import instrumentation
+from hapi.pipelines.utilities.sql_profiler import SQLProfiler
+
+
+def test_sql_profiler(tmp_path):
+    dbpath = str(tmp_path / "test_sql_profiler.db")
+    rows = [
+        {
+            "code": code,
+            "name": code,
+            "reference_period_start": parse_date("2020-01-01"),
+        }
+        for code in ("AFG", "BFA", "MLI")
+    ]
+
+    sql_profiler = SQLProfiler(slowest=2)
+    with Database(dialect="sqlite", database=dbpath) as database:
+        session = database.get_session()
+        sql_profiler.attach(database.get_engine())
+        with instrumentation.stage("test_profile_output"):
+            with instrumentation.stage("test_profile_theme"):
+                with instrumentation.stage("test_profile_uploader"):
+                    batch_populate(rows, session, DBLocation)
+                    session.add(
+                        DBLocation(
+                            code="NGA",
+                            name="NGA",
+                            reference_period_start=parse_date("2020-01-01"),
+                        )
+                    )
+                    session.commit()
+                    # Failed statements are not profiled
+                    with pytest.raises(OperationalError):
+                        session.execute(text("SELECT * FROM missing"))
+                    session.rollback()
+        sql_profiler.detach()
+        # Flushes after detaching are not profiled
+        with instrumentation.stage("test_profile_output"):
+            with instrumentation.stage("test_profile_theme"):
+                with instrumentation.stage("test_profile_uploader"):
+                    session.add(
+                        DBLocation(
+                            code="SDN",
+                            name="SDN",
+                            reference_period_start=parse_date("2020-01-01"),
+                        )
+                    )
+                    session.commit()
+        session.close()
+
+    summary = sql_profiler.get_summary()
+    profile = summary["test_profile_theme"]["test_profile_uploader"]
+    assert profile["statements"] >= 2
+    assert profile["parameter_sets"] >= 4
+    assert profile["commits"] == 2
+    assert profile["flushes"] == 1
+    assert profile["round_trips"] == profile["statements"] + 2
+    assert len(profile["slowest"]) == 2
+    durations = [x["duration"] for x in profile["slowest"]]
+    assert durations == sorted(durations, reverse=True)
+    assert profile["slowest"][0]["statement"].startswith("INSERT INTO")
+    sql_profiler.log_summary()
+
+
+def test_sql_profiler_copy(engine):
+    table = Table(
+        "profile_copy_test",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("name", String),
+    )
+    table.create(engine)
+    rows = [{"id": i, "name": f"name{i}"} for i in range(1500)]
+    sql_profiler = SQLProfiler()
+    try:
+        with Session(bind=engine) as session:
+            sql_profiler.attach(engine)
+            with instrumentation.stage("test_copy_output"):
+                with instrumentation.stage("test_copy_theme"):
+                    with instrumentation.stage("test_copy_uploader"):
+                        batch_populate(rows[:1000], session, table)
+            sql_profiler.detach()
+            # COPYs after detaching are not profiled
+            with instrumentation.stage("test_copy_output"):
+                with instrumentation.stage("test_copy_theme"):
+                    with instrumentation.stage("test_copy_uploader"):
+                        batch_populate(rows[1000:], session, table)
+    finally:
+        table.drop(engine)
+
+    summary = sql_profiler.get_summary()
+    profile = summary["test_copy_theme"]["test_copy_uploader"]
+    assert profile["copies"] == 1
+    assert profile["parameter_sets"] == 1000
+    assert profile["statement_time"] > 0
+    copies = [
+        x
+        for x in profile["slowest"]
+        if x["statement"] == "COPY profile_copy_test"
+    ]
+    assert len(copies) == 1
+    assert copies[0]["parameter_sets"] == 1000
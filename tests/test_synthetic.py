@@ -0,0 +1,119 @@
+import csv
+
+from hdx.utilities.dateparse import parse_date
+
+from hapi.pipelines.utilities.synthetic import (
+    scale_csv,
+    scale_results,
+    shift_years,
+)
+
+
+def test_shift_years():
+    assert shift_years(parse_date("2024-02-29"), 4) == parse_date("2020-02-29")
+    assert shift_years(2021, 8) == 2013
+    assert shift_years("2019-2020", 4) == "2015-2016"
+    assert shift_years("2023-01-15", 4) == "2019-01-15"
+    assert shift_years("March", 4) == "March"
+
+
+def test_scale_results():
+    results = {
+        "conflict": {
+            "hdx_stub": "conflict",
+            "time_period": {
+                "start": parse_date("2022-01-01"),
+                "end": parse_date("2023-12-31"),
+            },
+            "results": {
+                "admintwo": {
+                    "headers": (
+                        ["events", "month", "year"],
+                        [
+                            "#event+num+demonstration",
+                            "#date+month+demonstration",
+                            "#date+year+demonstration",
+                        ],
+                    ),
+                    "values": [
+                        {"AF0101": [1, 2]},
+                        {"AF0101": ["January", "February"]},
+                        {"AF0101": ["2022", "2023"]},
+                    ],
+                    "hapi_resource_metadata": {"hdx_id": "conflict-1"},
+                }
+            },
+        },
+        "3w": {
+            "hdx_stub": "3w",
+            "time_period": {
+                "start": parse_date("2023-01-01"),
+                "end": parse_date("2023-03-31"),
+            },
+            "results": {
+                "adminone": {
+                    "headers": (
+                        ["org", "acronym", "sector"],
+                        ["#org+name", "#org+acronym", "#sector"],
+                    ),
+                    "values": [
+                        {"AF01": ["Org A", "Org B", "Org A"]},
+                        {"AF01": ["OA", "OB", "OA"]},
+                        {"AF01": ["WASH", "Health", "WASH"]},
+                    ],
+                    "hapi_resource_metadata": {"hdx_id": "3w-1"},
+                }
+            },
+        },
+    }
+    scaled = scale_results(results, 3, new_org_rate=1.0)
+    assert len(scaled) == 6
+    assert scaled["conflict"] is results["conflict"]
+
+    conflict = scaled["conflict_synthetic_2"]
+    assert conflict["time_period"]["start"] == parse_date("2014-01-01")
+    values = conflict["results"]["admintwo"]["values"]
+    assert values[0] == {"AF0101": [1, 2]}
+    assert values[1] == {"AF0101": ["January", "February"]}
+    assert values[2] == {"AF0101": ["2014", "2015"]}
+    assert results["conflict"]["results"]["admintwo"]["values"][2] == {
+        "AF0101": ["2022", "2023"]
+    }
+
+    values = scaled["3w_synthetic_1"]["results"]["adminone"]["values"]
+    assert values[0] == {"AF01": ["Org A 1", "Org B 1", "Org A 1"]}
+    assert values[1] == {"AF01": ["OA 1", "OB 1", "OA 1"]}
+    # Duplicate rows within a copy are kept
+    assert values[2] == {"AF01": ["WASH", "Health", "WASH"]}
+
+
+def test_scale_csv(tmp_path):
+    input_path = tmp_path / "prices.csv"
+    input_path.write_text(
+        "date,market,price\n"
+        "#date,#loc+market+name,#value\n"
+        "2021-01-15,Kabul,10\n"
+        "2023-02-15,Kabul,12\n"
+    )
+    output_path = tmp_path / "scaled_prices.csv"
+    assert scale_csv(str(input_path), str(output_path), 2) == 4
+    with open(output_path, newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[2:] == [
+        ["2021-01-15", "Kabul", "10"],
+        ["2023-02-15", "Kabul", "12"],
+        ["2017-01-15", "Kabul", "10"],
+        ["2019-02-15", "Kabul", "12"],
+    ]
+
+    input_path = tmp_path / "hno.csv"
+    input_path.write_text(
+        "Admin 1 PCode,Age Range,In Need\n"
+        "#adm1+code,#age+range,#inneed\n"
+        "ML01,0-17,5\n"
+    )
+    output_path = tmp_path / "scaled_hno.csv"
+    assert scale_csv(str(input_path), str(output_path), 3) == 3
+    with open(output_path, newline="") as file:
+        rows = list(csv.reader(file))
+    assert [row[1] for row in rows[2:]] == ["0-17", "0-17_1", "0-17_2"]